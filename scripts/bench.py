@@ -0,0 +1,949 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------------#
+# BENCH - Benchmark reproducible del pipeline RAG sin Ollama
+# -------------------------------------------------------------------------#
+
+"""
+Benchmark del pipeline de D&D 5E con modelos falsos deterministas
+
+Sustituye OllamaEmbeddings y OllamaLLM por implementaciones locales con
+latencia configurable y mide cada etapa sobre el corpus real de data/markdown:
+
+• División en páginas y chunking (secuencial y en paralelo)
+• Estabilidad de los chunks ante erratas (splitter recursivo frente a CDC): chunks intactos y re-embeddings
+• Throughput de embeddings y de escrituras en Chroma / índice léxico
+• Latencia de recuperación (vectorial, híbrida, con enrutado y con MMR): p50 / p95 / p99
+• Coste aislado de la selección MMR y redundancia del top-k (coseno medio entre chunks)
+• Construcción de contexto y tokens del contexto (directo frente a empaquetado)
+• Flujos completos de consulta normal y de descomposición
+• Índice vectorial mmap (int8 / float16): apertura, latencia y recall frente a float32
+• Almacén de páginas (mmap): lectura por página y recuperación padre-hijo (página / texto vecino)
+• Índice de encabezados: atajos por sección (sin embedding) y latencia frente a la búsqueda híbrida
+• Índice de monstruos: bloques extraídos por libro, búsquedas y filtros (µs) y recuperación con inyección
+• Cliente de Ollama contra un servidor sustituto: calentamiento y pool de conexiones
+• Arranque en frío: tiempo de importación (`-X importtime`) frente a un presupuesto
+
+Los resultados se guardan en JSON para comparar ejecuciones (--compare).
+
+Uso:
+    python scripts/bench.py [--max-files N] [--repeat N] [--output ruta.json]
+    python scripts/bench.py --compare storage/benchmarks/bench_anterior.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import hashlib
+import random
+import platform
+import tempfile
+import subprocess
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterator, Callable, Tuple
+
+import numpy as np
+
+# Añadir el directorio src al path para importar módulos
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+# Consultas representativas (reglas, conjuros, monstruos, objetos)
+BENCH_QUERIES = [
+    "¿Cómo funciona la ventaja y la desventaja?",
+    "¿Qué hace el conjuro bola de fuego?",
+    "Clase de armadura de un dragón rojo adulto",
+    "¿Cuántos puntos de golpe tiene un goblin?",
+    "¿Cómo se calcula la tirada de salvación de conjuros?",
+    "Reglas de descanso corto y descanso largo",
+    "¿Qué es el estado apresado?",
+    "¿Cómo funciona el ataque de oportunidad?",
+    "Rasgos raciales de los enanos",
+    "¿Qué hace la acción de esquivar?",
+    "Objetos mágicos poco comunes",
+    "¿Cómo se sube de nivel un personaje?",
+    "Reglas de cobertura en combate",
+    "¿Qué es un lich y cuál es su desafío?",
+    "Tabla de encuentros aleatorios",
+    "¿Cómo funciona la concentración en los conjuros?",
+]
+
+# Presupuesto de arranque en frío por módulo (importación acumulada, ms)
+IMPORT_BUDGETS_MS = {
+    "config": 20,
+    "vector_pipeline": 500,
+    "query_engine": 700,
+    "api_server": 700,
+}
+
+# Dependencias pesadas que solo deben cargarse cuando se usan
+HEAVY_MODULES = ("streamlit", "pandas", "langchain_text_splitters", "langchain_chroma",
+                 "chromadb", "langchain_ollama", "ollama")
+
+# -------------------------------------------------------------------------#
+# 1. MODELOS FALSOS DETERMINISTAS
+# -------------------------------------------------------------------------#
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings por hashing de términos (deterministas entre procesos).
+
+    Textos con palabras en común producen vectores parecidos, así que la
+    recuperación devuelve resultados plausibles. La latencia simula el
+    coste de una llamada al servidor: fija por llamada más un coste por texto.
+    """
+
+    def __init__(self, dimensions: int = 1024, latency: float = 0.0, latency_per_text: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        folded = "".join(
+            ch for ch in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(ch)
+        )
+        for token in _TOKEN_RE.findall(folded):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency + self.latency_per_text * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency + self.latency_per_text)
+        return self._vector(text)
+
+class FakeLLM(LLM):
+    """
+    LLM de respuestas fijas con latencia hasta el primer token y por token.
+
+    Reconoce el prompt de descomposición y devuelve una lista numerada de
+    sub-preguntas para que el flujo completo se ejerza de principio a fin.
+    """
+
+    first_token_latency: float = 0.1
+    token_latency: float = 0.005
+    answer_tokens: int = 40
+    sub_questions: int = 3
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    def _response(self, prompt: str) -> List[str]:
+        if "SUBPREGUNTAS:" in prompt:
+            question = prompt.rsplit("PREGUNTA:", 1)[-1].split("SUBPREGUNTAS:", 1)[0].strip()
+            return [f"{i}. {question} (aspecto {i})\n" for i in range(1, self.sub_questions + 1)]
+        return [f"palabra{i} " for i in range(self.answer_tokens)]
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._response(prompt)):
+            if i:
+                time.sleep(self.token_latency)
+            yield GenerationChunk(text=token)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Any = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop))
+
+# -------------------------------------------------------------------------#
+# 2. UTILIDADES DE MEDICIÓN
+# -------------------------------------------------------------------------#
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Resume una lista de latencias (segundos) en milisegundos con percentiles."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+def throughput(items: int, seconds: float, unit: str) -> Dict[str, Any]:
+    """Resultado de una etapa por lotes: elementos, segundos y elementos/s."""
+    return {
+        unit: items,
+        "seconds": round(seconds, 4),
+        f"{unit}_per_second": round(items / seconds, 2) if seconds > 0 else None
+    }
+
+def time_calls(fn: Callable[[str], Any], queries: List[str], repeat: int) -> List[float]:
+    """Ejecuta `fn` sobre cada consulta `repeat` veces y devuelve las latencias."""
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def git_commit() -> Optional[str]:
+    """Commit actual del repositorio (si está disponible)."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+# -------------------------------------------------------------------------#
+# 3. ETAPAS DEL BENCHMARK
+# -------------------------------------------------------------------------#
+
+def bench_ingestion(vp, file_paths: List[str], embeddings: FakeEmbeddings) -> Tuple[Dict[str, Any], Any]:
+    """Mide páginas, chunking, embeddings, escrituras en Chroma e índice léxico."""
+    from config import PARSE_WORKERS, EMBED_BATCH_SIZE, EMBED_WORKERS, INGEST_MAX_PENDING_BATCHES
+
+    results: Dict[str, Any] = {}
+
+    # Páginas lógicas
+    start = time.perf_counter()
+    page_count = sum(len(pages) for _, pages, _ in vp.iter_page_ranges(file_paths))
+    results["page_split"] = {"documents": len(file_paths), **throughput(page_count, time.perf_counter() - start, "pages")}
+
+    # Chunking secuencial y con el pool de procesos
+    start = time.perf_counter()
+    chunks = list(vp.iter_document_chunks(file_paths, workers=1))
+    results["chunking"] = {"workers": 1, **throughput(len(chunks), time.perf_counter() - start, "chunks")}
+
+    if PARSE_WORKERS > 1:
+        start = time.perf_counter()
+        parallel_count = sum(1 for _ in vp.iter_document_chunks(file_paths, workers=PARSE_WORKERS))
+        results["chunking_parallel"] = {
+            "workers": PARSE_WORKERS, **throughput(parallel_count, time.perf_counter() - start, "chunks")
+        }
+
+    # Embeddings (mismo esquema de lotes y pool que la ingestión)
+    print(f"🧠 Embeddings de {len(chunks)} chunks...")
+    batches = list(vp.iter_batches(chunks, EMBED_BATCH_SIZE))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        embedded = list(vp._bounded_map(
+            executor, lambda batch: vp._embed_batch(embeddings, batch), batches,
+            max(EMBED_WORKERS, INGEST_MAX_PENDING_BATCHES)
+        ))
+    results["embedding"] = {
+        "batch_size": EMBED_BATCH_SIZE, "workers": EMBED_WORKERS,
+        **throughput(len(chunks), time.perf_counter() - start, "chunks")
+    }
+
+    # Escrituras en Chroma con los vectores ya calculados
+    print("🗄️ Escrituras en Chroma...")
+    vector_store = vp.load_existing_database()
+    start = time.perf_counter()
+    for batch, vectors in embedded:
+        vector_store._collection.upsert(
+            ids=[doc.metadata["chunk_id"] for doc in batch],
+            embeddings=vectors,
+            metadatas=[doc.metadata for doc in batch],
+            documents=[doc.page_content for doc in batch]
+        )
+    results["chroma_write"] = throughput(len(chunks), time.perf_counter() - start, "chunks")
+
+    # Índice léxico
+    lexical_index = vp.get_lexical_index()
+    start = time.perf_counter()
+    for batch in batches:
+        lexical_index.upsert(batch)
+    results["lexical_index_write"] = throughput(len(chunks), time.perf_counter() - start, "chunks")
+
+    vp.bump_index_generation()
+    vp.build_index_artifacts(vector_store)
+    return results, vector_store
+
+# Párrafo añadido por la errata simulada
+ERRATA_PARAGRAPH = ("Nota de la errata: esta regla se aplica también a las criaturas invocadas "
+                    "y a los compañeros, salvo que su descripción indique lo contrario.")
+
+def _apply_errata(page: str, kind: str, rng: random.Random) -> Optional[str]:
+    """Errata simulada en el primer tercio de la página: párrafo insertado o borrado, o una letra cambiada."""
+    breaks = [m.end() for m in re.finditer(r"\n\s*\n", page) if m.end() < len(page) // 3]
+    if kind == "insert" and breaks:
+        position = rng.choice(breaks)
+        return page[:position] + ERRATA_PARAGRAPH + "\n\n" + page[position:]
+    if kind == "delete" and len(breaks) >= 2:
+        n = rng.randrange(len(breaks) - 1)
+        return page[:breaks[n]] + page[breaks[n + 1]:]
+    if kind == "typo":
+        words = [m for m in re.finditer(r"[a-záéíóúñ]{6,}", page) if m.start() < len(page) // 3]
+        if words:
+            word = rng.choice(words)
+            return page[:word.start() + 1] + word.group(0)[2] + word.group(0)[1] + page[word.start() + 3:]
+    return None
+
+def bench_chunk_stability(vp, file_paths: List[str], max_pages: int = 300) -> Dict[str, Any]:
+    """Aplica erratas a páginas largas y cuenta los chunks (IDs) que se mantienen con cada splitter."""
+    from config import CHUNK_SIZE
+
+    print("✂️ Estabilidad de chunks ante erratas...")
+    pages = [
+        (doc_name, page_number, text)
+        for doc_name, doc_pages in vp.iter_document_pages(file_paths)
+        for page_number, text in enumerate(doc_pages, 1)
+        if len(text) > CHUNK_SIZE * 4
+    ]
+    pages = random.Random(0).sample(pages, min(max_pages, len(pages)))
+
+    results: Dict[str, Any] = {}
+    for chunker in ("recursive", "cdc"):
+        def split(doc_name: str, page_number: int, text: str) -> Dict[str, int]:
+            chunks = vp.split_markdown_pages([text], doc_name, page_number, chunker=chunker)
+            return {doc.metadata["chunk_id"]: len(doc.page_content) for doc in chunks}
+
+        stage: Dict[str, Any] = {}
+        start = time.perf_counter()
+        original = [split(*page) for page in pages]
+        sizes = [size for chunks in original for size in chunks.values()]
+        stage["chunks"] = len(sizes)
+        stage["mean_chars"] = round(float(np.mean(sizes)), 1)
+        stage["chunking_ms_per_page"] = round(1e3 * (time.perf_counter() - start) / max(len(pages), 1), 3)
+
+        for kind in ("insert", "typo", "delete"):
+            rng = random.Random(kind)  # mismas erratas para los dos splitters
+            kept, new_chunks, reembed = [], [], []
+            for (doc_name, page_number, text), before in zip(pages, original):
+                edited = _apply_errata(text, kind, rng)
+                if edited is None:
+                    continue
+                after = split(doc_name, page_number, edited)
+                added = [cid for cid in after if cid not in before]
+                kept.append(len(before.keys() & after.keys()) / max(len(before), 1))
+                new_chunks.append(len(added))
+                reembed.append(sum(after[cid] for cid in added) / max(sum(after.values()), 1))
+            stage[kind] = {
+                "edits": len(kept),
+                "kept_pct": round(100 * float(np.mean(kept)), 1),
+                "new_chunks_per_edit": round(float(np.mean(new_chunks)), 2),
+                "reembed_chars_pct": round(100 * float(np.mean(reembed)), 1)
+            }
+        results[f"chunk_stability_{chunker}"] = stage
+    return results
+
+def bench_queries(vp, vector_store, llm: FakeLLM, queries: List[str],
+                  repeat: int, flow_repeat: int) -> Dict[str, Any]:
+    """Mide recuperación, construcción de contexto y flujos completos de consulta."""
+    from config import (RETRIEVAL_K, HYBRID_FETCH_K, RRF_K, ROUTER_VOCAB_PATH,
+                        ROUTER_MIN_SCORE, ROUTER_MIN_CONFIDENCE, ROUTER_OVERFETCH,
+                        MMR_LAMBDA, MMR_FETCH_K)
+    from retrievers import VectorRetriever, HybridRetriever, mmr_select
+    from query_router import QueryRouter, book_name
+    from config import CONTEXT_MAX_TOKENS
+    from context_packer import estimate_tokens
+    from query_engine import QueryEngine, build_context_and_sources, MODE_NORMAL, MODE_DECOMPOSITION
+
+    results: Dict[str, Any] = {}
+    retrievers = {
+        "vector": VectorRetriever(vector_store=vector_store, k=RETRIEVAL_K),
+        "hybrid": HybridRetriever(
+            vector_store=vector_store, lexical_index=vp.get_lexical_index(),
+            k=RETRIEVAL_K, fetch_k=max(RETRIEVAL_K, HYBRID_FETCH_K), rrf_k=RRF_K
+        ),
+        "hybrid_routed": HybridRetriever(
+            vector_store=vector_store, lexical_index=vp.get_lexical_index(),
+            k=RETRIEVAL_K, fetch_k=max(RETRIEVAL_K, HYBRID_FETCH_K), rrf_k=RRF_K,
+            router=QueryRouter(ROUTER_VOCAB_PATH, min_score=ROUTER_MIN_SCORE,
+                               min_confidence=ROUTER_MIN_CONFIDENCE),
+            route_overfetch=ROUTER_OVERFETCH
+        ),
+        "vector_mmr": VectorRetriever(
+            vector_store=vector_store, k=RETRIEVAL_K,
+            mmr_lambda=MMR_LAMBDA, mmr_fetch_k=max(RETRIEVAL_K, MMR_FETCH_K)
+        ),
+        "hybrid_mmr": HybridRetriever(
+            vector_store=vector_store, lexical_index=vp.get_lexical_index(),
+            k=RETRIEVAL_K, fetch_k=max(RETRIEVAL_K, HYBRID_FETCH_K), rrf_k=RRF_K,
+            mmr_lambda=MMR_LAMBDA, mmr_fetch_k=max(RETRIEVAL_K, MMR_FETCH_K)
+        )
+    }
+
+    print("🔍 Recuperación...")
+    for name, retriever in retrievers.items():
+        retriever.invoke(queries[0])  # calentamiento
+        results[f"retrieval_{name}"] = summarize(time_calls(retriever.invoke, queries, repeat))
+
+    # Segunda etapa aislada: MMR sobre los pools reales de candidatos
+    mmr_retriever = retrievers["hybrid_mmr"]
+    pools = []
+    for query in queries:
+        vector = mmr_retriever.embed_query(query)
+        pools.append((np.asarray(vector, dtype=np.float32), mmr_retriever._candidates(query, vector)))
+    samples = []
+    for _ in range(repeat):
+        for vector, (docs, vectors, relevance) in pools:
+            start = time.perf_counter()
+            mmr_select(vector, vectors, RETRIEVAL_K, MMR_LAMBDA, relevance)
+            samples.append(time.perf_counter() - start)
+
+    def redundancy(vectors: np.ndarray) -> float:
+        # Coseno medio entre pares de chunks elegidos (menor = más diverso)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        unit = vectors / np.where(norms == 0, 1.0, norms)
+        similarity = unit @ unit.T
+        n = len(unit)
+        return float((similarity.sum() - n) / (n * (n - 1))) if n > 1 else 0.0
+
+    topk_redundancy, mmr_redundancy = [], []
+    for vector, (docs, vectors, relevance) in pools:
+        topk_redundancy.append(redundancy(vectors[:RETRIEVAL_K]))
+        mmr_redundancy.append(redundancy(vectors[mmr_select(vector, vectors, RETRIEVAL_K, MMR_LAMBDA, relevance)]))
+    results["mmr_selection"] = {
+        "pool": len(pools[0][1][0]),
+        **summarize(samples),
+        "redundancy_topk": round(float(np.mean(topk_redundancy)), 4),
+        "redundancy_mmr": round(float(np.mean(mmr_redundancy)), 4)
+    }
+
+    # Construcción de contexto sobre los resultados reales de la recuperación
+    retrieved = [retrievers["hybrid"].invoke(query) for query in queries]
+    samples = []
+    for _ in range(repeat):
+        for docs in retrieved:
+            start = time.perf_counter()
+            build_context_and_sources(docs)
+            samples.append(time.perf_counter() - start)
+    results["context_building"] = summarize(samples)
+
+    # Tamaño del contexto: concatenación directa frente a empaquetado con presupuesto
+    raw_tokens = [
+        sum(estimate_tokens(f"[FUENTE: {book_name(d.metadata.get('document_name', ''))}, Página: {d.metadata.get('page_number')}]\n"
+                            f"{d.page_content}\n\n---\n\n") for d in docs)
+        for docs in retrieved
+    ]
+    packed_tokens = [estimate_tokens(build_context_and_sources(docs)[0]) for docs in retrieved]
+    results["context_tokens"] = {
+        "budget": CONTEXT_MAX_TOKENS,
+        "raw_mean": round(float(np.mean(raw_tokens)), 1),
+        "packed_mean": round(float(np.mean(packed_tokens)), 1),
+        "packed_max": max(packed_tokens),
+        "reduction_pct": round(100 * (1 - sum(packed_tokens) / max(sum(raw_tokens), 1)), 1)
+    }
+
+    # Flujos completos (sin cachés para medir el coste real)
+    print("💬 Flujos completos de consulta...")
+    engine = QueryEngine(retriever=retrievers["hybrid"], model=llm, answer_cache=None)
+    for mode in (MODE_NORMAL, MODE_DECOMPOSITION):
+        totals, ttfts = [], []
+        for _ in range(flow_repeat):
+            for query in queries:
+                timings = engine.answer(query, mode).timings
+                totals.append(timings["total"])
+                ttfts.append(timings.get("ttft", timings["total"]))
+        results[f"flow_{mode}"] = {"total": summarize(totals), "ttft": summarize(ttfts)}
+
+    return results
+
+def bench_mmap_index(vp, vector_store, work_dir: Path, queries: List[str], repeat: int) -> Dict[str, Any]:
+    """Mide el backend vectorial mmap (int8 y float16) frente a la búsqueda exacta en float32."""
+    from config import RETRIEVAL_K, EMBEDDINGS_MODEL
+    from mmap_index import build_mmap_index, MmapVectorIndex, SCAN_DTYPES
+    from retrievers import VectorRetriever
+
+    print("🧮 Índice vectorial mmap...")
+    records = list(vp.iter_vector_records(vector_store))
+    matrix = np.asarray([record[3] for record in records], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+    ids = np.asarray([record[0] for record in records])
+
+    # Referencia: top-k exacto por fuerza bruta en float32
+    query_vectors = [np.asarray(vp._embeddings.embed_query(query), dtype=np.float32) for query in queries]
+    exact = [set(ids[np.argsort(-(matrix @ q), kind="stable")[:RETRIEVAL_K]]) for q in query_vectors]
+
+    # Búsqueda aislada (sin embedding de la consulta): Chroma frente a mmap
+    results: Dict[str, Any] = {}
+    search_vectors = {query: vector.tolist() for query, vector in zip(queries, query_vectors)}
+    results["vector_search_chroma"] = summarize(time_calls(
+        lambda query: vector_store._collection.query(
+            query_embeddings=[search_vectors[query]], n_results=RETRIEVAL_K, include=["documents", "metadatas"]
+        ), queries, repeat
+    ))
+    for dtype in SCAN_DTYPES:
+        root = work_dir / f"mmap_{dtype}"
+        start = time.perf_counter()
+        build_mmap_index(records, root, dtype=dtype, embeddings_model=EMBEDDINGS_MODEL)
+        build_seconds = time.perf_counter() - start
+
+        open_samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            index = MmapVectorIndex(root, embeddings=vp._embeddings)
+            open_samples.append(time.perf_counter() - start)
+
+        retriever = VectorRetriever(vector_store=index, k=RETRIEVAL_K)
+        retriever.invoke(queries[0])  # calentamiento
+        recall = [
+            len(exact_ids & {doc.id for doc in index.search(q, RETRIEVAL_K)[0]}) / max(len(exact_ids), 1)
+            for q, exact_ids in zip(query_vectors, exact)
+        ]
+        scan_bytes = sum(f.stat().st_size for f in root.rglob("scan.npy"))
+        results[f"mmap_index_{dtype}"] = {
+            "build_seconds": round(build_seconds, 3),
+            "open_ms": round(1000 * float(np.median(open_samples)), 3),
+            "scan_mb": round(scan_bytes / 1024 ** 2, 2),
+            f"recall@{RETRIEVAL_K}": round(float(np.mean(recall)), 4)
+        }
+        results[f"vector_search_mmap_{dtype}"] = summarize(time_calls(
+            lambda query: index.search(search_vectors[query], RETRIEVAL_K), queries, repeat
+        ))
+        results[f"retrieval_mmap_{dtype}"] = summarize(time_calls(retriever.invoke, queries, repeat))
+
+    return results
+
+def bench_page_store(vp, vector_store, queries: List[str], repeat: int) -> Dict[str, Any]:
+    """Mide el almacén de páginas y la expansión de chunks a páginas o ventanas vecinas."""
+    from config import (RETRIEVAL_K, HYBRID_FETCH_K, RRF_K, PAGE_STORE_PATH,
+                        PARENT_MAX_CHARS, PARENT_WINDOW_CHARS, CONTEXT_MAX_TOKENS)
+    from page_store import PageStore, MODE_PAGE, MODE_NEIGHBORS
+    from retrievers import HybridRetriever
+    from context_packer import estimate_tokens
+
+    print("📚 Almacén de páginas...")
+    start = time.perf_counter()
+    summary = vp.build_page_store()
+    build_seconds = time.perf_counter() - start
+
+    store = PageStore(PAGE_STORE_PATH)
+    keys = store.keys()[:2000]
+    start = time.perf_counter()
+    for key in keys:
+        store.get(*key)
+    results: Dict[str, Any] = {
+        "page_store": {
+            "build_seconds": round(build_seconds, 3),
+            "pages": summary["pages"],
+            "mb": round(summary["bytes"] / 1024 ** 2, 2),
+            "get_us": round(1e6 * (time.perf_counter() - start) / max(len(keys), 1), 2)
+        }
+    }
+
+    base = dict(vector_store=vector_store, lexical_index=vp.get_lexical_index(), k=RETRIEVAL_K,
+                fetch_k=max(RETRIEVAL_K, HYBRID_FETCH_K), rrf_k=RRF_K)
+    chunks = {query: HybridRetriever(**base).invoke(query) for query in queries}
+    for mode in (MODE_PAGE, MODE_NEIGHBORS):
+        retriever = HybridRetriever(**base, page_store=store, parent_mode=mode,
+                                    parent_max_chars=PARENT_MAX_CHARS, parent_window_chars=PARENT_WINDOW_CHARS)
+        results[f"retrieval_hybrid_parent_{mode}"] = summarize(time_calls(retriever.invoke, queries, repeat))
+
+        samples, context_tokens = [], []
+        for query, docs in chunks.items():
+            start = time.perf_counter()
+            expanded = store.expand(docs, mode, PARENT_MAX_CHARS, PARENT_WINDOW_CHARS)
+            samples.append(time.perf_counter() - start)
+            context_tokens.append(sum(estimate_tokens(doc.page_content) for doc in expanded))
+        results[f"parent_expansion_{mode}"] = {
+            "expand_us_p50": round(1e6 * float(np.median(samples)), 2),
+            "context_tokens_mean": round(float(np.mean(context_tokens)), 1),
+            "over_budget_pct": round(100 * float(np.mean([t > CONTEXT_MAX_TOKENS for t in context_tokens])), 1)
+        }
+    results["parent_expansion_off"] = {
+        "context_tokens_mean": round(float(np.mean([
+            sum(estimate_tokens(doc.page_content) for doc in docs) for docs in chunks.values()
+        ])), 1)
+    }
+    return results
+
+def bench_heading_index(vp, vector_store, queries: List[str], repeat: int) -> Dict[str, Any]:
+    """Mide el índice de encabezados: construcción, detección y recuperación con atajo."""
+    from config import RETRIEVAL_K, HYBRID_FETCH_K, RRF_K, HEADING_INDEX_PATH
+    from heading_index import HeadingIndex
+    from retrievers import HybridRetriever
+
+    print("🔖 Índice de encabezados...")
+    start = time.perf_counter()
+    table = vp.build_heading_index(vector_store)
+    build_seconds = time.perf_counter() - start
+
+    index = HeadingIndex(HEADING_INDEX_PATH)
+    matches = {query: index.match(query) for query in queries}
+    shortcut = [query for query, match in matches.items() if match is not None and match.complete]
+    injected = [query for query, match in matches.items() if match is not None and not match.complete]
+
+    start = time.perf_counter()
+    for _ in range(200):
+        for query in queries:
+            index.match(query)
+    match_us = 1e6 * (time.perf_counter() - start) / (200 * len(queries))
+
+    results: Dict[str, Any] = {
+        "heading_index": {
+            "build_seconds": round(build_seconds, 3),
+            "headings": len(table["headings"]),
+            "match_us": round(match_us, 2),
+            "shortcut_queries": f"{len(shortcut)}/{len(queries)}",
+            "injected_queries": f"{len(injected)}/{len(queries)}"
+        }
+    }
+    if not shortcut:
+        return results
+
+    # Mismas consultas con y sin atajo: la diferencia es el embedding y la búsqueda evitados
+    base = dict(vector_store=vector_store, lexical_index=vp.get_lexical_index(), k=RETRIEVAL_K,
+                fetch_k=max(RETRIEVAL_K, HYBRID_FETCH_K), rrf_k=RRF_K)
+    for name, retriever in (("retrieval_hybrid_sections", HybridRetriever(**base)),
+                            ("retrieval_heading_shortcut", HybridRetriever(**base, heading_index=index))):
+        retriever.invoke(shortcut[0])  # calentamiento
+        results[name] = summarize(time_calls(retriever.invoke, shortcut, repeat))
+    return results
+
+# Consultas con nombre de monstruo o filtro para el índice de monstruos
+MONSTER_QUERIES = [
+    "¿Cuál es la CA de un beholder?",
+    "Estadísticas del dragón rojo adulto",
+    "¿Cuántos puntos de golpe tiene un goblin?",
+    "Monstruos de VD 5",
+    "Dragones con desafío mayor que 10",
+    "Lista de muertos vivientes con VD entre 1 y 3",
+]
+
+def bench_monster_index(vp, vector_store, queries: List[str], repeat: int) -> Dict[str, Any]:
+    """Mide la extracción de bloques de estadísticas y las consultas al índice de monstruos."""
+    from config import RETRIEVAL_K, HYBRID_FETCH_K, RRF_K, MONSTER_INDEX_PATH
+    from monster_index import MonsterIndex
+    from retrievers import HybridRetriever
+
+    print("🐲 Índice de monstruos...")
+    start = time.perf_counter()
+    table = vp.build_monster_index()
+    build_seconds = time.perf_counter() - start
+    per_book: Dict[str, int] = {}
+    for row in table["monsters"]:
+        per_book[row["document_name"]] = per_book.get(row["document_name"], 0) + 1
+
+    index = MonsterIndex(MONSTER_INDEX_PATH)
+    results: Dict[str, Any] = {
+        "monster_index_build": {"seconds": round(build_seconds, 3), "monsters": len(table["monsters"]),
+                                "per_book": per_book}
+    }
+
+    def time_us(fn: Callable[[], Any], calls: int = 1000) -> float:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        return round(1e6 * (time.perf_counter() - start) / calls, 2)
+
+    hits = [query for query in queries if index.documents_for(query)]
+    results["monster_lookup_us"] = {
+        "lookup": time_us(lambda: index.lookup("dragón rojo adulto")),
+        "filter": time_us(lambda: index.filter(challenge=(5, 10), creature_type="dragón")),
+        "parse_query": round(float(np.mean([time_us(lambda: index.parse_query(q), 200) for q in queries])), 2),
+        "hit_queries": f"{len(hits)}/{len(queries)}"
+    }
+
+    retriever = HybridRetriever(
+        vector_store=vector_store, lexical_index=vp.get_lexical_index(), k=RETRIEVAL_K,
+        fetch_k=max(RETRIEVAL_K, HYBRID_FETCH_K), rrf_k=RRF_K, monster_index=index
+    )
+    retriever.invoke(queries[0])  # calentamiento
+    results["retrieval_hybrid_monsters"] = summarize(time_calls(retriever.invoke, queries, repeat))
+    return results
+
+def bench_ollama_client(state, queries: List[str], repeat: int) -> Dict[str, Any]:
+    """
+    Mide el calentamiento y el pool HTTP contra el servidor sustituto de Ollama.
+
+    La primera consulta en frío paga la carga de ambos modelos; tras el
+    calentamiento, solo la inferencia. El pool compartido se compara con
+    un cliente nuevo por petición (una conexión TCP por llamada).
+    """
+    import ollama
+    from config import EMBEDDINGS_MODEL, LLM_MODEL, OLLAMA_HOST
+    from langchain_ollama import OllamaEmbeddings, OllamaLLM
+    import ollama_client
+
+    print("🦙 Cliente de Ollama (servidor sustituto)...")
+    embeddings = ollama_client.attach_client(
+        OllamaEmbeddings(model=EMBEDDINGS_MODEL, keep_alive=ollama_client.KEEP_ALIVE)
+    )
+    llm = ollama_client.attach_client(OllamaLLM(model=LLM_MODEL, keep_alive=ollama_client.KEEP_ALIVE))
+
+    def first_query_ms(query: str) -> float:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        next(iter(llm.stream(query)))
+        return 1000 * (time.perf_counter() - start)
+
+    state.loaded.clear()
+    cold_ms = first_query_ms(queries[0])
+
+    state.loaded.clear()
+    ollama_client._warmup_timings.clear()
+    warmup = {
+        model: ollama_client.warm_up(model, kind)
+        for model, kind in ((EMBEDDINGS_MODEL, ollama_client.KIND_EMBEDDINGS), (LLM_MODEL, ollama_client.KIND_LLM))
+    }
+    warm_ms = first_query_ms(queries[1])
+
+    results: Dict[str, Any] = {
+        "ollama_warmup": {
+            "load_seconds": state.load_seconds,
+            "warmup_seconds": {model: round(seconds, 3) for model, seconds in warmup.items() if seconds is not None},
+            "first_query_cold_ms": round(cold_ms, 1),
+            "first_query_warm_ms": round(warm_ms, 1)
+        }
+    }
+
+    # Pool compartido frente a un cliente (y una conexión) por petición
+    calls = queries * repeat
+    connections = state.connections
+    pooled = time_calls(embeddings.embed_query, queries, repeat)
+    pooled_connections = state.connections - connections
+
+    def unpooled_embed(query: str):
+        with ollama.Client(host=OLLAMA_HOST) as client:
+            return client.embed(model=EMBEDDINGS_MODEL, input=query, keep_alive=ollama_client.KEEP_ALIVE)
+
+    connections = state.connections
+    unpooled = time_calls(unpooled_embed, queries, repeat)
+    unpooled_connections = state.connections - connections
+
+    connections = state.connections
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(embeddings.embed_query, calls))
+    concurrent_connections = state.connections - connections
+
+    results["ollama_pool"] = {
+        "calls": len(calls),
+        "pooled_p50_ms": summarize(pooled)["p50_ms"],
+        "unpooled_p50_ms": summarize(unpooled)["p50_ms"],
+        "pooled_connections": pooled_connections,
+        "unpooled_connections": unpooled_connections,
+        "concurrent_8_connections": concurrent_connections
+    }
+    return results
+
+def _import_time_ms(module: str) -> Tuple[float, List[str]]:
+    """Importa `module` en un proceso nuevo y devuelve (ms acumulados, pesados cargados)."""
+    code = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=project_root / "src", capture_output=True, text=True, check=True
+    )
+    # Formato: "import time: self [us] | cumulative | nombre" (sin sangría = nivel superior)
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            return int(parts[1]) / 1000, json.loads(proc.stdout.strip().splitlines()[-1])
+    raise RuntimeError(f"No se encontró {module} en la salida de -X importtime")
+
+def bench_cold_start(work_dir: Path, repeat: int) -> Dict[str, Any]:
+    """Mide la importación de los módulos principales y `setup_db.py stats` en procesos nuevos."""
+    print("🥶 Arranque en frío...")
+    results: Dict[str, Any] = {}
+
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        # El mínimo de varias ejecuciones es la medida más estable
+        samples, heavy = [], []
+        for _ in range(repeat):
+            ms, heavy = _import_time_ms(module)
+            samples.append(ms)
+        cumulative = min(samples)
+        results[f"import_{module}"] = {
+            "cumulative_ms": round(cumulative, 1),
+            "budget_ms": budget,
+            "within_budget": cumulative <= budget,
+            "heavy_modules": heavy
+        }
+
+    # CLI completo: arranque del intérprete + importaciones + lectura de estadísticas
+    env = {**os.environ, "STORAGE_DIR": str(work_dir)}
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(project_root / "scripts" / "setup_db.py"), "stats"],
+                       env=env, capture_output=True, check=True)
+        samples.append(time.perf_counter() - start)
+    results["cold_start_setup_db_stats"] = summarize(samples)
+
+    return results
+
+# -------------------------------------------------------------------------#
+# 4. COMPARACIÓN DE EJECUCIONES
+# -------------------------------------------------------------------------#
+
+# Métrica principal de cada tipo de etapa y si "más alto es mejor"
+_HEADLINE_METRICS = [
+    ("chunks_per_second", True),
+    ("pages_per_second", True),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("cumulative_ms", False),
+]
+
+def _headline(stage: Dict[str, Any]) -> Iterator[tuple]:
+    for key, higher_is_better in _HEADLINE_METRICS:
+        if stage.get(key) is not None:
+            yield key, stage[key], higher_is_better
+
+def compare_results(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Imprime la variación de las métricas principales entre dos ejecuciones."""
+    print(f"\n📊 Comparación con {previous.get('meta', {}).get('commit') or 'ejecución anterior'}")
+    print("-" * 60)
+    for name, stage in current["stages"].items():
+        old_stage = previous.get("stages", {}).get(name)
+        if not old_stage:
+            continue
+        # Los flujos completos guardan la latencia total en un subdiccionario
+        if "total" in stage:
+            stage, old_stage = stage["total"], old_stage.get("total", {})
+        for key, value, higher_is_better in _headline(stage):
+            old = old_stage.get(key)
+            if not old:
+                continue
+            change = (value - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            icon = "⚪" if abs(change) < 2 else ("🟢" if better else "🔴")
+            print(f"{icon} {name:<24} {key:<18} {old:>10.2f} ➜ {value:>10.2f} ({change:+.1f}%)")
+
+# -------------------------------------------------------------------------#
+# 5. PUNTO DE ENTRADA
+# -------------------------------------------------------------------------#
+
+def create_parser() -> argparse.ArgumentParser:
+    """Crea el parser de argumentos del benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark del pipeline RAG con modelos falsos deterministas",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--max-files", type=int, help="Limitar el número de archivos del corpus")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones de las consultas de recuperación")
+    parser.add_argument("--flow-repeat", type=int, default=1, help="Repeticiones de los flujos completos")
+    parser.add_argument("--embed-dim", type=int, default=1024, help="Dimensión de los embeddings falsos")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Latencia por llamada de embeddings (s)")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.001, help="Latencia por texto embebido (s)")
+    parser.add_argument("--llm-first-token", type=float, default=0.1, help="Latencia hasta el primer token del LLM (s)")
+    parser.add_argument("--llm-token-latency", type=float, default=0.005, help="Latencia entre tokens del LLM (s)")
+    parser.add_argument("--llm-tokens", type=int, default=40, help="Tokens por respuesta del LLM")
+    parser.add_argument("--standin-load", type=float, default=1.0,
+                        help="Carga simulada de cada modelo en el Ollama sustituto (s)")
+    parser.add_argument("--cold-start-repeat", type=int, default=3, help="Procesos por medida de arranque en frío")
+    parser.add_argument("--work-dir", help="Directorio de almacenamiento del benchmark (por defecto, uno temporal)")
+    parser.add_argument("--output", help="Ruta del JSON de resultados (por defecto storage/benchmarks/)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    return parser
+
+def main():
+    """Función principal del benchmark."""
+    args = create_parser().parse_args()
+    print("🐉 Benchmark del pipeline RAG D&D 5E")
+    print("=" * 50)
+
+    # Aislar todo el almacenamiento antes de importar la configuración
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="dnd_bench_"))
+    output_dir = Path(os.getenv("STORAGE_DIR", str(project_root / "storage"))) / "benchmarks"
+    os.environ["STORAGE_DIR"] = str(work_dir)
+    for flag in ("EMBED_CACHE_ENABLED", "QUERY_CACHE_ENABLED", "ANSWER_CACHE_ENABLED"):
+        os.environ[flag] = "false"
+
+    # Ollama sustituto local para medir el cliente HTTP y el calentamiento
+    from ollama_standin import start_in_thread
+    standin, standin_state, standin_url = start_in_thread(
+        load_seconds=args.standin_load, token_latency=0.002, dim=args.embed_dim
+    )
+    os.environ["OLLAMA_HOST"] = standin_url
+
+    import config
+    import vector_pipeline as vp
+
+    embeddings = FakeEmbeddings(args.embed_dim, args.embed_latency, args.embed_latency_per_text)
+    llm = FakeLLM(
+        first_token_latency=args.llm_first_token,
+        token_latency=args.llm_token_latency,
+        answer_tokens=args.llm_tokens
+    )
+    vp._embeddings = embeddings
+
+    file_paths = vp.list_markdown_files(str(config.DATA_DIR))[:args.max_files]
+    if not file_paths:
+        print(f"❌ No hay archivos Markdown en {config.DATA_DIR}")
+        sys.exit(1)
+    print(f"📁 Corpus: {len(file_paths)} archivos | 🗄️ Almacenamiento: {work_dir}")
+
+    start = time.perf_counter()
+    stages, vector_store = bench_ingestion(vp, file_paths, embeddings)
+    stages.update(bench_chunk_stability(vp, file_paths))
+    stages.update(bench_queries(vp, vector_store, llm, BENCH_QUERIES, args.repeat, args.flow_repeat))
+    stages.update(bench_mmap_index(vp, vector_store, work_dir, BENCH_QUERIES, args.repeat))
+    stages.update(bench_page_store(vp, vector_store, BENCH_QUERIES, args.repeat))
+    stages.update(bench_heading_index(vp, vector_store, BENCH_QUERIES, args.repeat))
+    stages.update(bench_monster_index(vp, vector_store, MONSTER_QUERIES, args.repeat))
+    stages.update(bench_ollama_client(standin_state, BENCH_QUERIES, args.repeat))
+    standin.shutdown()
+    stages.update(bench_cold_start(work_dir, args.cold_start_repeat))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "seconds": round(time.perf_counter() - start, 2),
+            "corpus_files": [vp.normalize_filename(path) for path in file_paths],
+            "config": {
+                name: getattr(config, name)
+                for name in ("CHUNK_SIZE", "CHUNK_OVERLAP", "CHUNKER", "CDC_CHUNK_SIZE", "RETRIEVAL_K",
+                             "CONTEXT_MAX_TOKENS", "HYBRID_FETCH_K", "MMR_LAMBDA", "MMR_FETCH_K", "VECTOR_BACKEND", "MMAP_INDEX_DTYPE",
+                             "PARSE_WORKERS", "PARSE_PAGES_PER_TASK", "EMBED_BATCH_SIZE",
+                             "EMBED_WORKERS", "RETRIEVAL_WORKERS")
+            },
+            "fakes": {
+                "embed_dim": args.embed_dim,
+                "embed_latency": args.embed_latency,
+                "embed_latency_per_text": args.embed_latency_per_text,
+                "llm_first_token": args.llm_first_token,
+                "llm_token_latency": args.llm_token_latency,
+                "llm_tokens": args.llm_tokens
+            }
+        },
+        "stages": stages
+    }
+
+    output = Path(args.output) if args.output else output_dir / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print("\n📊 Resultados")
+    print("-" * 60)
+    for name, stage in stages.items():
+        print(f"  {name:<24} {json.dumps(stage, ensure_ascii=False)}")
+    over_budget = [name for name, stage in stages.items() if stage.get("within_budget") is False]
+    if over_budget:
+        print(f"\n⚠️  Fuera del presupuesto de arranque: {', '.join(over_budget)}")
+    print(f"\n💾 Resultados guardados en: {output}")
+
+    if args.compare:
+        compare_results(json.loads(Path(args.compare).read_text(encoding="utf-8")), results)
+
+    if not args.work_dir:
+        import shutil
+        vp.get_lexical_index().close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------------#
+# OLLAMA STANDIN - Servidor local que imita la API HTTP de Ollama
+# -------------------------------------------------------------------------#
+
+"""
+Servidor sustituto de Ollama para pruebas y benchmarks sin modelos reales
+
+Implementa el subconjunto de la API que usa el proyecto:
+• POST /api/embed: embeddings deterministas (hash del texto)
+• POST /api/generate: respuesta en streaming (NDJSON) o completa; prompt vacío = solo carga
+• GET /api/tags, GET /api/ps y GET / (comprobación de estado)
+• GET /standin/stats: conexiones TCP abiertas, peticiones y cargas de modelos
+
+Cada modelo tarda --load-seconds en "cargarse" la primera vez y vuelve a
+descargarse cuando vence su keep_alive, como en Ollama.
+
+Uso:
+    python scripts/ollama_standin.py [--port 11434] [--load-seconds 2.0]
+    OLLAMA_HOST=http://127.0.0.1:11434 python scripts/run_api.py
+"""
+
+import json
+import math
+import time
+import random
+import socket
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Tuple
+
+# keep_alive por defecto de Ollama (segundos)
+DEFAULT_KEEP_ALIVE = 300
+
+# -------------------------------------------------------------------------#
+# 1. ESTADO DEL SERVIDOR
+# -------------------------------------------------------------------------#
+
+class StandinState:
+    """Modelos cargados y contadores compartidos entre los hilos del servidor."""
+
+    def __init__(self, load_seconds: float, token_latency: float, tokens: int, dim: int):
+        self.load_seconds = load_seconds
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.dim = dim
+        self.loaded: Dict[str, float] = {}  # modelo ➜ instante en que se descarga
+        self.connections = 0
+        self.requests = 0
+        self.loads: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def count_connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def ensure_loaded(self, model: str, keep_alive: Any) -> None:
+        """Simula la carga del modelo si no está en memoria y renueva su keep_alive."""
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model, threading.Lock())
+        with load_lock:
+            if self.loaded.get(model, 0.0) <= time.monotonic():
+                time.sleep(self.load_seconds)
+                with self._lock:
+                    self.loads[model] = self.loads.get(model, 0) + 1
+            seconds = parse_duration(keep_alive)
+            self.loaded[model] = math.inf if seconds < 0 else time.monotonic() + seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "loads": dict(self.loads),
+                "loaded": sorted(model for model, until in self.loaded.items() if until > now)
+            }
+
+def parse_duration(value: Any) -> float:
+    """keep_alive de Ollama (segundos o "5m"/"1h"/"30s") a segundos."""
+    if value is None or value == "":
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1:] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Vector unitario determinista a partir del hash del texto."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# -------------------------------------------------------------------------#
+# 2. MANEJADOR HTTP
+# -------------------------------------------------------------------------#
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Atiende la API de Ollama con conexiones persistentes (HTTP/1.1)."""
+
+    protocol_version = "HTTP/1.1"
+    state: StandinState  # asignado por make_server
+
+    def setup(self) -> None:
+        super().setup()
+        # Como el servidor de Ollama (Go): sin Nagle, o cada respuesta con keep-alive espera el ACK retardado
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.state.count_connection()
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # sin log por petición
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", "0"))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self) -> None:
+        self.state.count_request()
+        if self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": m, "model": m} for m in sorted(self.state.loads)]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": m, "model": m} for m in self.state.stats()["loaded"]]})
+        elif self.path == "/standin/stats":
+            self._send_json(self.state.stats())
+        else:
+            self._send_json({"error": f"ruta desconocida: {self.path}"}, 404)
+
+    def do_POST(self) -> None:
+        self.state.count_request()
+        try:
+            data = self._read_json()
+        except json.JSONDecodeError:
+            self._send_json({"error": "cuerpo JSON no válido"}, 400)
+            return
+        model = data.get("model")
+        if not model:
+            self._send_json({"error": "model is required"}, 400)
+            return
+
+        if self.path == "/api/embed":
+            self.state.ensure_loaded(model, data.get("keep_alive"))
+            inputs = data.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json({"model": model, "embeddings": [fake_embedding(t, self.state.dim) for t in inputs]})
+        elif self.path == "/api/generate":
+            self.state.ensure_loaded(model, data.get("keep_alive"))
+            if not data.get("prompt"):
+                self._send_json({"model": model, "created_at": _now(), "response": "",
+                                 "done": True, "done_reason": "load"})
+            elif data.get("stream", True):
+                self._stream_tokens(model)
+            else:
+                time.sleep(self.state.token_latency * self.state.tokens)
+                self._send_json({"model": model, "created_at": _now(), "response": self._answer(),
+                                 "done": True, "done_reason": "stop"})
+        else:
+            self._send_json({"error": f"ruta desconocida: {self.path}"}, 404)
+
+    def _answer(self) -> str:
+        return " ".join(f"token{i}" for i in range(self.state.tokens))
+
+    def _stream_tokens(self, model: str) -> None:
+        """Respuesta NDJSON con codificación chunked, un fragmento por token."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(payload: Dict[str, Any]) -> None:
+            line = json.dumps(payload).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for i in range(self.state.tokens):
+                time.sleep(self.state.token_latency)
+                write_chunk({"model": model, "created_at": _now(), "response": f"token{i} ", "done": False})
+            write_chunk({"model": model, "created_at": _now(), "response": "", "done": True, "done_reason": "stop"})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # el cliente dejó de leer el stream
+
+# -------------------------------------------------------------------------#
+# 3. ARRANQUE
+# -------------------------------------------------------------------------#
+
+def make_server(host: str = "127.0.0.1", port: int = 0, load_seconds: float = 2.0,
+                token_latency: float = 0.01, tokens: int = 20,
+                dim: int = 1024) -> Tuple[ThreadingHTTPServer, StandinState]:
+    """
+    Crea el servidor sustituto (port=0 elige un puerto libre).
+
+    Returns:
+        Tupla (servidor, estado compartido)
+    """
+    state = StandinState(load_seconds, token_latency, tokens, dim)
+    handler = type("BoundStandinHandler", (StandinHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, state
+
+def start_in_thread(**kwargs) -> Tuple[ThreadingHTTPServer, StandinState, str]:
+    """
+    Arranca el servidor en un hilo de fondo (para benchmarks).
+
+    Returns:
+        Tupla (servidor, estado, URL base); detener con `server.shutdown()`
+    """
+    server, state = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, state, f"http://{host}:{port}"
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Servidor sustituto de la API de Ollama")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz en la que escuchar")
+    parser.add_argument("--port", type=int, default=11434, help="Puerto (por defecto: 11434)")
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="Tiempo simulado de carga de cada modelo")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Segundos por token generado")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens por respuesta")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimensión de los embeddings")
+    return parser
+
+def main():
+    """Función principal del servidor sustituto"""
+    args = create_parser().parse_args()
+    server, _ = make_server(args.host, args.port, args.load_seconds, args.token_latency, args.tokens, args.dim)
+    print(f"🦙 Ollama sustituto en http://{args.host}:{args.port} (carga simulada: {args.load_seconds}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Servidor detenido")
+
+if __name__ == "__main__":
+    main()
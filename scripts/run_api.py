@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -------------------------------------------------------------------------#
+# RUN_API - Arranque del servidor HTTP/JSON del asistente
+# -------------------------------------------------------------------------#
+
+"""
+Servidor HTTP/JSON del asistente D&D 5E (sin Streamlit)
+
+Uso:
+    python scripts/run_api.py [--host 127.0.0.1] [--port 8000]
+
+Ejemplo:
+    curl -X POST http://127.0.0.1:8000/query -d '{"query": "¿Cómo funciona la ventaja?"}'
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Añadir src al path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from config import API_HOST, API_PORT
+from api_server import run_server
+
+def main():
+    """Función principal del servidor"""
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON del asistente D&D 5E")
+    parser.add_argument("--host", default=API_HOST, help=f"Interfaz en la que escuchar (por defecto: {API_HOST})")
+    parser.add_argument("--port", type=int, default=API_PORT, help=f"Puerto (por defecto: {API_PORT})")
+    args = parser.parse_args()
+
+    run_server(args.host, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ Funcionalidades:
 """
 
 import argparse
+import importlib.util
 import sys
 import os
 from pathlib import Path
@@ -28,17 +29,25 @@ try:
         init_or_update,
         reset_database,
         get_database_stats,
-        process_markdown_files,
-        load_existing_database
+        load_existing_database,
+        ingest_files,
+        build_index_artifacts,
+        file_state,
+        load_processing_log,
+        update_processing_log
     )
     
-    from config import DATA_DIR, DB_DIR, PROJECT_ROOT
+    from config import DATA_DIR, DB_DIR, PROJECT_ROOT, STORAGE_DIR
+    import telemetry
     
 except ImportError as e:
     print(f"❌ Error importando módulos: {e}")
     print("Asegúrate de que estás ejecutando desde el directorio raíz del proyecto")
     sys.exit(1)
 
+# Paquetes que el pipeline importa bajo demanda
+REQUIRED_PACKAGES = ["langchain_core", "langchain_text_splitters", "langchain_chroma", "langchain_ollama", "tqdm"]
+
 # -------------------------------------------------------------------------#
 # FUNCIONES DE GESTIÓN DE BASE DE DATOS
 # -------------------------------------------------------------------------#
@@ -95,17 +104,59 @@ def show_stats():
     elif stats["status"] == "error":
         print(f"❌ Error obteniendo estadísticas: {stats['error']}")
         
+    elif stats["status"] == "no_stats":
+        print(f"💾 Ubicación: {DB_DIR}")
+        print("ℹ️  No hay estadísticas guardadas; ejecuta 'python scripts/setup_db.py init' para generarlas")
+        
     elif stats["status"] == "active":
         print(f"📄 Documentos indexados: {stats['document_count']:,}")
         print(f"📁 Archivos procesados: {stats['processed_files']}")
         print(f"🕐 Última actualización: {stats['last_update']}")
         print(f"💾 Ubicación: {DB_DIR}")
-        
-        # Información adicional del directorio
-        if DB_DIR.exists():
-            total_size = sum(f.stat().st_size for f in DB_DIR.rglob('*') if f.is_file())
-            size_mb = total_size / (1024 * 1024)
-            print(f"📦 Tamaño en disco: {size_mb:.2f} MB")
+        print(f"📦 Tamaño en disco: {stats['size_bytes'] / (1024 * 1024):.2f} MB")
+    
+    show_embedding_cache_stats(stats.get("embedding_cache"))
+
+def show_embedding_cache_stats(cache_stats):
+    """Muestra los aciertos y fallos de la caché de embeddings."""
+    if not cache_stats or cache_stats["status"] == "no_cache":
+        print("🧠 Caché de embeddings: vacía")
+        return
+    
+    if cache_stats["status"] == "error":
+        print(f"❌ Error leyendo la caché de embeddings: {cache_stats['error']}")
+        return
+    
+    def rate(value):
+        return f"{value:.1%}" if value is not None else "N/A"
+    
+    size_mb = cache_stats["size_bytes"] / (1024 * 1024)
+    print("\n🧠 Caché de embeddings")
+    print(f"  📦 Entradas: {cache_stats['entries']:,} ({size_mb:.2f} MB)")
+    print(f"  🎯 Última ejecución: {cache_stats['last_hits']:,} aciertos / "
+          f"{cache_stats['last_misses']:,} fallos ({rate(cache_stats['last_hit_rate'])})")
+    print(f"  📈 Acumulado: {cache_stats['hits']:,} aciertos / "
+          f"{cache_stats['misses']:,} fallos ({rate(cache_stats['hit_rate'])})")
+    print(f"  🗑️  Entradas desalojadas: {cache_stats['evictions']:,}")
+
+def show_telemetry_summary(metrics_out: str = None):
+    """
+    Muestra el tiempo por etapa de la ingestión y, opcionalmente, exporta las métricas.
+    
+    Args:
+        metrics_out: Ruta de exportación (.jsonl = JSON lines, otra = Prometheus)
+    """
+    summary = telemetry.metrics.summary()
+    if summary:
+        print("\n⏱️  Tiempo por etapa")
+        print("=" * 40)
+        for row in summary:
+            print(f"  {row['span']:<16} {row['count']:>7} llamadas  {row['seconds']:>9.2f}s  "
+                  f"(media {row['mean_ms']:.1f} ms)")
+    
+    if metrics_out:
+        telemetry.write_metrics(Path(metrics_out))
+        print(f"💾 Métricas exportadas a: {metrics_out}")
 
 def reset_database_interactive():
     """Resetea la base de datos con confirmación interactiva."""
@@ -149,13 +200,17 @@ def check_prerequisites():
         print(f"✅ Encontrados {len(md_files)} archivos Markdown")
     
     # Verificar directorios de almacenamiento
-    storage_dir = PROJECT_ROOT / "storage"
+    storage_dir = STORAGE_DIR
     if not storage_dir.exists():
         print(f"📁 Creando directorio storage: {storage_dir}")
         storage_dir.mkdir(parents=True, exist_ok=True)
     
-    # Verificar dependencias (importaciones ya verificadas arriba)
-    print("✅ Dependencias Python disponibles")
+    # Verificar dependencias sin importarlas (se cargan bajo demanda)
+    missing = [name for name in REQUIRED_PACKAGES if importlib.util.find_spec(name) is None]
+    if missing:
+        issues.append(f"❌ Faltan dependencias Python: {', '.join(missing)}")
+    else:
+        print("✅ Dependencias Python disponibles")
     
     if issues:
         print("\n⚠️  Problemas encontrados:")
@@ -189,22 +244,21 @@ def add_specific_files(file_paths: list):
         return False
     
     try:
-        # Procesar archivos
-        documents = process_markdown_files(valid_files)
+        # Cargar base de datos existente (o crearla) e ingerir en streaming
+        vector_store = load_existing_database()
+        before = {path: file_state(path) for path in valid_files}
+        counts = ingest_files(vector_store, valid_files)
         
-        if not documents:
+        if not counts["added"] and not counts["unchanged"]:
             print("❌ No se generaron documentos")
             return False
         
-        # Cargar base de datos existente o crear nueva
-        if DB_DIR.exists():
-            vector_store = load_existing_database()
-            vector_store.add_documents(documents)
-            print(f"✅ Añadidos {len(documents)} chunks a la base de datos existente")
-        else:
-            from vector_pipeline import create_vector_database
-            vector_store = create_vector_database(documents)
-            print(f"✅ Creada nueva base de datos con {len(documents)} chunks")
+        # Registrar los archivos en el manifiesto para que la próxima actualización no los re-ingiera
+        update_processing_log(load_processing_log(), valid_files, counts["chunk_ids"], before)
+        build_index_artifacts(vector_store)
+        
+        print(f"✅ Chunks sincronizados: {counts['added']} añadidos, "
+              f"{counts['removed']} eliminados, {counts['unchanged']} sin cambios")
         
         return True
         
@@ -225,6 +279,7 @@ def create_parser():
 Ejemplos de uso:
   python setup_db.py init                    # Inicializar/actualizar BD
   python setup_db.py init --force            # Resetear e inicializar BD
+  python setup_db.py init --metrics-out m.prom  # Exportar métricas de ingestión
   python setup_db.py stats                   # Mostrar estadísticas
   python setup_db.py reset                   # Resetear BD (interactivo)
   python setup_db.py check                   # Verificar prerrequisitos
@@ -238,6 +293,8 @@ Ejemplos de uso:
     init_parser = subparsers.add_parser('init', help='Inicializar o actualizar la base de datos')
     init_parser.add_argument('--force', action='store_true', 
                            help='Fuerza el reseteo antes de inicializar')
+    init_parser.add_argument('--metrics-out', metavar='RUTA',
+                           help='Exporta las métricas de la ingestión (.prom o .jsonl)')
     
     # Comando stats
     subparsers.add_parser('stats', help='Mostrar estadísticas de la base de datos')
@@ -251,6 +308,8 @@ Ejemplos de uso:
     # Comando add
     add_parser = subparsers.add_parser('add', help='Añadir archivos específicos')
     add_parser.add_argument('files', nargs='+', help='Rutas de archivos a añadir')
+    add_parser.add_argument('--metrics-out', metavar='RUTA',
+                          help='Exporta las métricas de la ingestión (.prom o .jsonl)')
     
     return parser
 
@@ -274,6 +333,7 @@ def main():
     elif args.command == 'init':
         if check_prerequisites():
             initialize_database(force=args.force)
+            show_telemetry_summary(args.metrics_out)
         else:
             print("\n❌ No se puede inicializar: faltan prerrequisitos")
             sys.exit(1)
@@ -287,6 +347,7 @@ def main():
     elif args.command == 'add':
         if check_prerequisites():
             add_specific_files(args.files)
+            show_telemetry_summary(args.metrics_out)
         else:
             print("\n❌ No se pueden añadir archivos: fallan prerrequisitos")
             sys.exit(1)
@@ -2,19 +2,29 @@
 Sistema RAG para Dungeons & Dragons 5ª edición
 """
 
-# Importar las clases/funciones principales
-from .vector_pipeline import get_retriever, init_or_update
-from .rag_interface import *
-from .config import *
+import importlib
+
+# Importación diferida: cada nombre se resuelve al usarse por primera vez,
+# así `import src` no arrastra Streamlit, LangChain ni los clientes de modelos.
+_LAZY_EXPORTS = {
+    'get_retriever': 'vector_pipeline',
+    'init_or_update': 'vector_pipeline',
+    'QueryEngine': 'query_engine',
+    'EMBEDDINGS_MODEL': 'config',
+    'LLM_MODEL': 'config',
+    'CHUNK_SIZE': 'config'
+}
 
 # Definir qué se exporta con "from src import *"
-__all__ = [
-    'get_retriever',
-    'init_or_update',
-    'EMBEDDINGS_MODEL',
-    'LLM_MODEL',
-    'CHUNK_SIZE'
-]
+__all__ = list(_LAZY_EXPORTS)
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
 
-# Código de inicialización opcional
-print("🐉 Dungeons RAG package loaded")
+def __dir__():
+    return sorted(list(globals()) + __all__)
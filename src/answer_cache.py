@@ -0,0 +1,241 @@
+# -------------------------------------------------------------------------#
+# ANSWER CACHE - Caché persistente de respuestas del LLM
+# -------------------------------------------------------------------------#
+
+"""
+Caché en disco de respuestas generadas para D&D 5E
+
+Funcionalidades principales:
+• Aciertos exactos: consulta normalizada + modo + modelo + versión de prompts + chunks recuperados
+• Aciertos aproximados: similitud coseno entre embeddings de consulta (paráfrasis),
+  solo si los chunks recuperados coinciden (mismo primer chunk y solapamiento mínimo)
+• Conserva la tabla de fuentes de cada respuesta
+• Invalidación por generación del índice y desalojo LRU por número de entradas
+"""
+
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Callable
+
+import numpy as np
+
+from query_cache import normalize_query
+
+# -------------------------------------------------------------------------#
+# 1. ESQUEMA
+# -------------------------------------------------------------------------#
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    chunk_ids TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    query_vector BLOB,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers(mode, model, prompt_version, generation);
+CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used);
+"""
+
+# -------------------------------------------------------------------------#
+# 2. CACHÉ
+# -------------------------------------------------------------------------#
+
+class AnswerCache:
+    """
+    Caché SQLite de respuestas con búsqueda exacta y por similitud.
+
+    Las entradas de una generación de índice distinta a la actual se
+    ignoran y se purgan, ya que podrían citar chunks que ya no existen.
+    """
+
+    def __init__(self, path: Path, model: str, prompt_version: str,
+                 generation_fn: Callable[[], int], max_entries: int,
+                 similarity_threshold: float, min_overlap: float = 0.5):
+        self.path = Path(path)
+        self.model = model
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.min_overlap = min_overlap
+        self._generation_fn = generation_fn
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def _make_key(self, query: str, mode: str, chunk_ids: List[str]) -> str:
+        raw = json.dumps(
+            [normalize_query(query), mode, self.model, self.prompt_version, chunk_ids],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _current_generation(self) -> int:
+        """Devuelve la generación actual y purga entradas obsoletas si ha cambiado."""
+        generation = self._generation_fn()
+        if generation != self._generation:
+            self._conn.execute("DELETE FROM answers WHERE generation != ?", (generation,))
+            self._conn.commit()
+            self._generation = generation
+        return generation
+
+    def _touch(self, key: str) -> None:
+        self._conn.execute(
+            "UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?",
+            (time.time(), key)
+        )
+        self._conn.commit()
+
+    def lookup(self, query: str, mode: str, chunk_ids: List[str],
+               query_vector: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca una respuesta para la consulta.
+
+        Primero prueba la coincidencia exacta (misma consulta normalizada y
+        mismos chunks recuperados); si falla y se pasa `query_vector`, busca
+        la consulta cacheada más parecida del mismo modo por encima del umbral
+        cuyos chunks coincidan con los recuperados ahora: preguntas con la
+        misma plantilla sobre entidades distintas ("CA del contemplador" y
+        "CA del dragón rojo") tienen embeddings cercanos pero no los mismos chunks.
+
+        Args:
+            query: Consulta del usuario
+            mode: Modo de consulta ("normal" o "decomposition")
+            chunk_ids: IDs de los chunks recuperados, en orden
+            query_vector: Embedding de la consulta para aciertos aproximados
+
+        Returns:
+            Diccionario con answer, sources, match ("exact"/"similar") y similarity, o None
+        """
+        key = self._make_key(query, mode, chunk_ids)
+        with self._lock:
+            generation = self._current_generation()
+            row = self._conn.execute(
+                "SELECT answer, sources FROM answers WHERE key = ? AND generation = ?",
+                (key, generation)
+            ).fetchone()
+            if row is not None:
+                self._touch(key)
+                self.exact_hits += 1
+                return {"answer": row[0], "sources": json.loads(row[1]),
+                        "match": "exact", "similarity": 1.0}
+
+            if query_vector is not None:
+                similar = self._lookup_similar(mode, generation, query_vector, chunk_ids)
+                if similar is not None:
+                    self.similar_hits += 1
+                    return similar
+
+            self.misses += 1
+            return None
+
+    def _same_chunks(self, chunk_ids: List[str], cached_ids: List[str]) -> bool:
+        """Mismo primer chunk y al menos `min_overlap` de chunks en común (Jaccard)."""
+        if not chunk_ids or not cached_ids or chunk_ids[0] != cached_ids[0]:
+            return False
+        current, cached = set(chunk_ids), set(cached_ids)
+        return len(current & cached) / len(current | cached) >= self.min_overlap
+
+    def _lookup_similar(self, mode: str, generation: int, query_vector: List[float],
+                        chunk_ids: List[str]) -> Optional[Dict[str, Any]]:
+        rows = self._conn.execute(
+            "SELECT key, query_vector, chunk_ids FROM answers "
+            "WHERE mode = ? AND model = ? AND prompt_version = ? AND generation = ? "
+            "AND query_vector IS NOT NULL",
+            (mode, self.model, self.prompt_version, generation)
+        ).fetchall()
+        if not rows:
+            return None
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        matrix = np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows])
+        if matrix.shape[1] != query.shape[0]:
+            return None
+
+        # Similitud coseno de la consulta contra todas las entradas a la vez
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        similarities = matrix @ query / np.where(norms == 0, 1.0, norms)
+        # La más parecida por encima del umbral que además recuperó los mismos chunks
+        for best in np.argsort(-similarities):
+            if similarities[best] < self.similarity_threshold:
+                return None
+            if self._same_chunks(chunk_ids, json.loads(rows[best][2])):
+                break
+        else:
+            return None
+
+        key = rows[best][0]
+        answer, sources = self._conn.execute(
+            "SELECT answer, sources FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        self._touch(key)
+        return {"answer": answer, "sources": json.loads(sources),
+                "match": "similar", "similarity": float(similarities[best])}
+
+    def store(self, query: str, mode: str, chunk_ids: List[str], answer: str,
+              sources: List[Dict[str, Any]], query_vector: Optional[List[float]] = None) -> None:
+        """
+        Guarda una respuesta generada junto con sus fuentes.
+
+        Args:
+            query: Consulta del usuario
+            mode: Modo de consulta
+            chunk_ids: IDs de los chunks recuperados, en orden
+            answer: Respuesta completa del LLM
+            sources: Tabla de fuentes mostrada al usuario
+            query_vector: Embedding de la consulta (para aciertos aproximados)
+        """
+        key = self._make_key(query, mode, chunk_ids)
+        blob = np.asarray(query_vector, dtype=np.float32).tobytes() if query_vector is not None else None
+        now = time.time()
+
+        with self._lock:
+            generation = self._current_generation()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers(key, query, mode, model, prompt_version, generation, "
+                "chunk_ids, answer, sources, query_vector, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_query(query), mode, self.model, self.prompt_version, generation,
+                 json.dumps(chunk_ids), answer, json.dumps(sources, ensure_ascii=False),
+                 blob, now, now)
+            )
+            # Desalojo LRU por número de entradas
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Aciertos exactos, aproximados y fallos de este proceso, y entradas en disco."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": entries,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / total if total else None
+        }
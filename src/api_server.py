@@ -0,0 +1,214 @@
+# -------------------------------------------------------------------------#
+# API SERVER - Servidor HTTP/JSON asíncrono sobre el motor de consultas
+# -------------------------------------------------------------------------#
+
+"""
+Servidor HTTP local para consultar el asistente de D&D 5E sin Streamlit
+
+Funcionalidades principales:
+• HTTP/1.1 mínimo sobre asyncio (sin dependencias adicionales)
+• GET /health y POST /query con cuerpo JSON {"query": ..., "mode": ...}
+• GET /metrics con las métricas de telemetría en formato Prometheus
+• Muchas conexiones concurrentes en un único bucle de eventos
+• Límite de consultas simultáneas contra el LLM (API_MAX_CONCURRENCY)
+• Modelos de Ollama calentados antes de aceptar conexiones (tiempos en /health)
+"""
+
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, Optional, Tuple
+
+from config import API_HOST, API_PORT, API_MAX_CONCURRENCY, OLLAMA_WARMUP
+from query_engine import QueryEngine, QUERY_MODES, MODE_NORMAL
+import ollama_client
+import telemetry
+
+# Tamaño máximo del cuerpo de una petición (1 MB)
+MAX_BODY_BYTES = 1024 * 1024
+
+class HTTPError(Exception):
+    """Error que se devuelve al cliente como respuesta JSON."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# -------------------------------------------------------------------------#
+# 1. PROTOCOLO HTTP
+# -------------------------------------------------------------------------#
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Lee una petición HTTP/1.1 del stream.
+
+    Returns:
+        Tupla (método, ruta, cabeceras, cuerpo) o None si el cliente cerró la conexión
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Línea de petición no válida")
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length no válido")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Cuerpo demasiado grande")
+    body = await reader.readexactly(length) if length else b""
+
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+class PlainText(str):
+    """Cuerpo de respuesta que se envía como texto plano en lugar de JSON."""
+
+async def write_response(writer: asyncio.StreamWriter, status: HTTPStatus,
+                         payload: Any, keep_alive: bool) -> None:
+    """Escribe una respuesta completa (JSON, o texto plano si `payload` es PlainText)."""
+    if isinstance(payload, PlainText):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        content_type = "application/json; charset=utf-8"
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+# -------------------------------------------------------------------------#
+# 2. SERVIDOR
+# -------------------------------------------------------------------------#
+
+class APIServer:
+    """
+    Servidor HTTP/JSON sobre un QueryEngine.
+
+    Las consultas se resuelven con `QueryEngine.aanswer`, que ejecuta el
+    trabajo bloqueante fuera del bucle; un semáforo limita cuántas llegan
+    a la vez al LLM para no saturar Ollama.
+    """
+
+    def __init__(self, engine: QueryEngine, max_concurrency: int = API_MAX_CONCURRENCY):
+        self.engine = engine
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.served = 0
+
+    async def handle_query(self, body: bytes) -> Dict[str, Any]:
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "El cuerpo no es JSON válido")
+
+        query = data.get("query") if isinstance(data, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Falta el campo 'query'")
+        mode = data.get("mode", MODE_NORMAL)
+        if mode not in QUERY_MODES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'mode' debe ser uno de {list(QUERY_MODES)}")
+
+        self.in_flight += 1
+        try:
+            async with self._semaphore:
+                result = await self.engine.aanswer(query.strip(), mode)
+        finally:
+            self.in_flight -= 1
+        self.served += 1
+        return result.to_dict()
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Any:
+        if path == "/metrics":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Usa GET")
+            return PlainText(telemetry.metrics.to_prometheus())
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Usa GET")
+            return {"status": "ok", "in_flight": self.in_flight, "served": self.served,
+                    "warmup_seconds": ollama_client.get_warmup_timings()}
+        if path == "/query":
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Usa POST")
+            return await self.handle_query(body)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"Ruta desconocida: {path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Atiende una conexión (con keep-alive) hasta que el cliente la cierre."""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload = HTTPStatus.OK, await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    print(f"❌ Error procesando la petición: {e}")
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+                await write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = API_HOST, port: int = API_PORT) -> None:
+        """Arranca el servidor y atiende peticiones indefinidamente."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"🚀 API escuchando en http://{host}:{port} (POST /query, GET /health, GET /metrics)")
+        async with server:
+            await server.serve_forever()
+
+def run_server(host: str = API_HOST, port: int = API_PORT,
+               engine: Optional[QueryEngine] = None) -> None:
+    """
+    Crea el motor de consultas y ejecuta el servidor HTTP.
+
+    Args:
+        host: Interfaz en la que escuchar
+        port: Puerto en el que escuchar
+        engine: Motor de consultas (por defecto, uno con la configuración del proyecto)
+    """
+    # Los modelos se cargan antes de escuchar: la primera consulta no paga la carga
+    engine = engine or QueryEngine(warm_up=OLLAMA_WARMUP)
+
+    async def main():
+        # El executor por defecto del bucle debe admitir tantas consultas como el semáforo
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=API_MAX_CONCURRENCY)
+        )
+        await APIServer(engine).serve(host, port)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Servidor detenido")
@@ -0,0 +1,151 @@
+# -------------------------------------------------------------------------#
+# CDC CHUNKER - División por contenido (rolling hash) dentro de cada sección
+# -------------------------------------------------------------------------#
+
+"""
+Chunker definido por contenido para D&D 5E
+
+Funcionalidades principales:
+• Los cortes solo se hacen en saltos de párrafo, de línea o de frase
+• Cada salto candidato se acepta o no según un rolling hash (gear) del texto
+  que lo precede, no según su posición: una errata o un párrafo insertado
+  solo cambia los chunks que tocan la edición
+• Tamaños mínimo y máximo por chunk; tras un corte forzado por tamaño, los
+  cortes vuelven a sincronizarse en el siguiente salto elegido por contenido
+• Interfaz compatible con el splitter de LangChain (`split_text`, `split_documents`)
+"""
+
+import random
+import re
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+# Caracteres que determinan el hash de un salto (el gear hash de 32 bits "olvida"
+# todo lo anterior a sus últimos 32 caracteres)
+HASH_WINDOW = 32
+
+# Tabla gear fija: los mismos cortes en todos los procesos y ejecuciones
+_GEAR_RNG = random.Random(0x5EED)
+_GEAR = [_GEAR_RNG.getrandbits(32) for _ in range(256)]
+
+# Saltos candidatos y su preferencia (los de párrafo se eligen antes)
+BREAK_PARAGRAPH = 3
+BREAK_LINE = 2
+BREAK_SENTENCE = 1
+_BREAK_RE = re.compile(r"\n\s*\n|\n|(?<=[.!?:;])[ \t]+")
+
+def gear_hash(text: str) -> int:
+    """
+    Gear hash de los últimos HASH_WINDOW caracteres de `text`.
+
+    Es el valor que tendría un rolling hash `h = (h << 1) + GEAR[c]` (32 bits)
+    recorriendo el texto carácter a carácter, calculado solo donde hace falta.
+    """
+    value = 0
+    for char in text[-HASH_WINDOW:]:
+        value = ((value << 1) + _GEAR[ord(char) & 0xFF]) & 0xFFFFFFFF
+    return value
+
+def find_breaks(text: str) -> List[Tuple[int, int]]:
+    """
+    Saltos candidatos del texto.
+
+    Returns:
+        Lista de (posición donde empieza el siguiente chunk, preferencia)
+    """
+    breaks = []
+    for match in _BREAK_RE.finditer(text):
+        separator = match.group(0)
+        if separator.count("\n") >= 2:
+            kind = BREAK_PARAGRAPH
+        elif "\n" in separator:
+            kind = BREAK_LINE
+        else:
+            kind = BREAK_SENTENCE
+        breaks.append((match.end(), kind))
+    return breaks
+
+# -------------------------------------------------------------------------#
+# 2. SPLITTER
+# -------------------------------------------------------------------------#
+
+class ContentDefinedSplitter:
+    """
+    Divide textos largos en chunks con cortes definidos por el contenido.
+
+    En cada salto candidato se corta si el hash del texto anterior, como
+    fracción de 2^32, es menor que la distancia al salto previo multiplicada
+    por su preferencia y dividida por el margen `chunk_size - min_size`. Así
+    la longitud media ronda `chunk_size` y la decisión solo depende del
+    texto cercano al salto.
+    """
+
+    def __init__(self, chunk_size: int = 800, min_size: Optional[int] = None, max_size: Optional[int] = None):
+        self.chunk_size = chunk_size
+        self.min_size = min_size if min_size is not None else chunk_size // 2
+        self.max_size = max_size if max_size is not None else chunk_size * 2
+        self._spread = max(1, self.chunk_size - self.min_size)
+
+    def _is_boundary(self, text: str, position: int, gap: int, kind: int) -> bool:
+        threshold = min(1.0, gap * kind / (BREAK_PARAGRAPH * self._spread))
+        return gear_hash(text[max(0, position - HASH_WINDOW):position]) < threshold * 0xFFFFFFFF
+
+    def _forced_cut(self, text: str, start: int, candidates: List[int]) -> int:
+        """Corte al llegar a `max_size`: último salto válido o, si no hay, el último espacio."""
+        limit = start + self.max_size
+        valid = [position for position in candidates if position - start >= self.min_size]
+        if valid:
+            return valid[-1]
+        space = text.rfind(" ", start + self.min_size, limit)
+        return space + 1 if space != -1 else limit
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        Divide un texto en chunks.
+
+        Args:
+            text: Texto de una sección
+
+        Returns:
+            Chunks sin espacios sobrantes en los bordes
+        """
+        if len(text) <= self.max_size:
+            return [text.strip()] if text.strip() else []
+
+        cuts, start, previous = [], 0, 0
+        candidates: List[int] = []  # saltos desde el último corte
+        breaks = find_breaks(text) + [(len(text), BREAK_PARAGRAPH)]
+        index = 0
+        while index < len(breaks):
+            position, kind = breaks[index]
+            if position - start > self.max_size:
+                start = self._forced_cut(text, start, candidates)
+                cuts.append(start)
+                candidates = [c for c in candidates if c > start]
+                previous = candidates[-1] if candidates else start
+                continue  # se vuelve a evaluar el mismo salto desde el nuevo inicio
+            if position - start >= self.min_size and position < len(text) and \
+                    self._is_boundary(text, position, position - previous, kind):
+                cuts.append(position)
+                start, candidates = position, []
+            else:
+                candidates.append(position)
+            previous = position
+            index += 1
+
+        bounds = [0] + cuts + [len(text)]
+        chunks = (text[begin:end].strip() for begin, end in zip(bounds, bounds[1:]))
+        return [chunk for chunk in chunks if chunk]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Divide documentos conservando una copia de sus metadatos en cada chunk."""
+        return [
+            Document(page_content=chunk, metadata=dict(doc.metadata))
+            for doc in documents
+            for chunk in self.split_text(doc.page_content)
+        ]
@@ -4,7 +4,8 @@ from pathlib import Path
 # Rutas del proyecto
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_DIR = PROJECT_ROOT / "data" / "markdown"
-STORAGE_DIR = PROJECT_ROOT / "storage"
+# STORAGE_DIR se puede redirigir (p. ej. benchmarks en un directorio temporal)
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", str(PROJECT_ROOT / "storage")))
 DB_DIR = STORAGE_DIR / "db_dungeons"
 
 # Configuración de modelos
@@ -14,7 +15,124 @@ LLM_MODEL = os.getenv("LLM_MODEL", "gemma3:4b")
 # Configuración RAG
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+# Splitter de las secciones largas: "recursive" (tamaño fijo con solapamiento) o
+# "cdc" (cortes definidos por el contenido, estables ante erratas; sin solapamiento)
+CHUNKER = os.getenv("CHUNKER", "recursive").lower()
+# Longitud media de los chunks con CHUNKER=cdc (mínimo: la mitad; máximo: 2 × CHUNK_SIZE)
+CDC_CHUNK_SIZE = int(os.getenv("CDC_CHUNK_SIZE", "500"))
 RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+# Presupuesto de tokens del contexto de cada prompt (0 = sin límite) y umbral de casi duplicados
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Recuperaciones concurrentes en el modo de descomposición
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+
+# Búsqueda híbrida (vectorial + léxica BM25)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Diversificación MMR en dos etapas (pool de candidatos ➜ RETRIEVAL_K)
+MMR_ENABLED = os.getenv("MMR_ENABLED", "true").lower() == "true"
+# Peso de la relevancia frente a la diversidad (1 = solo relevancia)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+LEXICAL_INDEX_PATH = DB_DIR / "lexical_index.sqlite"
+# Copias fijas del índice léxico para los retrievers que sustituye el vigilante
+LEXICAL_SNAPSHOT_DIR = DB_DIR / "lexical_snapshots"
+
+# Enrutado de consultas por libro (filtro por document_name, sin LLM)
+QUERY_ROUTING = os.getenv("QUERY_ROUTING", "true").lower() == "true"
+# Evidencia mínima para filtrar y fracción de la evidencia que deben cubrir los libros elegidos
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "1.5"))
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.7"))
+# Candidatos globales por resultado antes de filtrar por libro (si no bastan, filtro `where` de Chroma)
+ROUTER_OVERFETCH = int(os.getenv("ROUTER_OVERFETCH", "3"))
+ROUTER_VOCAB_PATH = DB_DIR / "router_vocabulary.json"
+
+# Índice de bloques de estadísticas de monstruos (nombre, tipo, CA, PG, VD...)
+MONSTER_INDEX = os.getenv("MONSTER_INDEX", "true").lower() == "true"
+# Filas máximas de la tabla que se inyecta para consultas con filtro ("dragones de VD 10 o más")
+MONSTER_LIST_MAX = int(os.getenv("MONSTER_LIST_MAX", "30"))
+MONSTER_INDEX_PATH = DB_DIR / "monster_index.json"
+
+# Atajo por encabezado: consultas que nombran una sección conocida (estado, regla, rasgo)
+HEADING_INDEX = os.getenv("HEADING_INDEX", "true").lower() == "true"
+HEADING_INDEX_PATH = DB_DIR / "heading_index.json"
+
+# Recuperación padre-hijo: se busca por chunks y se entrega su página ("page"),
+# una ventana con el texto vecino ("neighbors") o solo el chunk ("off")
+PARENT_MODE = os.getenv("PARENT_MODE", "off").lower()
+# Longitud máxima del texto expandido y margen a cada lado del chunk en modo "neighbors"
+PARENT_MAX_CHARS = int(os.getenv("PARENT_MAX_CHARS", "4000"))
+PARENT_WINDOW_CHARS = int(os.getenv("PARENT_WINDOW_CHARS", "600"))
+PAGE_STORE_PATH = DB_DIR / "page_store.bin"
+
+# Backend vectorial de consulta: "chroma" o "mmap" (matriz cuantizada en memoria mapeada)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+# Tipo de la matriz de búsqueda ("int8" o "float16") y candidatos re-puntuados en float32 por resultado
+MMAP_INDEX_DTYPE = os.getenv("MMAP_INDEX_DTYPE", "int8").lower()
+MMAP_RESCORE_FACTOR = int(os.getenv("MMAP_RESCORE_FACTOR", "4"))
+MMAP_INDEX_DIR = DB_DIR / "mmap_index"
+
+# Caché de consultas (invalidada por la generación del índice)
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+QUERY_RESULTS_CACHE_SIZE = int(os.getenv("QUERY_RESULTS_CACHE_SIZE", "256"))
+INDEX_META_PATH = STORAGE_DIR / "index_meta.json"
+
+# Caché persistente de respuestas del LLM
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = STORAGE_DIR / "answer_cache.sqlite"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Un acierto por similitud exige el mismo primer chunk y esta fracción de chunks en común
+ANSWER_CACHE_MIN_OVERLAP = float(os.getenv("ANSWER_CACHE_MIN_OVERLAP", "0.5"))
+
+# Configuración de ingestión (parseo en paralelo)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "32"))
+
+# Configuración de ingestión (embeddings por lotes)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+# Lotes en memoria a la vez durante la ingestión (presupuesto de memoria)
+INGEST_MAX_PENDING_BATCHES = int(os.getenv("INGEST_MAX_PENDING_BATCHES", str(EMBED_WORKERS * 2)))
+
+# Caché persistente de embeddings
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_PATH = STORAGE_DIR / "embedding_cache.sqlite"
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+
+# Vigilancia de DATA_DIR en la app: re-ingesta incremental y recarga del retriever en caliente
+WATCH_DATA_DIR = os.getenv("WATCH_DATA_DIR", "false").lower() == "true"
+# Segundos entre comprobaciones y segundos sin cambios antes de re-ingerir
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "2"))
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "5"))
+
+# Servidor HTTP/JSON (scripts/run_api.py)
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+# Consultas simultáneas contra el LLM; el resto espera en cola
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+
+# Servidor de Ollama (vacío = variable OLLAMA_HOST o http://127.0.0.1:11434)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST") or None
+# Tiempo que Ollama mantiene los modelos cargados tras la última petición (300, 30m, 1h; -1 = siempre)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Cargar los modelos al arrancar para que la primera consulta no pague la carga
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "true").lower() == "true"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+# Pool HTTP compartido por embeddings y LLM: consultas de la API + hilos de embeddings
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", str(API_MAX_CONCURRENCY + EMBED_WORKERS)))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", str(OLLAMA_MAX_CONNECTIONS)))
+
+# Telemetría integrada (spans, contadores e histogramas)
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+# Ruta JSONL donde guardar la traza de cada consulta (vacío = desactivado)
+TELEMETRY_TRACE_LOG = os.getenv("TELEMETRY_TRACE_LOG", "")
+# Desglose de tiempos de la última consulta en el sidebar de Streamlit
+TELEMETRY_SIDEBAR = os.getenv("TELEMETRY_SIDEBAR", "true").lower() == "true"
 
 # LangSmith (opcional)
 LANGSMITH_TRACING = os.getenv("LANGSMITH_TRACING", "false").lower() == "true"
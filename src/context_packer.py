@@ -0,0 +1,249 @@
+# -------------------------------------------------------------------------#
+# CONTEXT PACKER - Empaquetado del contexto con presupuesto de tokens
+# -------------------------------------------------------------------------#
+
+"""
+Empaquetador del contexto que se envía al LLM
+
+Funcionalidades principales:
+• Presupuesto estricto de tokens por prompt (estimado por caracteres)
+• Fusión de chunks solapados o contiguos de la misma (document_name, page_number)
+• Eliminación de pasajes casi duplicados (Jaccard sobre shingles de palabras)
+• Orden por relevancia: cada pasaje hereda el mejor puesto de sus chunks
+• Recorte del último pasaje en un salto de párrafo o de frase
+"""
+
+import math
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Any, Optional
+
+from langchain_core.documents import Document
+
+from lexical_index import fold_accents
+from query_router import book_name
+import telemetry
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+# Caracteres por token aproximados para texto en español con tokenizadores tipo SentencePiece
+CHARS_PER_TOKEN = 3.5
+
+# Solape mínimo (caracteres) para considerar que dos chunks se continúan
+MIN_OVERLAP_CHARS = 20
+
+# Tamaño de los shingles (palabras) para detectar casi duplicados
+SHINGLE_SIZE = 3
+
+# Presupuesto mínimo para incluir un pasaje recortado en lugar de descartarlo
+MIN_TRUNCATED_TOKENS = 64
+
+PASSAGE_SEPARATOR = "\n\n---\n\n"
+TRUNCATION_MARK = " […]"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_BREAK_RE = re.compile(r"\n\n|\n|(?<=[.!?])\s")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima el número de tokens de un texto sin cargar el tokenizador del modelo.
+
+    Args:
+        text: Texto a medir
+
+    Returns:
+        Número aproximado de tokens
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# -------------------------------------------------------------------------#
+# 2. PASAJES: FUSIÓN Y DUPLICADOS
+# -------------------------------------------------------------------------#
+
+@dataclass
+class Passage:
+    """Texto contiguo de una página, formado por uno o varios chunks."""
+    document_name: str
+    page_number: Any
+    text: str
+    rank: int
+    section_paths: List[str] = field(default_factory=list)
+    chunk_ids: List[str] = field(default_factory=list)
+
+    @property
+    def header(self) -> str:
+        return f"[FUENTE: {book_name(self.document_name)}, Página: {self.page_number}]"
+
+    def render(self) -> str:
+        return f"{self.header}\n{self.text}"
+
+def _merge_overlap(first: str, second: str) -> Optional[str]:
+    """
+    Une dos textos si el final de `first` coincide con el principio de `second`.
+
+    Returns:
+        Texto unido o None si no se solapan
+    """
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    # El solape es un sufijo de `first`: como mucho tan largo como `second`
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        tail = first[start:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        start = first.find(probe, start + 1)
+    return None
+
+def _absorb(passage: Passage, text: str) -> bool:
+    """Incorpora el texto de un chunk al pasaje si lo contiene o se solapa con él."""
+    if text in passage.text:
+        return True
+    if passage.text in text:
+        passage.text = text
+        return True
+    merged = _merge_overlap(passage.text, text) or _merge_overlap(text, passage.text)
+    if merged is not None:
+        passage.text = merged
+        return True
+    return False
+
+def merge_page_chunks(docs: List[Document]) -> List[Passage]:
+    """
+    Agrupa los chunks por (document_name, page_number) y fusiona sus textos.
+
+    Los chunks solapados (por CHUNK_OVERLAP) se unen sin repetir el solape;
+    los contiguos de otras secciones de la misma página se añaden como
+    párrafos del mismo pasaje, de modo que la cabecera de fuente aparece
+    una sola vez.
+
+    Args:
+        docs: Chunks ordenados por relevancia
+
+    Returns:
+        Pasajes en orden de relevancia (el del mejor chunk de cada página)
+    """
+    passages: Dict[Tuple[str, Any], Passage] = {}
+
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("document_name", "desconocido"), doc.metadata.get("page_number", "N/A"))
+        text = doc.page_content.strip()
+        section_path = doc.metadata.get("section_path", "")
+        chunk_id = doc.metadata.get("chunk_id") or doc.id or ""
+
+        passage = passages.get(key)
+        if passage is None:
+            passages[key] = Passage(key[0], key[1], text, rank, [section_path], [chunk_id])
+            continue
+
+        telemetry.count("context_packing", result="merged")
+        if not _absorb(passage, text):
+            passage.text += "\n\n" + text
+        if section_path not in passage.section_paths:
+            passage.section_paths.append(section_path)
+        passage.chunk_ids.append(chunk_id)
+
+    return sorted(passages.values(), key=lambda p: p.rank)
+
+def _shingles(text: str) -> set:
+    words = _WORD_RE.findall(fold_accents(text))
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def drop_near_duplicates(passages: List[Passage], threshold: float) -> List[Passage]:
+    """
+    Descarta pasajes casi idénticos a otro más relevante.
+
+    Dos pasajes son casi duplicados si la similitud de Jaccard de sus
+    shingles de palabras, o la fracción del más corto contenida en el otro,
+    supera `threshold` (p. ej. el mismo texto repetido en dos libros).
+
+    Args:
+        passages: Pasajes en orden de relevancia
+        threshold: Umbral de similitud (0-1)
+
+    Returns:
+        Pasajes conservados, en el mismo orden
+    """
+    kept: List[Tuple[Passage, set]] = []
+    for passage in passages:
+        shingles = _shingles(passage.text)
+        duplicate = False
+        for _, other in kept:
+            overlap = len(shingles & other)
+            if not overlap:
+                continue
+            jaccard = overlap / len(shingles | other)
+            containment = overlap / min(len(shingles), len(other))
+            if max(jaccard, containment) >= threshold:
+                duplicate = True
+                break
+        if duplicate:
+            telemetry.count("context_packing", result="duplicate")
+        else:
+            kept.append((passage, shingles))
+    return [passage for passage, _ in kept]
+
+# -------------------------------------------------------------------------#
+# 3. EMPAQUETADO CON PRESUPUESTO
+# -------------------------------------------------------------------------#
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Recorta un texto en el último salto de párrafo, línea o frase antes de `max_chars`."""
+    if len(text) <= max_chars:
+        return text
+    cut = 0
+    for match in _BREAK_RE.finditer(text, 0, max_chars):
+        cut = match.start()
+    if cut < max_chars // 2:
+        cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip() + TRUNCATION_MARK
+
+def pack_context(
+    docs: List[Document],
+    max_tokens: int,
+    dedup_threshold: float = 0.8
+) -> Tuple[str, List[Passage]]:
+    """
+    Construye el contexto del prompt dentro de un presupuesto de tokens.
+
+    Args:
+        docs: Chunks recuperados, ordenados por relevancia
+        max_tokens: Presupuesto de tokens del contexto (<= 0 = sin límite)
+        dedup_threshold: Umbral de casi duplicados (>= 1 = desactivado)
+
+    Returns:
+        Tupla (contexto, pasajes incluidos)
+    """
+    passages = merge_page_chunks(docs)
+    if dedup_threshold < 1:
+        passages = drop_near_duplicates(passages, dedup_threshold)
+
+    separator_tokens = estimate_tokens(PASSAGE_SEPARATOR)
+    remaining = max_tokens if max_tokens > 0 else math.inf
+    included: List[Passage] = []
+
+    for passage in passages:
+        cost = estimate_tokens(passage.render()) + (separator_tokens if included else 0)
+        if cost <= remaining:
+            included.append(passage)
+            remaining -= cost
+            continue
+
+        # El primer pasaje siempre entra (recortado); los demás solo si queda sitio útil
+        available = remaining - (separator_tokens if included else 0) - estimate_tokens(passage.header)
+        if not included or available >= MIN_TRUNCATED_TOKENS:
+            max_chars = int(max(available, MIN_TRUNCATED_TOKENS) * CHARS_PER_TOKEN) - len(TRUNCATION_MARK)
+            passage.text = _truncate(passage.text, max_chars)
+            included.append(passage)
+            telemetry.count("context_packing", result="truncated")
+        dropped = len(passages) - len(included)
+        if dropped:
+            telemetry.count("context_packing", value=dropped, result="over_budget")
+        break
+
+    return PASSAGE_SEPARATOR.join(p.render() for p in included), included
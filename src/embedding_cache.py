@@ -0,0 +1,284 @@
+# -------------------------------------------------------------------------#
+# EMBEDDING CACHE - Caché persistente de embeddings direccionada por contenido
+# -------------------------------------------------------------------------#
+
+"""
+Caché en disco de embeddings de chunks para D&D 5E
+
+Funcionalidades principales:
+• Clave = hash SHA-256 del texto del chunk + modelo de embeddings
+• Almacenamiento SQLite bajo STORAGE_DIR con vectores float32 empaquetados
+• Desalojo LRU cuando se supera el tamaño máximo configurado
+• Contadores de aciertos/fallos persistentes para `setup_db.py stats`
+"""
+
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import List, Dict, Optional, Any
+
+from langchain_core.embeddings import Embeddings
+
+# -------------------------------------------------------------------------#
+# 1. ALMACÉN SQLITE
+# -------------------------------------------------------------------------#
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def content_key(text: str, model: str) -> str:
+    """
+    Calcula la clave de caché de un texto para un modelo concreto.
+
+    Args:
+        text: Texto del chunk
+        model: Nombre del modelo de embeddings
+
+    Returns:
+        Hash SHA-256 hexadecimal de modelo + texto
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Caché persistente de vectores con límite de tamaño y desalojo LRU."""
+
+    def __init__(self, path: Path, model: str, max_bytes: int):
+        self.path = Path(path)
+        self.model = model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        self._conn.commit()
+
+    def reset_last_run(self) -> None:
+        """Reinicia los contadores de la última ingestión (al empezar una nueva)."""
+        with self._lock:
+            self._set_counter("last_hits", 0)
+            self._set_counter("last_misses", 0)
+            self._conn.commit()
+
+    def _set_counter(self, name: str, value: int) -> None:
+        self._conn.execute(
+            "INSERT INTO counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, value)
+        )
+
+    def _add_counter(self, name: str, delta: int) -> None:
+        self._conn.execute(
+            "INSERT INTO counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, delta)
+        )
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Busca varios vectores en la caché y actualiza su marca LRU.
+
+        Args:
+            keys: Claves de contenido a buscar
+
+        Returns:
+            Diccionario clave ➜ vector con los aciertos encontrados
+        """
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+
+            hits = sum(1 for key in keys if key in found)
+            misses = len(keys) - hits
+            self.hits += hits
+            self.misses += misses
+            for prefix in ("", "last_"):
+                self._add_counter(f"{prefix}hits", hits)
+                self._add_counter(f"{prefix}misses", misses)
+            self._conn.commit()
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """
+        Guarda vectores en la caché y desaloja entradas antiguas si es necesario.
+
+        Args:
+            items: Diccionario clave ➜ vector a almacenar
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (key, self.model, array("f", vector).tobytes(), now)
+            for key, vector in items.items()
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, model, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._total_bytes += sum(len(row[2]) for row in rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Elimina las entradas menos usadas hasta respetar `max_bytes`."""
+        if self.max_bytes <= 0 or self._total_bytes <= self.max_bytes:
+            return
+
+        # El total en memoria es aproximado (reemplazos); recalcular antes de borrar
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        # Liberar un 10% extra para no desalojar en cada escritura
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        cursor = self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"
+        )
+        to_delete = []
+        for key, size in cursor:
+            if self._total_bytes <= target:
+                break
+            to_delete.append((key,))
+            self._total_bytes -= size
+            evicted += 1
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+        self._add_counter("evictions", evicted)
+
+    def close(self) -> None:
+        """Cierra la conexión con la base de datos de la caché."""
+        with self._lock:
+            self._conn.close()
+
+# -------------------------------------------------------------------------#
+# 2. ENVOLTORIO DE EMBEDDINGS
+# -------------------------------------------------------------------------#
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings y sirve desde la caché los textos ya vistos.
+
+    Solo los textos que no están en caché llegan al modelo subyacente.
+    Las consultas (`embed_query`) no se cachean en disco.
+    """
+
+    def __init__(self, inner: Embeddings, cache: EmbeddingCache):
+        self.inner = inner
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [content_key(text, self.cache.model) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+# -------------------------------------------------------------------------#
+# 3. ESTADÍSTICAS
+# -------------------------------------------------------------------------#
+
+def get_embedding_cache_stats(path: Path) -> Dict[str, Any]:
+    """
+    Lee las estadísticas de la caché sin cargar ningún modelo.
+
+    Args:
+        path: Ruta del fichero SQLite de la caché
+
+    Returns:
+        Diccionario con entradas, tamaño, aciertos y fallos
+    """
+    path = Path(path)
+    if not path.exists():
+        return {"status": "no_cache"}
+
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            entries, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return {"status": "error", "error": str(e)}
+
+    def hit_rate(hits: int, misses: int) -> Optional[float]:
+        total = hits + misses
+        return hits / total if total else None
+
+    return {
+        "status": "active",
+        "entries": entries,
+        "size_bytes": total_bytes,
+        "hits": counters.get("hits", 0),
+        "misses": counters.get("misses", 0),
+        "hit_rate": hit_rate(counters.get("hits", 0), counters.get("misses", 0)),
+        "last_hits": counters.get("last_hits", 0),
+        "last_misses": counters.get("last_misses", 0),
+        "last_hit_rate": hit_rate(counters.get("last_hits", 0), counters.get("last_misses", 0)),
+        "evictions": counters.get("evictions", 0)
+    }
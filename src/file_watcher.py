@@ -0,0 +1,89 @@
+# -------------------------------------------------------------------------#
+# FILE WATCHER - Vigilancia de los ficheros Markdown con recarga diferida
+# -------------------------------------------------------------------------#
+
+"""
+Vigilancia del directorio de datos para D&D 5E
+
+Funcionalidades principales:
+• Sondeo periódico en un hilo de fondo (sin dependencias ni APIs del sistema):
+  solo se comparan tamaño y mtime de cada fichero, sin leerlos
+• Antirrebote: se espera a que los ficheros dejen de cambiar durante
+  `debounce` segundos (copias o guardados a medias) antes de avisar
+• La acción se ejecuta en el propio hilo del vigilante; los cambios que lleguen
+  mientras tanto se detectan en la siguiente comprobación
+"""
+
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import telemetry
+
+# Estado de un fichero: (tamaño, mtime_ns)
+FileState = Tuple[int, int]
+
+class DirectoryWatcher:
+    """
+    Vigila un conjunto de ficheros y llama a `on_change` cuando se estabilizan tras un cambio.
+
+    Args:
+        list_files: Devuelve las rutas vigiladas (se llama en cada comprobación)
+        on_change: Acción a ejecutar tras un cambio (p. ej. re-ingerir y recargar)
+        interval: Segundos entre comprobaciones
+        debounce: Segundos sin cambios antes de llamar a `on_change`
+    """
+
+    def __init__(self, list_files: Callable[[], List[str]], on_change: Callable[[], object],
+                 interval: float = 2.0, debounce: float = 5.0):
+        self.list_files = list_files
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> Dict[str, FileState]:
+        """Tamaño y mtime de los ficheros vigilados (los que desaparecen entre medias se omiten)."""
+        states = {}
+        for path in self.list_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            states[path] = (stat.st_size, stat.st_mtime_ns)
+        return states
+
+    def start(self) -> "DirectoryWatcher":
+        """Arranca el hilo de vigilancia (daemon: no impide cerrar el proceso)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Detiene la vigilancia; espera a que termine la acción en curso hasta `timeout` segundos."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        last = self.snapshot()
+        changed_at: Optional[float] = None
+        while not self._stop.wait(self.interval):
+            current = self.snapshot()
+            if current != last:
+                # Cada cambio reinicia la espera
+                last, changed_at = current, time.monotonic()
+                continue
+            if changed_at is None or time.monotonic() - changed_at < self.debounce:
+                continue
+            changed_at = None
+            telemetry.count("watcher_trigger")
+            try:
+                self.on_change()
+            except Exception as e:
+                telemetry.count("watcher_errors")
+                print(f"❌ Error procesando los cambios en los ficheros vigilados: {e}")
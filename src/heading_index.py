@@ -0,0 +1,185 @@
+# -------------------------------------------------------------------------#
+# HEADING INDEX - Atajo por coincidencia exacta con encabezados de sección
+# -------------------------------------------------------------------------#
+
+"""
+Índice de encabezados para D&D 5E: del título de una sección a sus chunks
+
+Funcionalidades principales:
+• Mapa hash de encabezados normalizados (sin tildes, minúsculas, en singular) ➜ chunk IDs
+• Construido al indexar a partir de `section_path`; se descartan los títulos
+  genéricos que aparecen en demasiadas secciones ("Acciones", "Nivel")
+• Detección en la consulta del encabezado más largo que nombra (reglas, estados, rasgos)
+• Indica si el encabezado cubre toda la consulta: entonces se puede responder
+  con la sección exacta sin calcular el embedding
+"""
+
+import os
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable, Any, Tuple
+
+from lexical_index import STOPWORDS
+from query_router import normalize_terms
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+INDEX_VERSION = 1
+
+# Secciones distintas a partir de las que un encabezado se considera genérico
+MAX_SECTIONS_PER_HEADING = 3
+
+# Palabras máximas de un encabezado buscado en la consulta
+MAX_HEADING_WORDS = 6
+
+# Términos (normalizados) que acompañan al nombre de una regla sin cambiar lo que se pide
+FILLER_TERMS = {
+    "regla", "explica", "explicame", "describe", "describeme", "significa", "consiste",
+    "dime", "detalle", "informacion", "definicion", "estado", "conjuro", "hechizo",
+    "rasgo", "accion", "dote", "usar", "sirve", "funcionan", "afecta", "exactamente"
+}
+
+def heading_key(heading: str) -> str:
+    """Clave de un encabezado: sin tildes, minúsculas y en singular."""
+    return " ".join(normalize_terms(heading))
+
+def _is_content_term(term: str) -> bool:
+    return len(term) > 2 and term not in STOPWORDS and term not in FILLER_TERMS
+
+# -------------------------------------------------------------------------#
+# 2. CONSTRUCCIÓN (al indexar)
+# -------------------------------------------------------------------------#
+
+def build_heading_table(metadatas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Construye el índice de encabezados a partir de los metadatos de los chunks.
+
+    Cada chunk se asocia al último encabezado de su `section_path` (la
+    sección a la que pertenece). Los encabezados presentes en más de
+    MAX_SECTIONS_PER_HEADING secciones no se indexan.
+
+    Args:
+        metadatas: Metadatos de los chunks (`chunk_id`, `document_name`, `page_number`, `section_path`)
+
+    Returns:
+        Índice serializable: encabezado normalizado ➜ secciones y chunk IDs en orden de página
+    """
+    entries: Dict[str, Dict[Tuple[str, str], List[Tuple[int, str]]]] = {}
+    for metadata in metadatas:
+        chunk_id = (metadata or {}).get("chunk_id")
+        section_path = metadata.get("section_path", "") if chunk_id else ""
+        if not section_path:
+            continue
+        key = heading_key(section_path.split(" > ")[-1])
+        if not key or (" " not in key and not _is_content_term(key)):
+            continue
+        section = (metadata.get("document_name", ""), section_path)
+        entries.setdefault(key, {}).setdefault(section, []).append(
+            (int(metadata.get("page_number") or 0), chunk_id)
+        )
+
+    headings = {}
+    for key, sections in sorted(entries.items()):
+        if len(sections) > MAX_SECTIONS_PER_HEADING:
+            continue
+        ordered = sorted(sections.items(), key=lambda item: (item[0][0], min(item[1])[0]))
+        headings[key] = {
+            "sections": [list(section) for section, _ in ordered],
+            "chunk_ids": [chunk_id for _, chunks in ordered for _, chunk_id in sorted(chunks)]
+        }
+    return {"version": INDEX_VERSION, "headings": headings}
+
+def save_heading_table(table: Dict[str, Any], path: Path) -> None:
+    """Guarda el índice de forma atómica (fichero temporal + rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# -------------------------------------------------------------------------#
+# 3. CONSULTAS
+# -------------------------------------------------------------------------#
+
+@dataclass
+class HeadingMatch:
+    """Encabezados nombrados en la consulta y sus chunks (en orden de página)."""
+    headings: List[str] = field(default_factory=list)
+    chunk_ids: List[str] = field(default_factory=list)
+    complete: bool = False  # los encabezados cubren todos los términos de contenido
+
+class HeadingIndex:
+    """
+    Mapa de encabezados en memoria.
+
+    El índice se relee cuando cambia el fichero (p. ej. tras una ingestión
+    desde `setup_db.py`), igual que el vocabulario del enrutador.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._mtime = -1
+        self._headings: Dict[str, Dict[str, Any]] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._headings = -1, {}
+            return self._headings
+        if mtime != self._mtime:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    table = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                table = {}
+            headings = table.get("headings", {}) if table.get("version") == INDEX_VERSION else {}
+            self._mtime, self._headings = mtime, headings
+        return self._headings
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def lookup(self, heading: str) -> List[str]:
+        """Chunk IDs de la sección con ese título (lista vacía si no existe o es genérico)."""
+        entry = self._load().get(heading_key(heading))
+        return list(entry["chunk_ids"]) if entry else []
+
+    def match(self, query: str) -> Optional[HeadingMatch]:
+        """
+        Busca en la consulta los encabezados indexados (el más largo primero, sin solaparse).
+
+        Args:
+            query: Pregunta del usuario
+
+        Returns:
+            HeadingMatch, o None si la consulta no nombra ninguna sección
+        """
+        headings = self._load()
+        terms = normalize_terms(query)
+        used = [False] * len(terms)
+        result = HeadingMatch()
+        for n in range(min(MAX_HEADING_WORDS, len(terms)), 0, -1):
+            for i in range(len(terms) - n + 1):
+                if any(used[i:i + n]):
+                    continue
+                phrase = " ".join(terms[i:i + n])
+                entry = headings.get(phrase)
+                if entry is None or (n == 1 and not _is_content_term(phrase)):
+                    continue
+                result.headings.append(phrase)
+                used[i:i + n] = [True] * n
+
+        result.complete = all(used[i] or not _is_content_term(term) for i, term in enumerate(terms))
+        # Si la consulta pide algo más, una palabra suelta ("desafío") es poca evidencia
+        if not result.complete:
+            result.headings = [heading for heading in result.headings if " " in heading]
+        if not result.headings:
+            return None
+        for heading in result.headings:
+            result.chunk_ids.extend(cid for cid in headings[heading]["chunk_ids"] if cid not in result.chunk_ids)
+        return result
@@ -0,0 +1,297 @@
+# -------------------------------------------------------------------------#
+# LEXICAL INDEX - Índice léxico persistente (SQLite FTS5 / BM25)
+# -------------------------------------------------------------------------#
+
+"""
+Índice léxico de chunks para búsquedas exactas de términos de D&D 5E
+
+Funcionalidades principales:
+• Tabla FTS5 con tokenizador unicode61 y plegado de acentos (dragón = dragon)
+• Ranking BM25 con más peso para la ruta de secciones (nombres de conjuros, estados...)
+• Altas, bajas y reconstrucción incremental sincronizadas con Chroma
+• Filtro opcional por document_name
+"""
+
+import re
+import json
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Iterable, Any
+
+from langchain_core.documents import Document
+
+import telemetry
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    rowid INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    document_name TEXT NOT NULL,
+    section_path TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_name);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    content,
+    section_path,
+    content='chunks',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, content, section_path)
+    VALUES (new.rowid, new.content, new.section_path);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, content, section_path)
+    VALUES ('delete', old.rowid, old.content, old.section_path);
+END;
+"""
+
+# Pesos BM25 por columna: (content, section_path)
+_BM25_WEIGHTS = (1.0, 3.0)
+
+# Palabras vacías en español que no aportan a la búsqueda léxica
+STOPWORDS = frozenset("""
+a al algo como con cual cuales cuando de del donde el ella ellos en entre es esta
+este esto hay la las le les lo los mas me mi mucho muy no o otra otro para pero
+por puede que quien se si sin sobre son su sus tiene un una uno unos y ya yo
+cuanto cuantos cuanta cuantas funciona hace hacer
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def fold_accents(text: str) -> str:
+    """
+    Normaliza un texto a minúsculas y sin diacríticos ("Bola de Fuego" ➜ "bola de fuego").
+
+    Args:
+        text: Texto a normalizar
+
+    Returns:
+        Texto en minúsculas sin tildes ni diéresis
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Convierte una pregunta en una expresión MATCH de FTS5.
+
+    Los términos se citan (sin operadores de FTS5) y se combinan con OR para
+    que BM25 premie los chunks que contienen más términos de la consulta.
+
+    Args:
+        query: Pregunta del usuario
+
+    Returns:
+        Expresión MATCH o None si no quedan términos útiles
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(fold_accents(query)):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if token not in terms:
+            terms.append(token)
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+# -------------------------------------------------------------------------#
+# 2. ÍNDICE
+# -------------------------------------------------------------------------#
+
+class LexicalIndex:
+    """Índice BM25 persistente sobre los chunks indexados en Chroma."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def upsert(self, documents: Iterable[Document]) -> None:
+        """
+        Inserta o reemplaza chunks en el índice.
+
+        Args:
+            documents: Chunks con metadato `chunk_id`
+        """
+        rows = [
+            (
+                doc.metadata["chunk_id"],
+                doc.metadata.get("document_name", ""),
+                doc.metadata.get("section_path", ""),
+                doc.page_content,
+                json.dumps(doc.metadata, ensure_ascii=False)
+            )
+            for doc in documents
+        ]
+        if not rows:
+            return
+
+        with self._lock, telemetry.span("lexical_write"):
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(row[0],) for row in rows])
+            self._conn.executemany(
+                "INSERT INTO chunks(chunk_id, document_name, section_path, content, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        """Elimina chunks del índice por ID."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(cid,) for cid in chunk_ids])
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Vacía el índice."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+            self._conn.commit()
+
+    def count(self) -> int:
+        """Número de chunks en el índice."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        document_names: Optional[List[str]] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Busca los k chunks con mejor puntuación BM25.
+
+        Args:
+            query: Pregunta del usuario
+            k: Número máximo de resultados
+            document_names: Restringe la búsqueda a estos documentos
+
+        Returns:
+            Lista de (Document, puntuación) ordenada de mejor a peor
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+
+        sql = (
+            "SELECT c.chunk_id, c.content, c.metadata, "
+            f"bm25(chunks_fts, {_BM25_WEIGHTS[0]}, {_BM25_WEIGHTS[1]}) AS score "
+            "FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if document_names:
+            sql += f" AND c.document_name IN ({','.join('?' * len(document_names))})"
+            params.extend(document_names)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(k)
+
+        with self._lock, telemetry.span("lexical_search"):
+            try:
+                rows = self._conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"⚠️  Error en búsqueda léxica: {e}")
+                return []
+
+        # bm25() devuelve valores negativos: más negativo = más relevante
+        return [
+            (Document(page_content=content, metadata=json.loads(metadata), id=chunk_id), -score)
+            for chunk_id, content, metadata, score in rows
+        ]
+
+    def get_documents(self, chunk_ids: List[str]) -> List[Document]:
+        """
+        Recupera chunks por ID (búsqueda por clave, sin BM25).
+
+        Args:
+            chunk_ids: IDs de chunk
+
+        Returns:
+            Chunks en el orden pedido (se omiten los IDs desconocidos)
+        """
+        if not chunk_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(chunk_ids))})",
+                list(chunk_ids)
+            ).fetchall()
+        found = {chunk_id: (content, metadata) for chunk_id, content, metadata in rows}
+        return [
+            Document(page_content=found[chunk_id][0], metadata=json.loads(found[chunk_id][1]), id=chunk_id)
+            for chunk_id in chunk_ids if chunk_id in found
+        ]
+
+    def snapshot(self, path: Path) -> "LexicalIndex":
+        """
+        Copia el índice en `path` con la API de backup de SQLite y abre la copia.
+
+        La copia no cambia con las ingestiones posteriores, así que un retriever
+        que la use sigue viendo los mismos chunks que su índice vectorial.
+
+        Args:
+            path: Fichero de destino (se sobrescribe si existe)
+
+        Returns:
+            LexicalIndex abierto sobre la copia
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        target = sqlite3.connect(str(path))
+        try:
+            with self._lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+        return LexicalIndex(path)
+
+    def close(self) -> None:
+        """Cierra la conexión con el índice."""
+        with self._lock:
+            self._conn.close()
+
+# -------------------------------------------------------------------------#
+# 3. FUSIÓN DE RANKINGS
+# -------------------------------------------------------------------------#
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Fusiona varias listas ordenadas con Reciprocal Rank Fusion.
+
+    La puntuación de cada chunk es la suma de 1 / (rrf_k + posición) en cada
+    lista en la que aparece. Los chunks se identifican por su `chunk_id`.
+
+    Args:
+        rankings: Listas de documentos ordenadas por relevancia
+        rrf_k: Constante de suavizado de RRF
+
+    Returns:
+        Lista de (Document, puntuación RRF) ordenada de mejor a peor
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+
+    for ranking in rankings:
+        for position, doc in enumerate(ranking, 1):
+            key = doc.metadata.get("chunk_id") or doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + position)
+            documents.setdefault(key, doc)
+
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(documents[key], score) for key, score in ordered]
@@ -0,0 +1,364 @@
+# -------------------------------------------------------------------------#
+# MMAP INDEX - Índice vectorial en memoria mapeada (float16 / int8)
+# -------------------------------------------------------------------------#
+
+"""
+Backend vectorial alternativo a Chroma para D&D 5E
+
+Funcionalidades principales:
+• Matriz de embeddings cuantizada (int8 por fila o float16) en ficheros .npy mapeados
+• Tabla compacta de chunks (JSON lines + offsets) con acceso aleatorio por fila
+• Búsqueda por fuerza bruta en bloques con NumPy y re-puntuación exacta en float32
+• Filas agrupadas por documento: el filtro por document_name solo recorre sus filas
+• Versiones inmutables con puntero CURRENT: se reconstruye sin cortar a los lectores
+• Apertura en milisegundos; la caché de páginas del SO se comparte entre procesos
+"""
+
+import os
+import json
+import mmap
+import time
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Tuple, Iterable
+
+import numpy as np
+from langchain_core.documents import Document
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+INDEX_VERSION = 1
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+SCAN_DTYPES = ("int8", "float16")
+
+# Filas por bloque al recorrer la matriz (acota la memoria temporal por consulta)
+BLOCK_ROWS = 8192
+
+# Una fila del índice: (chunk_id, texto, metadatos, embedding)
+Record = Tuple[str, str, Dict[str, Any], List[float]]
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cuantiza cada fila a int8 con una escala simétrica propia.
+
+    Args:
+        vectors: Matriz float32 (n, d)
+
+    Returns:
+        Tupla (matriz int8, escalas float32 por fila)
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+# -------------------------------------------------------------------------#
+# 2. CONSTRUCCIÓN
+# -------------------------------------------------------------------------#
+
+def read_current(root: Path) -> Optional[Path]:
+    """Directorio de la versión activa del índice (None si no se ha construido)."""
+    try:
+        name = (Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    path = Path(root) / name
+    return path if (path / MANIFEST_FILE).exists() else None
+
+def read_manifest(root: Path) -> Dict[str, Any]:
+    """Manifiesto de la versión activa (vacío si no hay índice)."""
+    path = read_current(root)
+    if path is None:
+        return {}
+    with open(path / MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def build_mmap_index(
+    records: Iterable[Record],
+    root: Path,
+    dtype: str = "int8",
+    generation: int = 0,
+    embeddings_model: str = ""
+) -> Dict[str, Any]:
+    """
+    Construye una nueva versión del índice y la activa de forma atómica.
+
+    La versión se escribe en su propio directorio y después se reemplaza
+    el puntero CURRENT; los procesos que tengan mapeada la versión anterior
+    siguen leyéndola hasta que recargan.
+
+    Args:
+        records: Filas (chunk_id, texto, metadatos, embedding)
+        root: Directorio raíz del índice
+        dtype: "int8" o "float16" para la matriz de búsqueda
+        generation: Generación del índice de chunks que refleja
+        embeddings_model: Modelo de embeddings (para detectar incompatibilidades)
+
+    Returns:
+        Manifiesto de la versión creada
+
+    Raises:
+        ValueError: Si el tipo de la matriz no está soportado
+    """
+    if dtype not in SCAN_DTYPES:
+        raise ValueError(f"Tipo de índice no soportado: {dtype!r} (usa {' o '.join(SCAN_DTYPES)})")
+
+    # Agrupar por documento para que el filtro por libro recorra un rango contiguo
+    by_document: Dict[str, List[Record]] = {}
+    for record in records:
+        by_document.setdefault(record[2].get("document_name", ""), []).append(record)
+    ordered = [record for name in sorted(by_document) for record in by_document[name]]
+
+    root = Path(root)
+    name = f"v{generation}-{time.time_ns()}"
+    path = root / name
+    path.mkdir(parents=True, exist_ok=True)
+
+    dim = len(ordered[0][3]) if ordered else 0
+    vectors = _normalize(np.asarray([r[3] for r in ordered], dtype=np.float32).reshape(len(ordered), dim))
+    np.save(path / "vectors.npy", vectors)
+    if dtype == "int8":
+        quantized, scales = quantize_int8(vectors)
+        np.save(path / "scan.npy", quantized)
+        np.save(path / "scales.npy", scales)
+    else:
+        np.save(path / "scan.npy", vectors.astype(np.float16))
+
+    offsets = [0]
+    with open(path / "records.jsonl", "wb") as f:
+        for chunk_id, text, metadata, _ in ordered:
+            line = json.dumps({"id": chunk_id, "text": text, "metadata": metadata},
+                              ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(path / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+    id_width = max((len(r[0].encode("utf-8")) for r in ordered), default=1)
+    np.save(path / "ids.npy", np.asarray([r[0].encode("utf-8") for r in ordered], dtype=f"S{id_width}"))
+
+    documents, start = {}, 0
+    for doc_name in sorted(by_document):
+        documents[doc_name] = [start, start + len(by_document[doc_name])]
+        start += len(by_document[doc_name])
+
+    manifest = {
+        "version": INDEX_VERSION,
+        "dtype": dtype,
+        "count": len(ordered),
+        "dim": dim,
+        "generation": generation,
+        "embeddings_model": embeddings_model,
+        "documents": documents
+    }
+    with open(path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    # Activar la nueva versión y borrar las anteriores
+    tmp_current = root / f"{CURRENT_FILE}.tmp"
+    tmp_current.write_text(name, encoding="utf-8")
+    os.replace(tmp_current, root / CURRENT_FILE)
+    for old in root.iterdir():
+        if old.is_dir() and old.name != name:
+            shutil.rmtree(old, ignore_errors=True)
+
+    return manifest
+
+# -------------------------------------------------------------------------#
+# 3. BÚSQUEDA
+# -------------------------------------------------------------------------#
+
+@dataclass
+class IndexSnapshot:
+    """
+    Una versión del índice abierta: manifiesto y ficheros mapeados.
+
+    No se modifica tras abrirse (salvo el mapa de IDs, que se crea bajo
+    demanda); una recarga crea otra instantánea y la publica con una sola
+    asignación, así que cada búsqueda trabaja con una versión coherente.
+    """
+    manifest: Dict[str, Any]
+    vectors: np.ndarray
+    scan: np.ndarray
+    scales: Optional[np.ndarray]
+    offsets: np.ndarray
+    ids: np.ndarray
+    records: Any
+    current_mtime: int
+    _rows: Optional[Dict[str, int]] = field(default=None, repr=False)
+
+    @classmethod
+    def open(cls, root: Path) -> "IndexSnapshot":
+        """Abre la versión a la que apunta CURRENT."""
+        current_mtime = (root / CURRENT_FILE).stat().st_mtime_ns
+        path = read_current(root)
+        if path is None:
+            raise FileNotFoundError(f"Índice mmap no encontrado en {root}")
+
+        with open(path / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        with open(path / "records.jsonl", "rb") as f:
+            records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b""
+        return cls(
+            manifest=manifest,
+            vectors=np.load(path / "vectors.npy", mmap_mode="r"),
+            scan=np.load(path / "scan.npy", mmap_mode="r"),
+            scales=np.load(path / "scales.npy", mmap_mode="r") if manifest["dtype"] == "int8" else None,
+            offsets=offsets,
+            ids=np.load(path / "ids.npy", mmap_mode="r"),
+            records=records,
+            current_mtime=current_mtime
+        )
+
+    def record(self, row: int) -> Document:
+        data = json.loads(self.records[int(self.offsets[row]):int(self.offsets[row + 1])])
+        return Document(page_content=data["text"], metadata=data["metadata"], id=data["id"])
+
+    def rows(self, chunk_ids: List[str]) -> Dict[str, int]:
+        """Fila de cada chunk ID conocido, en el orden pedido."""
+        if self._rows is None:
+            self._rows = {chunk_id.decode("utf-8"): row for row, chunk_id in enumerate(self.ids)}
+        return {chunk_id: self._rows[chunk_id] for chunk_id in chunk_ids if chunk_id in self._rows}
+
+class MmapVectorIndex:
+    """
+    Índice vectorial de solo lectura sobre ficheros mapeados en memoria.
+
+    Expone `embeddings` como los vector stores de LangChain para que los
+    retrievers calculen el embedding de la consulta. Se recarga solo si
+    cambia el puntero CURRENT (p. ej. tras una ingestión en otro proceso);
+    con `auto_reload=False` se queda en la versión abierta al crearlo.
+    Cada llamada toma una única referencia a la instantánea vigente, así que
+    es seguro usarlo desde varios hilos mientras otro recarga.
+    """
+
+    def __init__(self, root: Path, embeddings: Any = None, rescore_factor: int = 4, auto_reload: bool = True):
+        self.root = Path(root)
+        self.embeddings = embeddings
+        self.rescore_factor = max(1, rescore_factor)
+        self.auto_reload = auto_reload
+        self._snapshot = IndexSnapshot.open(self.root)
+
+    def _current(self) -> IndexSnapshot:
+        """Instantánea vigente; se abre la nueva versión si ha cambiado CURRENT."""
+        snapshot = self._snapshot
+        if not self.auto_reload:
+            return snapshot
+        try:
+            mtime = (self.root / CURRENT_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return snapshot
+        if mtime != snapshot.current_mtime:
+            try:
+                snapshot = self._snapshot = IndexSnapshot.open(self.root)
+            except (FileNotFoundError, ValueError):
+                pass  # versión a medio borrar: se sigue con la mapeada
+        return snapshot
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        return self._snapshot.manifest
+
+    def __len__(self) -> int:
+        return int(self.manifest["count"])
+
+    @property
+    def generation(self) -> int:
+        return int(self.manifest.get("generation", 0))
+
+    @staticmethod
+    def _scan_scores(snapshot: IndexSnapshot, start: int, end: int, query: np.ndarray) -> np.ndarray:
+        """Similitud aproximada (matriz cuantizada) de las filas [start, end) con la consulta."""
+        scores = np.empty(end - start, dtype=np.float32)
+        for block in range(start, end, BLOCK_ROWS):
+            stop = min(block + BLOCK_ROWS, end)
+            # Producto acumulado en float32 sin copia intermedia de la matriz
+            # (convertir el bloque con astype es varias veces más lento)
+            block_scores = np.einsum("ij,j->i", snapshot.scan[block:stop], query, dtype=np.float32, casting="unsafe")
+            if snapshot.scales is not None:
+                block_scores *= snapshot.scales[block:stop]
+            scores[block - start:stop - start] = block_scores
+        return scores
+
+    def search(
+        self,
+        query_vector: List[float],
+        k: int,
+        document_names: Optional[List[str]] = None,
+        with_vectors: bool = False
+    ) -> Tuple[List[Document], Optional[np.ndarray]]:
+        """
+        Busca los k chunks más similares (coseno).
+
+        Recorre la matriz cuantizada, toma `k * rescore_factor` candidatos y
+        los re-puntúa con los vectores float32 exactos.
+
+        Args:
+            query_vector: Embedding de la consulta
+            k: Número de resultados
+            document_names: Restringe la búsqueda a estos documentos
+            with_vectors: Devuelve también los vectores (float32) de los resultados
+
+        Returns:
+            Tupla (chunks ordenados por similitud, vectores o None)
+        """
+        snapshot = self._current()
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+
+        documents = snapshot.manifest["documents"]
+        if document_names:
+            ranges = [documents[name] for name in document_names if name in documents]
+        else:
+            ranges = [[0, int(snapshot.manifest["count"])]]
+        ranges = [(start, end) for start, end in ranges if end > start]
+        if not ranges or k <= 0:
+            return [], (np.empty((0, snapshot.manifest["dim"]), dtype=np.float32) if with_vectors else None)
+
+        scores = np.concatenate([self._scan_scores(snapshot, start, end, query) for start, end in ranges])
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+
+        n_candidates = min(len(scores), k * self.rescore_factor)
+        top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        candidates = np.sort(rows[top])  # lecturas en orden sobre el mmap
+
+        exact = np.asarray(snapshot.vectors[candidates], dtype=np.float32) @ query
+        chosen = candidates[np.argsort(-exact, kind="stable")[:k]]
+
+        docs = [snapshot.record(row) for row in chosen]
+        vectors = np.asarray(snapshot.vectors[chosen], dtype=np.float32) if with_vectors else None
+        return docs, vectors
+
+    def get_documents(self, chunk_ids: List[str]) -> List[Document]:
+        """
+        Chunks indicados, leídos de los registros mapeados.
+
+        Args:
+            chunk_ids: IDs de chunk
+
+        Returns:
+            Chunks en el orden pedido (se omiten los IDs desconocidos)
+        """
+        snapshot = self._current()
+        return [snapshot.record(row) for row in snapshot.rows(chunk_ids).values()]
+
+    def get_vectors(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Vectores float32 de los chunks indicados.
+
+        Args:
+            chunk_ids: IDs de chunk
+
+        Returns:
+            Diccionario chunk_id ➜ vector (se omiten los IDs desconocidos)
+        """
+        snapshot = self._current()
+        return {chunk_id: np.asarray(snapshot.vectors[row], dtype=np.float32)
+                for chunk_id, row in snapshot.rows(chunk_ids).items()}
@@ -0,0 +1,620 @@
+# -------------------------------------------------------------------------#
+# MONSTER INDEX - Tabla estructurada de bloques de estadísticas
+# -------------------------------------------------------------------------#
+
+"""
+Índice de monstruos para D&D 5E construido a partir de sus bloques de estadísticas
+
+Funcionalidades principales:
+• Extrae nombre, tipo, CA, PG, velocidad, características y VD de cada bloque
+  (Markdown, tablas Markdown y tablas HTML del texto convertido)
+• Tabla compacta en JSON, cargada en memoria: búsquedas por nombre y filtros en µs
+• Detección en la consulta de nombres de monstruo y de filtros (VD, CA, tipo)
+• Documentos listos para el contexto: el bloque exacto o una tabla de resultados
+"""
+
+import os
+import re
+import json
+import html
+from dataclasses import dataclass, field, asdict
+from fractions import Fraction
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Iterable, Tuple
+
+from langchain_core.documents import Document
+
+from lexical_index import fold_accents
+from query_router import normalize_terms, BOOK_LEXICON, MONSTER_MANUAL
+import telemetry
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+INDEX_VERSION = 1
+
+# Longitud máxima (caracteres) del texto de rasgos y acciones que acompaña al bloque
+MAX_BLOCK_CHARS = 2500
+
+# Líneas máximas entre "Clase de Armadura" y "Desafío" en un bloque
+BLOCK_MAX_LINES = 60
+
+# Longitud máxima de la línea con el nombre del monstruo
+MAX_NAME_CHARS = 60
+
+# Encabezados de las partes de un bloque: en maquetaciones a dos columnas
+# pueden quedar justo encima de la línea de tipo, pero nunca son el nombre
+BLOCK_HEADINGS = {"acciones", "reacciones", "acciones legendarias", "rasgos", "acciones de guarida"}
+
+# Palabras máximas de un nombre de monstruo buscado en la consulta
+MAX_NAME_WORDS = 5
+
+# Nombres en inglés habituales en mesa ➜ nombre en el Monster Manual
+ALIASES = {
+    "beholder": "contemplador",
+    "mind flayer": "azotamentes",
+    "owlbear": "oso lechuza",
+    "displacer beast": "bestia desplazadora",
+    "lich": "liche",
+    "no muerto": "muerto viviente",
+}
+
+CHARACTERISTICS = ("FUE", "DES", "CON", "INT", "SAB", "CAR")
+SIZES = ("diminut", "pequeñ", "median", "grande", "enorme", "gargant[uú]esc")
+
+# Tipos de criatura (raíz sin tildes ➜ nombre mostrado)
+CREATURE_TYPES = {
+    "aberracion": "aberración",
+    "bestia": "bestia",
+    "celestial": "celestial",
+    "cieno": "cieno",
+    "constructo": "constructo",
+    "dragon": "dragón",
+    "elemental": "elemental",
+    "feerico": "feérico",
+    "gigante": "gigante",
+    "humanoide": "humanoide",
+    "infernal": "infernal",
+    "monstruosidad": "monstruosidad",
+    "muerto viviente": "muerto viviente",
+    "planta": "planta",
+}
+
+# Encabezados que siguen formando parte del bloque de estadísticas
+BLOCK_SECTIONS = {"acciones", "acciones legendarias", "reacciones", "acciones adicionales"}
+
+_TAG_RE = re.compile(r"<br\s*/?>|</?(?:td|th|tr)[^>]*>", re.IGNORECASE)
+_OTHER_TAG_RE = re.compile(r"<[^>]+>")
+_SPACES_RE = re.compile(r"[ \t]+")
+_AC_RE = re.compile(r"Clase de Armadura\s*:?\s*(\d+)\s*(\([^)]*\))?")
+_HP_RE = re.compile(r"Puntos de golpe\s*:?\s*(\d+)\s*(\([^)]*\))?")
+_SPEED_RE = re.compile(
+    r"Velocidad\s*:?\s*(.+?)\s*(?=\bFUE\b|Puntos de golpe|Clase de Armadura|Tiradas|Habilidades|Sentidos|$)"
+)
+_CR_RE = re.compile(r"Desaf[íi]o\s*:?\s*(\d+(?:/\d+)?)\s*\(\s*([\d.,]+)\s*PX")
+_SCORES_RE = re.compile(r"FUE\s+DES\s+CON\s+INT\s+SAB\s+CAR")
+_SCORE_RE = re.compile(r"(\d+)\s*\(\s*[+\-−–]?\s*\d+\s*\)")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+_TYPE_RE = re.compile(
+    r"^(?P<type>[A-Za-zÁÉÍÓÚÑáéíóúñü ]+?)\s+(?P<size>(?:%s)\w*)(?P<rest>[^,\n]*),\s*(?P<alignment>[^\n|]+)$"
+    % "|".join(SIZES),
+    re.IGNORECASE
+)
+_NOISE_RE = re.compile(r"^[\s\-:|*#_—]*$")
+
+def _clean_line(line: str) -> str:
+    """Quita marcas de formato (negritas, cursivas, celdas) de una línea; conserva los encabezados."""
+    line = _SPACES_RE.sub(" ", line.replace("*", "").replace("_", " ")).strip()
+    heading = _HEADING_RE.match(line)
+    return f"# {heading.group(2).strip()}" if heading else line
+
+def _flatten(text: str) -> List[str]:
+    """
+    Convierte tablas Markdown/HTML en líneas de texto plano.
+
+    Cada celda queda en su propia línea, así "Clase de Armadura:" y su valor
+    quedan contiguos sea cual sea el formato de origen.
+    """
+    text = html.unescape(text).replace("\t", " ")
+    text = _TAG_RE.sub("\n", text)
+    text = _OTHER_TAG_RE.sub("", text)
+    lines = []
+    for raw in text.split("\n"):
+        for cell in raw.split("|"):
+            cell = _clean_line(cell)
+            if cell and not _NOISE_RE.match(cell):
+                lines.append(cell)
+    return lines
+
+def _display_name(name: str) -> str:
+    name = name.strip(" .:")
+    return name.capitalize() if name.isupper() else name
+
+def name_key(name: str) -> str:
+    """Clave de búsqueda de un nombre: sin tildes, minúsculas y en singular."""
+    return " ".join(normalize_terms(name))
+
+def parse_cr(value: str) -> float:
+    """Valor de desafío como número ("1/4" ➜ 0.25)."""
+    return float(Fraction(value))
+
+# -------------------------------------------------------------------------#
+# 2. EXTRACCIÓN DE BLOQUES
+# -------------------------------------------------------------------------#
+
+@dataclass
+class Monster:
+    """Fila de la tabla de monstruos."""
+    name: str
+    creature_type: str
+    size: str
+    alignment: str
+    armor_class: int
+    armor_note: str
+    hit_points: int
+    hit_dice: str
+    speed: str
+    challenge: str
+    challenge_value: float
+    xp: int
+    scores: Dict[str, int]
+    document_name: str
+    page_number: int
+    text: str = ""
+    aliases: List[str] = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        return name_key(self.name)
+
+    def summary(self) -> str:
+        """Línea de tabla: nombre, tipo, CA, PG, VD y página."""
+        return (f"{self.name} | {self.creature_type} {self.size} | CA {self.armor_class} | "
+                f"PG {self.hit_points} | VD {self.challenge} | pág. {self.page_number}")
+
+    def render(self) -> str:
+        """Bloque de estadísticas normalizado, seguido de rasgos y acciones."""
+        scores = " · ".join(f"{name} {self.scores[name]}" for name in CHARACTERISTICS if name in self.scores)
+        header = self.name.upper()
+        if self.creature_type:
+            header += f" — {self.creature_type} {self.size}, {self.alignment}"
+        lines = [
+            header,
+            f"Clase de Armadura: {self.armor_class}{f' {self.armor_note}' if self.armor_note else ''}",
+            f"Puntos de golpe: {self.hit_points}{f' {self.hit_dice}' if self.hit_dice else ''}",
+            f"Velocidad: {self.speed}",
+        ]
+        if scores:
+            lines.append(scores)
+        lines.append(f"Desafío: {self.challenge} ({self.xp} PX)")
+        if self.text:
+            lines.append("")
+            lines.append(self.text)
+        return "\n".join(lines)
+
+def _find_header(lines: List[str], ac_line: int, floor: int) -> Tuple[Optional[str], Optional[re.Match], int]:
+    """
+    Busca hacia atrás la línea de tipo ("Humanoide Mediano (goblinoide), neutral malvado")
+    y el nombre que la precede.
+
+    Returns:
+        Tupla (nombre, coincidencia de la línea de tipo, índice de la línea del nombre)
+    """
+    for i in range(ac_line - 1, max(ac_line - 8, floor - 1), -1):
+        match = _TYPE_RE.match(lines[i])
+        if match is None:
+            continue
+        for j in range(i - 1, max(i - 4, floor - 1), -1):
+            candidate = lines[j].lstrip("# ")
+            if fold_accents(candidate).lower().strip(" .*") in BLOCK_HEADINGS:
+                continue
+            if candidate and not _TYPE_RE.match(candidate) and len(candidate) <= MAX_NAME_CHARS:
+                return _display_name(candidate), match, j
+        return None, match, i
+
+    # Sin línea de tipo: vale un nombre en mayúsculas justo encima del bloque
+    candidate = lines[ac_line - 1].lstrip("# ") if ac_line > floor else ""
+    if candidate.isupper() and len(candidate) <= MAX_NAME_CHARS:
+        return _display_name(candidate), None, ac_line - 1
+    return None, None, ac_line
+
+def _block_end(lines: List[str], start: int) -> Optional[Tuple[int, str]]:
+    """Línea en la que termina la cabecera del bloque (la del Desafío) y su texto unido."""
+    for end in range(start, min(start + BLOCK_MAX_LINES, len(lines))):
+        if "PX" in lines[end]:
+            block = " ".join(lines[start:end + 1])
+            if _CR_RE.search(block):
+                return end, block
+    return None
+
+def _block_text(lines: List[str], start: int, end: int) -> str:
+    """Rasgos y acciones tras la línea de Desafío, hasta un encabezado ajeno al bloque."""
+    kept, size = [], 0
+    for line in lines[start:end]:
+        if line.startswith("# "):
+            if fold_accents(line[2:]).lower() not in BLOCK_SECTIONS:
+                break
+            line = line[2:].upper()
+        if size + len(line) > MAX_BLOCK_CHARS:
+            kept.append("[…]")
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept)
+
+def _parse_block(block: str, name: str, type_match: Optional[re.Match], document_name: str,
+                 page_number: int) -> Optional[Monster]:
+    ac, hp, cr = _AC_RE.search(block), _HP_RE.search(block), _CR_RE.search(block)
+    if ac is None or hp is None or cr is None:
+        return None
+
+    speed = _SPEED_RE.search(block)
+    scores = {}
+    header = _SCORES_RE.search(block)
+    if header:
+        values = _SCORE_RE.findall(block[header.end():])[:len(CHARACTERISTICS)]
+        if len(values) == len(CHARACTERISTICS):
+            scores = dict(zip(CHARACTERISTICS, map(int, values)))
+
+    creature_type = size = alignment = ""
+    if type_match is not None:
+        subtype = type_match.group("rest").strip()
+        creature_type = type_match.group("type").strip()
+        if subtype.startswith("("):
+            creature_type = f"{creature_type} {subtype}"
+        size = type_match.group("size").lower()
+        alignment = type_match.group("alignment").strip()
+
+    return Monster(
+        name=name,
+        creature_type=creature_type,
+        size=size,
+        alignment=alignment,
+        armor_class=int(ac.group(1)),
+        armor_note=ac.group(2) or "",
+        hit_points=int(hp.group(1)),
+        hit_dice=hp.group(2) or "",
+        speed=speed.group(1).strip(" ,") if speed else "",
+        challenge=cr.group(1),
+        challenge_value=parse_cr(cr.group(1)),
+        xp=int(re.sub(r"[.,]", "", cr.group(2))),
+        scores=scores,
+        document_name=document_name,
+        page_number=page_number
+    )
+
+def parse_stat_blocks(pages: List[str], document_name: str, first_page: int = 1) -> List[Monster]:
+    """
+    Extrae los bloques de estadísticas de las páginas de un documento.
+
+    Un bloque empieza en "Clase de Armadura" y su cabecera termina en
+    "Desafío: N (X PX)"; el nombre y el tipo se buscan en las líneas
+    anteriores, y los rasgos y acciones en las siguientes.
+
+    Args:
+        pages: Páginas lógicas del documento (separadas por '---')
+        document_name: Nombre del documento
+        first_page: Número de la primera página
+
+    Returns:
+        Monstruos encontrados, en orden de aparición
+    """
+    monsters = []
+    for offset, page in enumerate(pages):
+        if "Clase de Armadura" not in page:
+            continue
+        lines = _flatten(page)
+        found: List[Tuple[Monster, int, int]] = []  # (monstruo, línea del nombre, fin de la cabecera)
+        floor = 0
+        for i, line in enumerate(lines):
+            if not line.startswith("Clase de Armadura") or i < floor:
+                continue
+            name, type_match, name_line = _find_header(lines, i, floor)
+            end = _block_end(lines, i)
+            if name is None or end is None:
+                continue
+            monster = _parse_block(end[1], name, type_match, document_name, first_page + offset)
+            if monster is not None:
+                found.append((monster, name_line, end[0]))
+                floor = end[0] + 1
+
+        for n, (monster, _, header_end) in enumerate(found):
+            next_start = found[n + 1][1] if n + 1 < len(found) else len(lines)
+            monster.text = _block_text(lines, header_end + 1, next_start)
+            monsters.append(monster)
+
+    return monsters
+
+# -------------------------------------------------------------------------#
+# 3. TABLA PERSISTENTE
+# -------------------------------------------------------------------------#
+
+def build_monster_table(monsters: Iterable[Monster]) -> Dict[str, Any]:
+    """
+    Construye la tabla serializable de monstruos.
+
+    Si un nombre aparece en varios bloques (o libros), se conserva el primero.
+
+    Args:
+        monsters: Monstruos extraídos, en orden de prioridad
+
+    Returns:
+        Tabla con versión y filas (un diccionario por monstruo)
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for monster in monsters:
+        if monster.key and monster.key not in rows:
+            rows[monster.key] = asdict(monster)
+    return {"version": INDEX_VERSION, "monsters": list(rows.values())}
+
+def save_monster_table(table: Dict[str, Any], path: Path) -> None:
+    """Guarda la tabla de forma atómica (fichero temporal + rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# -------------------------------------------------------------------------#
+# 4. CONSULTAS
+# -------------------------------------------------------------------------#
+
+_NUMBER = r"(\d+(?:/\d+)?)"
+_COMPARISON = (
+    r"(?:(?P<op>mayor|superior|mas|menor|inferior|menos|al menos|como minimo|como maximo|hasta|>=|<=|>|<)"
+    r"\s*(?:que|a|de)?\s*(?P<eq>o igual\s*(?:que|a)?\s*)?|entre\s+(?P<low>%s)\s+y\s+)?" % _NUMBER
+)
+_CR_FILTER_RE = re.compile(
+    r"\b(?:valor de desafio|desafio|vd|cr)\s*(?:de\s+|=\s*|:\s*)?%s(?P<value>%s)(?P<suffix>\s+o\s+(?:mas|menos))?"
+    % (_COMPARISON, _NUMBER)
+)
+_AC_FILTER_RE = re.compile(
+    r"\b(?:clase de armadura|ca)\s*(?:de\s+|=\s*|:\s*)?%s(?P<value>%s)(?P<suffix>\s+o\s+(?:mas|menos))?"
+    % (_COMPARISON, _NUMBER)
+)
+
+_LOWER_BOUND = {"mayor", "superior", "mas", ">"}
+_UPPER_BOUND = {"menor", "inferior", "menos", "<"}
+_AT_LEAST = {"al menos", "como minimo", ">="}
+_AT_MOST = {"como maximo", "hasta", "<="}
+
+# Margen para convertir "mayor que" / "menor que" en rangos cerrados
+_STRICT = 1e-6
+
+# Términos (normalizados) que piden una lista de monstruos
+LIST_TERMS = {"lista", "listado", "enumera", "cuale", "todo", "monstruo", "criatura"}
+
+# Términos que confirman que se pregunta por el perfil de un monstruo
+STATBLOCK_TERMS = {"estadistica", "perfil", "bloque", "ca", "armadura", "pg", "vd", "desafio", "monstruo", "criatura"}
+
+# Términos que sitúan un filtro numérico en el bestiario (sin contar las propias
+# abreviaturas del filtro: "CA 16" también es la armadura de un personaje)
+MONSTER_CONTEXT_TERMS = (STATBLOCK_TERMS | LIST_TERMS) - {"ca", "armadura", "pg", "vd", "desafio"}
+
+# Términos de personajes jugadores: con ellos un nombre ambiguo ("mago") es la clase
+CHARACTER_TERMS = {"personaje", "jugador", "nivel", "subclase", "multiclase", "hechizo", "conjuro", "truco"}
+
+# Nombres de una palabra que en otros libros significan otra cosa (clases, razas, reglas)
+_AMBIGUOUS_NAMES = {
+    phrase for book, entries in BOOK_LEXICON.items() if book != MONSTER_MANUAL
+    for phrase in (" ".join(normalize_terms(term)) for term in entries) if " " not in phrase
+}
+
+def parse_range(match: re.Match) -> Tuple[float, float]:
+    """Rango [mínimo, máximo] expresado por una coincidencia de filtro numérico."""
+    value = parse_cr(match.group("value"))
+    if match.group("low"):
+        low = parse_cr(match.group("low"))
+        return min(low, value), max(low, value)
+
+    op, suffix = match.group("op"), (match.group("suffix") or "").strip()
+    if op in _AT_LEAST or suffix.endswith("mas") or (op in _LOWER_BOUND and match.group("eq")):
+        return value, float("inf")
+    if op in _AT_MOST or suffix.endswith("menos") or (op in _UPPER_BOUND and match.group("eq")):
+        return float("-inf"), value
+    if op in _LOWER_BOUND:
+        return value + _STRICT, float("inf")
+    if op in _UPPER_BOUND:
+        return float("-inf"), value - _STRICT
+    return value, value
+
+@dataclass
+class MonsterQuery:
+    """Lo que la consulta pide al índice: monstruos por nombre y/o un filtro."""
+    names: List[str] = field(default_factory=list)
+    challenge: Optional[Tuple[float, float]] = None
+    armor_class: Optional[Tuple[float, float]] = None
+    creature_type: Optional[str] = None
+    filter_text: List[str] = field(default_factory=list)
+
+    @property
+    def has_filter(self) -> bool:
+        return self.challenge is not None or self.armor_class is not None
+
+    def describe(self) -> str:
+        """Descripción legible del filtro, con el texto de la consulta ("vd entre 5 y 8, tipo dragón")."""
+        parts = list(self.filter_text)
+        if self.creature_type:
+            parts.append(f"tipo {self.creature_type}")
+        return ", ".join(parts)
+
+class MonsterIndex:
+    """
+    Tabla de monstruos en memoria con búsquedas por nombre y filtros numéricos.
+
+    La tabla se relee cuando cambia el fichero (p. ej. tras una ingestión
+    desde `setup_db.py`), igual que el vocabulario del enrutador.
+    """
+
+    def __init__(self, path: Path, list_max: int = 30):
+        self.path = Path(path)
+        self.list_max = list_max
+        self._mtime = -1
+        self._monsters: List[Monster] = []
+        self._by_key: Dict[str, Monster] = {}
+        self._types: List[str] = []
+
+    def _load(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._monsters, self._by_key, self._types = -1, [], {}, []
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            table = {}
+        rows = table.get("monsters", []) if table.get("version") == INDEX_VERSION else []
+        monsters = sorted((Monster(**row) for row in rows), key=lambda m: (m.challenge_value, m.name))
+        by_key = {monster.key: monster for monster in monsters}
+        for alias, target in ALIASES.items():
+            target_key = name_key(target)
+            if target_key in by_key:
+                by_key.setdefault(name_key(alias), by_key[target_key])
+        self._mtime, self._monsters, self._by_key = mtime, monsters, by_key
+        self._types = [fold_accents(monster.creature_type).lower() for monster in monsters]
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._monsters)
+
+    def lookup(self, name: str) -> Optional[Monster]:
+        """Monstruo por nombre exacto (sin tildes ni plurales) o alias."""
+        self._load()
+        return self._by_key.get(name_key(name))
+
+    def filter(
+        self,
+        challenge: Optional[Tuple[float, float]] = None,
+        armor_class: Optional[Tuple[float, float]] = None,
+        creature_type: Optional[str] = None
+    ) -> List[Monster]:
+        """
+        Monstruos que cumplen los rangos de VD y CA y el tipo indicados.
+
+        Returns:
+            Monstruos ordenados por VD y nombre
+        """
+        self._load()
+        type_key = fold_accents(creature_type).lower() if creature_type else None
+        # La tabla ya está ordenada por VD y nombre
+        return [
+            monster for monster, folded_type in zip(self._monsters, self._types)
+            if (challenge is None or challenge[0] <= monster.challenge_value <= challenge[1])
+            and (armor_class is None or armor_class[0] <= monster.armor_class <= armor_class[1])
+            and (type_key is None or folded_type.startswith(type_key))
+        ]
+
+    def parse_query(self, query: str) -> MonsterQuery:
+        """
+        Detecta en la consulta nombres de monstruo y filtros de VD, CA y tipo.
+
+        Los nombres se buscan como n-gramas de la consulta normalizada (el más
+        largo primero, sin solaparse). El tipo solo filtra si acompaña a un
+        filtro numérico o a una petición de lista, y los filtros de VD y CA
+        solo se aplican si la consulta habla de monstruos (un tipo de criatura
+        o MONSTER_CONTEXT_TERMS).
+
+        Args:
+            query: Pregunta del usuario
+
+        Returns:
+            MonsterQuery con los nombres y rangos encontrados
+        """
+        self._load()
+        result = MonsterQuery()
+        folded = fold_accents(query).lower()
+        for attribute, pattern in (("challenge", _CR_FILTER_RE), ("armor_class", _AC_FILTER_RE)):
+            match = pattern.search(folded)
+            if match:
+                setattr(result, attribute, parse_range(match))
+                result.filter_text.append(match.group(0).strip())
+
+        terms = normalize_terms(query)
+        term_set = set(terms)
+        used = [False] * len(terms)
+        for n in range(min(MAX_NAME_WORDS, len(terms)), 0, -1):
+            for i in range(len(terms) - n + 1):
+                if any(used[i:i + n]):
+                    continue
+                phrase = " ".join(terms[i:i + n])
+                if phrase in CREATURE_TYPES or ALIASES.get(phrase) in CREATURE_TYPES:
+                    type_name = CREATURE_TYPES.get(phrase) or CREATURE_TYPES[ALIASES[phrase]]
+                    if result.creature_type is None and (result.has_filter or term_set & LIST_TERMS):
+                        result.creature_type = type_name
+                        used[i:i + n] = [True] * n
+                    continue
+                monster = self._by_key.get(phrase)
+                if monster is None or monster.name in result.names:
+                    continue
+                if n == 1 and phrase in _AMBIGUOUS_NAMES and \
+                        (not term_set & STATBLOCK_TERMS or term_set & CHARACTER_TERMS):
+                    continue
+                result.names.append(monster.name)
+                used[i:i + n] = [True] * n
+
+        # "Mi personaje tiene CA 16" no es una búsqueda en el bestiario
+        if result.has_filter and result.creature_type is None and not term_set & MONSTER_CONTEXT_TERMS:
+            result.challenge = result.armor_class = None
+            result.filter_text = []
+        return result
+
+    def documents_for(self, query: str) -> List[Document]:
+        """
+        Documentos del índice para la consulta: el bloque de cada monstruo
+        nombrado, o una tabla con los que cumplen el filtro.
+
+        Args:
+            query: Pregunta del usuario
+
+        Returns:
+            Lista de Document (vacía si la consulta no nombra monstruos ni filtros)
+        """
+        with telemetry.span("monster_lookup"):
+            parsed = self.parse_query(query)
+            documents = [self._statblock_document(self._by_key[name_key(name)]) for name in parsed.names]
+            if not documents and parsed.has_filter:
+                documents = [self._table_document(parsed)]
+        result = "name" if parsed.names else "filter" if documents else "miss"
+        telemetry.count("monster_lookup", result=result)
+        return documents
+
+    def _statblock_document(self, monster: Monster) -> Document:
+        chunk_id = f"statblock:{monster.key}"
+        return Document(
+            page_content=monster.render(),
+            metadata={
+                "document_name": monster.document_name,
+                "page_number": monster.page_number,
+                "section_path": monster.name,
+                "chunk_id": chunk_id,
+                "source": "monster_index"
+            },
+            id=chunk_id
+        )
+
+    def _table_document(self, parsed: MonsterQuery) -> Document:
+        monsters = self.filter(parsed.challenge, parsed.armor_class, parsed.creature_type)
+        description = parsed.describe()
+        lines = [f"Monstruos con {description}: {len(monsters)} resultado(s)"]
+        lines.extend(monster.summary() for monster in monsters[:self.list_max])
+        if len(monsters) > self.list_max:
+            lines.append(f"[… y {len(monsters) - self.list_max} más]")
+        chunk_id = f"monsterlist:{fold_accents(description).lower()}"
+        return Document(
+            page_content="\n".join(lines),
+            metadata={
+                "document_name": monsters[0].document_name if monsters else MONSTER_MANUAL,
+                # Tabla generada: no corresponde a ninguna página concreta
+                "page_number": "N/A",
+                "section_path": f"Monstruos ({description})",
+                "chunk_id": chunk_id,
+                "source": "monster_index"
+            },
+            id=chunk_id
+        )
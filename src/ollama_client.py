@@ -0,0 +1,174 @@
+# -------------------------------------------------------------------------#
+# OLLAMA CLIENT - Cliente HTTP compartido y calentamiento de modelos
+# -------------------------------------------------------------------------#
+
+"""
+Conexión con el servidor de Ollama para D&D 5E
+
+Funcionalidades principales:
+• Un único ollama.Client (httpx) compartido por el modelo de embeddings y el LLM
+• Pool de conexiones con keep-alive y límites ajustados a la concurrencia del proyecto
+• keep_alive configurable para que Ollama mantenga los modelos cargados entre consultas
+• Calentamiento explícito al arrancar, medido aparte de la latencia de las consultas
+"""
+
+import re
+import time
+import threading
+from typing import Any, Dict, Optional, Union
+
+from config import (
+    OLLAMA_HOST,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_TIMEOUT,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE
+)
+import telemetry
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+# Tipos de modelo que se pueden calentar
+KIND_EMBEDDINGS = "embeddings"
+KIND_LLM = "llm"
+
+# Segundos que una conexión ociosa permanece en el pool
+KEEPALIVE_EXPIRY = 60.0
+
+_DURATION_RE = re.compile(r"^(-?\d+(?:\.\d+)?)\s*([smh]?)$")
+_UNIT_SECONDS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+# Modelo ➜ segundos que tardó en cargarse al calentarlo
+_warmup_timings: Dict[str, float] = {}
+_warmup_lock = threading.Lock()
+
+def parse_keep_alive(value: Union[str, int, None]) -> Optional[int]:
+    """
+    Convierte un keep_alive ("30m", "1h", "300", "-1") a segundos.
+
+    OllamaEmbeddings solo admite segundos enteros, así que se usa el mismo
+    valor numérico para los dos modelos.
+
+    Args:
+        value: Duración con unidad opcional (s, m, h); negativo = sin descarga
+
+    Returns:
+        Segundos, o None si está vacío (se usa el valor por defecto de Ollama)
+
+    Raises:
+        ValueError: Si el formato no es válido
+    """
+    if value is None or isinstance(value, int):
+        return value
+    value = value.strip().lower()
+    if not value:
+        return None
+    match = _DURATION_RE.match(value)
+    if match is None:
+        raise ValueError(f"keep_alive no válido: {value!r} (usa p. ej. 300, 30m, 1h o -1)")
+    return int(float(match.group(1)) * _UNIT_SECONDS[match.group(2)])
+
+KEEP_ALIVE = parse_keep_alive(OLLAMA_KEEP_ALIVE)
+
+# -------------------------------------------------------------------------#
+# 2. CLIENTE COMPARTIDO
+# -------------------------------------------------------------------------#
+
+def get_client():
+    """
+    Obtiene el cliente de Ollama compartido (singleton pattern).
+
+    httpx reutiliza las conexiones abiertas (keep-alive), de modo que las
+    consultas concurrentes no pagan un handshake TCP por petición.
+
+    Returns:
+        Instancia de ollama.Client
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+            from ollama import Client
+            _client = Client(
+                host=OLLAMA_HOST,
+                timeout=OLLAMA_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                )
+            )
+    return _client
+
+def attach_client(model: Any) -> Any:
+    """
+    Hace que un modelo de langchain_ollama use el cliente compartido.
+
+    Args:
+        model: OllamaEmbeddings u OllamaLLM
+
+    Returns:
+        El mismo modelo
+    """
+    model._client = get_client()
+    return model
+
+def reset_client() -> None:
+    """Cierra el cliente compartido (se recrea en el siguiente uso)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client._client.close()
+            _client = None
+
+# -------------------------------------------------------------------------#
+# 3. CALENTAMIENTO
+# -------------------------------------------------------------------------#
+
+def warm_up(model: str, kind: str) -> Optional[float]:
+    """
+    Carga un modelo en Ollama antes de la primera consulta.
+
+    Para el LLM se envía un prompt vacío (Ollama solo carga el modelo);
+    para embeddings, un texto mínimo. Cada modelo se calienta una sola vez
+    por proceso. Un fallo no impide arrancar: la primera consulta pagará la carga.
+
+    Args:
+        model: Nombre del modelo en Ollama
+        kind: KIND_EMBEDDINGS o KIND_LLM
+
+    Returns:
+        Segundos que tardó la carga, o None si Ollama no respondió
+    """
+    with _warmup_lock:
+        if model in _warmup_timings:
+            return _warmup_timings[model]
+
+        client = get_client()
+        print(f"🔥 Calentando modelo {model}...")
+        start = time.perf_counter()
+        try:
+            with telemetry.span("model_warmup", model=model):
+                if kind == KIND_EMBEDDINGS:
+                    client.embed(model=model, input="warm-up", keep_alive=KEEP_ALIVE)
+                else:
+                    client.generate(model=model, prompt="", keep_alive=KEEP_ALIVE)
+        except Exception as e:
+            telemetry.count("model_warmup_errors", model=model)
+            print(f"⚠️  No se pudo calentar {model}: {e}")
+            return None
+
+        seconds = time.perf_counter() - start
+        _warmup_timings[model] = seconds
+        print(f"✅ Modelo {model} listo en {seconds:.2f}s")
+        return seconds
+
+def get_warmup_timings() -> Dict[str, float]:
+    """Segundos de carga de cada modelo calentado en este proceso."""
+    with _warmup_lock:
+        return {model: round(seconds, 3) for model, seconds in _warmup_timings.items()}
@@ -0,0 +1,240 @@
+# -------------------------------------------------------------------------#
+# PAGE STORE - Almacén de páginas completas en memoria mapeada
+# -------------------------------------------------------------------------#
+
+"""
+Almacén clave-valor de páginas para recuperación padre-hijo en D&D 5E
+
+Funcionalidades principales:
+• Un único fichero: textos de las páginas en UTF-8 + índice (document_name, página) ➜ posición
+• Escritura atómica (fichero temporal + rename); lectura con mmap, sin cargar el corpus en memoria
+• Expansión de los chunks recuperados a su página completa (deduplicada) o a una
+  ventana con el texto vecino, recortada en saltos de línea
+"""
+
+import os
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Iterable, Tuple
+
+from langchain_core.documents import Document
+
+import telemetry
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+STORE_VERSION = 1
+
+# Cola del fichero: posición del índice (8 bytes) + marca de formato
+MAGIC = b"DNDPAGE1"
+_FOOTER = struct.Struct("<Q8s")
+
+# Modos de expansión
+MODE_OFF = "off"
+MODE_PAGE = "page"
+MODE_NEIGHBORS = "neighbors"
+MODES = (MODE_OFF, MODE_PAGE, MODE_NEIGHBORS)
+
+# Longitud mínima de una línea del chunk usada para localizarlo en su página
+MIN_PROBE_CHARS = 20
+
+# Una página lógica como tupla (document_name, número de página, texto)
+Page = Tuple[str, int, str]
+
+def build_page_store(pages: Iterable[Page], path: Path) -> Dict[str, Any]:
+    """
+    Escribe el almacén de páginas.
+
+    Args:
+        pages: Páginas (document_name, page_number, texto); las vacías se omiten
+        path: Fichero de destino
+
+    Returns:
+        Resumen con el número de páginas y el tamaño en bytes
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+
+    index: Dict[str, Dict[str, List[int]]] = {}
+    offset = count = 0
+    with open(tmp_path, "wb") as f:
+        for document_name, page_number, text in pages:
+            text = text.strip()
+            if not text:
+                continue
+            data = text.encode("utf-8")
+            f.write(data)
+            index.setdefault(document_name, {})[str(page_number)] = [offset, len(data)]
+            offset += len(data)
+            count += 1
+        f.write(json.dumps({"version": STORE_VERSION, "pages": index}, ensure_ascii=False).encode("utf-8"))
+        f.write(_FOOTER.pack(offset, MAGIC))
+    os.replace(tmp_path, path)
+    return {"pages": count, "bytes": path.stat().st_size}
+
+# -------------------------------------------------------------------------#
+# 2. VENTANAS DE TEXTO
+# -------------------------------------------------------------------------#
+
+def locate(page: str, text: str) -> Optional[Tuple[int, int]]:
+    """
+    Posición aproximada de un chunk dentro del texto de su página.
+
+    El splitter puede normalizar espacios, así que se busca la primera línea
+    suficientemente larga del chunk y se asume su longitud original.
+
+    Returns:
+        Tupla (inicio, fin) o None si no se encuentra
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    for n, line in enumerate(lines):
+        if len(line) < MIN_PROBE_CHARS:
+            continue
+        start = page.find(line)
+        if start == -1:
+            continue
+        # Retroceder lo que ocupan las líneas anteriores del chunk
+        start = max(0, start - sum(len(previous) + 1 for previous in lines[:n]))
+        return start, min(len(page), start + len(text))
+    return None
+
+def window(page: str, span: Tuple[int, int], max_chars: int) -> str:
+    """
+    Texto de la página alrededor de `span`, de hasta `max_chars` caracteres.
+
+    El margen se reparte a ambos lados y los bordes se ajustan a saltos de línea.
+    """
+    if len(page) <= max_chars:
+        return page
+    start, end = span
+    margin = max(0, max_chars - (end - start)) // 2
+    start, end = max(0, start - margin), min(len(page), end + margin)
+    if start > 0:
+        newline = page.find("\n", start, span[0])
+        start = newline + 1 if newline != -1 else start
+    if end < len(page):
+        newline = page.rfind("\n", span[1], end)
+        end = newline if newline != -1 else end
+    return page[start:end].strip()
+
+# -------------------------------------------------------------------------#
+# 3. ALMACÉN
+# -------------------------------------------------------------------------#
+
+class PageStore:
+    """
+    Lector del almacén de páginas.
+
+    El fichero se mapea en memoria y se vuelve a abrir cuando cambia (p. ej.
+    tras una ingestión desde `setup_db.py`); el mapeo anterior sigue siendo
+    válido hasta entonces porque el fichero se reemplaza, no se sobrescribe.
+    Con `auto_reload=False` se conserva la primera versión abierta.
+    """
+
+    def __init__(self, path: Path, auto_reload: bool = True):
+        self.path = Path(path)
+        self.auto_reload = auto_reload
+        self._mtime = -1
+        self._data: Any = b""
+        self._pages: Dict[str, Dict[str, List[int]]] = {}
+
+    def _load(self) -> None:
+        if not self.auto_reload and self._mtime != -1:
+            return
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._data, self._pages = -1, b"", {}
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            index_offset, magic = _FOOTER.unpack(data[-_FOOTER.size:])
+            if magic != MAGIC:
+                raise ValueError("formato de almacén de páginas desconocido")
+            index = json.loads(data[index_offset:-_FOOTER.size])
+        except (OSError, ValueError, struct.error) as e:
+            print(f"⚠️  No se pudo abrir el almacén de páginas: {e}")
+            self._mtime, self._data, self._pages = mtime, b"", {}
+            return
+        pages = index.get("pages", {}) if index.get("version") == STORE_VERSION else {}
+        self._mtime, self._data, self._pages = mtime, data, pages
+
+    def __len__(self) -> int:
+        self._load()
+        return sum(len(pages) for pages in self._pages.values())
+
+    def keys(self) -> List[Tuple[str, int]]:
+        """Páginas del almacén como tuplas (document_name, page_number)."""
+        self._load()
+        return [(name, int(page)) for name, pages in self._pages.items() for page in pages]
+
+    def get(self, document_name: str, page_number: Any) -> Optional[str]:
+        """
+        Texto completo de una página.
+
+        Args:
+            document_name: Nombre del documento
+            page_number: Número de página lógica
+
+        Returns:
+            Texto de la página o None si no está en el almacén
+        """
+        self._load()
+        entry = self._pages.get(document_name, {}).get(str(page_number))
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._data[offset:offset + length].decode("utf-8")
+
+    def expand(self, docs: List[Document], mode: str, max_chars: int, window_chars: int = 0) -> List[Document]:
+        """
+        Sustituye cada chunk por su página (MODE_PAGE) o por una ventana con su texto vecino (MODE_NEIGHBORS).
+
+        En modo página, cada página aparece una sola vez, en el puesto de su
+        mejor chunk; las páginas más largas que `max_chars` se recortan
+        alrededor del chunk. Los documentos sin página en el almacén (p. ej.
+        bloques de estadísticas generados) se devuelven sin cambios.
+
+        Args:
+            docs: Chunks ordenados por relevancia
+            mode: MODE_PAGE o MODE_NEIGHBORS (MODE_OFF = sin cambios)
+            max_chars: Longitud máxima del texto expandido
+            window_chars: Caracteres añadidos a cada lado del chunk en MODE_NEIGHBORS
+
+        Returns:
+            Documentos expandidos, en el mismo orden
+        """
+        if mode == MODE_OFF:
+            return docs
+
+        expanded, seen = [], set()
+        with telemetry.span("parent_expansion"):
+            for doc in docs:
+                key = (doc.metadata.get("document_name"), doc.metadata.get("page_number"))
+                page = None if doc.metadata.get("source") else self.get(*key)
+                if page is None:
+                    expanded.append(doc)
+                    continue
+                if mode == MODE_PAGE and key in seen:
+                    telemetry.count("parent_expansion", result="duplicate")
+                    continue
+                seen.add(key)
+
+                span = locate(page, doc.page_content)
+                if span is None:
+                    telemetry.count("parent_expansion", result="not_found")
+                    text = page if len(page) <= max_chars else doc.page_content
+                elif mode == MODE_PAGE:
+                    text = window(page, span, max_chars)
+                else:
+                    text = window(page, span, min(max_chars, span[1] - span[0] + 2 * window_chars))
+                expanded.append(Document(page_content=text, metadata={**doc.metadata, "parent": mode}, id=doc.id))
+        return expanded
@@ -1,5 +1,8 @@
 from langchain_core.prompts import ChatPromptTemplate
 
+# Versión de los prompts: incrementar al modificar cualquier prompt para invalidar la caché de respuestas
+PROMPT_VERSION = "2"
+
 # --- PROMPT PARA RESPUESTA NORMAL---
 ANSWER_PROMPT = ChatPromptTemplate.from_messages([
     ("system", """Eres un asistente experto en Dungeons & Dragons 5ª edición, actuando como un Dungeon Master sabio y preciso.
@@ -0,0 +1,173 @@
+# -------------------------------------------------------------------------#
+# QUERY CACHE - Caché LRU de embeddings de consulta y resultados top-k
+# -------------------------------------------------------------------------#
+
+"""
+Caché en memoria del lado de las consultas para D&D 5E
+
+Funcionalidades principales:
+• Consulta normalizada ➜ embedding (evita la llamada a Ollama)
+• Consulta normalizada + k ➜ chunks recuperados (evita la búsqueda)
+• Invalidación automática cuando cambia la generación del índice
+• Estadísticas de aciertos y latencia ahorrada
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# -------------------------------------------------------------------------#
+# 1. NORMALIZACIÓN
+# -------------------------------------------------------------------------#
+
+_SPACES_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "¿?¡!.,;: "
+
+def normalize_query(query: str) -> str:
+    """
+    Normaliza una consulta para usarla como clave de caché.
+
+    "¿Cómo funciona  la Ventaja?" y "cómo funciona la ventaja" comparten clave.
+    Las tildes se conservan porque cambian el significado para el embedding.
+
+    Args:
+        query: Consulta original
+
+    Returns:
+        Consulta en minúsculas, con espacios colapsados y sin puntuación en los extremos
+    """
+    query = unicodedata.normalize("NFC", query).lower()
+    return _SPACES_RE.sub(" ", query).strip(_EDGE_PUNCTUATION)
+
+# -------------------------------------------------------------------------#
+# 2. LRU CON ESTADÍSTICAS
+# -------------------------------------------------------------------------#
+
+class _LRU:
+    """Diccionario LRU acotado que contabiliza aciertos y tiempo ahorrado."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._miss_seconds = 0.0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if key in self.data:
+            self.data.move_to_end(key)
+            self.hits += 1
+            # Se estima el ahorro con la latencia media de los fallos
+            if self.misses:
+                self.saved_seconds += self._miss_seconds / self.misses
+            return self.data[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any, elapsed: float) -> None:
+        self._miss_seconds += elapsed
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+            "saved_seconds": self.saved_seconds
+        }
+
+# -------------------------------------------------------------------------#
+# 3. CACHÉ DE CONSULTAS
+# -------------------------------------------------------------------------#
+
+class QueryCache:
+    """
+    Caché de embeddings de consulta y de resultados de recuperación.
+
+    `generation_fn` devuelve la generación actual del índice; cuando cambia
+    (nuevos chunks, borrados, reseteo) se vacían ambas cachés.
+    """
+
+    def __init__(self, embedding_size: int, results_size: int,
+                 generation_fn: Callable[[], int]):
+        self._embeddings = _LRU(embedding_size)
+        self._results = _LRU(results_size)
+        self._generation_fn = generation_fn
+        self._generation = generation_fn()
+        self._lock = threading.Lock()
+
+    def _check_generation(self) -> None:
+        generation = self._generation_fn()
+        if generation != self._generation:
+            self._embeddings.data.clear()
+            self._results.data.clear()
+            self._generation = generation
+
+    def get_or_embed(self, query: str, embed_fn: Callable[[str], Any]) -> Any:
+        """
+        Devuelve el embedding de la consulta, calculándolo solo si no está en caché.
+
+        Args:
+            query: Consulta original
+            embed_fn: Función que calcula el embedding en caso de fallo
+
+        Returns:
+            Vector de la consulta
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._check_generation()
+            cached = self._embeddings.get(key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        vector = embed_fn(query)
+        with self._lock:
+            self._embeddings.put(key, vector, time.perf_counter() - start)
+        return vector
+
+    def get_or_search(self, query: str, k: int, search_fn: Callable[[str], Any],
+                      extra_key: Hashable = None) -> Any:
+        """
+        Devuelve los chunks recuperados para (consulta, k), buscando solo si es necesario.
+
+        Args:
+            query: Consulta original
+            k: Número de chunks solicitados
+            search_fn: Función de búsqueda en caso de fallo
+            extra_key: Parte adicional de la clave (filtros, modo de búsqueda...)
+
+        Returns:
+            Lista de documentos recuperados (cada uno con su chunk_id)
+        """
+        key = (normalize_query(query), k, extra_key)
+        with self._lock:
+            self._check_generation()
+            cached = self._results.get(key)
+        if cached is not None:
+            return list(cached)
+
+        start = time.perf_counter()
+        documents = search_fn(query)
+        with self._lock:
+            self._results.put(key, tuple(documents), time.perf_counter() - start)
+        return documents
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de aciertos y latencia ahorrada de ambas cachés."""
+        with self._lock:
+            return {
+                "generation": self._generation,
+                "embeddings": self._embeddings.stats(),
+                "results": self._results.stats()
+            }
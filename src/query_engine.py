@@ -0,0 +1,478 @@
+# -------------------------------------------------------------------------#
+# QUERY ENGINE - Motor de consultas RAG independiente de la interfaz
+# -------------------------------------------------------------------------#
+
+"""
+Motor de consultas para D&D 5E sin dependencias de Streamlit
+
+Funcionalidades principales:
+• Consulta normal y descomposición secuencial con caché de respuestas
+• Preparación separada del paso final para poder transmitir tokens
+• Puntos de entrada síncrono (`answer`) y asíncrono (`aanswer`)
+• Notificación de progreso opcional para las interfaces
+"""
+
+import os
+import re
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Iterator, Callable, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+
+from config import (
+    LANGSMITH_TRACING,
+    LANGCHAIN_API_KEY,
+    LANGCHAIN_PROJECT,
+    LLM_MODEL,
+    RETRIEVAL_K,
+    RETRIEVAL_WORKERS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_DEDUP_THRESHOLD,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_MIN_OVERLAP
+)
+from prompts import ANSWER_PROMPT, DECOMPOSITION_PROMPT, SYNTHESIS_PROMPT, PROMPT_VERSION
+from context_packer import pack_context, estimate_tokens
+from query_router import book_name
+import ollama_client
+import telemetry
+
+# Configuración de LangSmith para trazabilidad (opcional)
+if LANGSMITH_TRACING:
+    os.environ["LANGSMITH_TRACING"] = "true"
+    os.environ["LANGCHAIN_API_KEY"] = LANGCHAIN_API_KEY
+    os.environ["LANGCHAIN_PROJECT"] = LANGCHAIN_PROJECT
+
+# Modos de consulta admitidos
+MODE_NORMAL = "normal"
+MODE_DECOMPOSITION = "decomposition"
+QUERY_MODES = (MODE_NORMAL, MODE_DECOMPOSITION)
+
+# Callback de progreso: (evento, datos)
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+# -------------------------------------------------------------------------#
+# 1. CARGA DE COMPONENTES
+# -------------------------------------------------------------------------#
+
+def create_model(warm_up: bool = False):
+    """
+    Crea el modelo LLM configurado en LLM_MODEL (el cliente de Ollama se importa al usarse).
+
+    Args:
+        warm_up: Carga el modelo en Ollama ahora (al arrancar) y no en la primera consulta
+    """
+    from langchain_ollama import OllamaLLM
+    model = ollama_client.attach_client(
+        OllamaLLM(model=LLM_MODEL, temperature=0, keep_alive=ollama_client.KEEP_ALIVE)
+    )
+    if warm_up:
+        ollama_client.warm_up(LLM_MODEL, ollama_client.KIND_LLM)
+    return model
+
+def create_answer_cache():
+    """Abre la caché persistente de respuestas (None si está deshabilitada)."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+
+    from answer_cache import AnswerCache
+    from vector_pipeline import get_index_generation
+    return AnswerCache(
+        ANSWER_CACHE_PATH,
+        model=LLM_MODEL,
+        prompt_version=PROMPT_VERSION,
+        generation_fn=get_index_generation,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY,
+        min_overlap=ANSWER_CACHE_MIN_OVERLAP
+    )
+
+def initialize_chains(model, retriever, answer_cache=None):
+    """Inicializa las cadenas de procesamiento con el modelo, el retriever y la caché de respuestas."""
+    answer_chain = ANSWER_PROMPT | model | StrOutputParser()
+    decomposition_chain = DECOMPOSITION_PROMPT | model | StrOutputParser()
+    synthesis_chain = SYNTHESIS_PROMPT | model | StrOutputParser()
+
+    return {
+        "answer_chain": answer_chain,
+        "decomposition_chain": decomposition_chain,
+        "synthesis_chain": synthesis_chain,
+        "retriever": retriever,
+        "answer_cache": answer_cache
+    }
+
+# -------------------------------------------------------------------------#
+# 2. UTILIDADES
+# -------------------------------------------------------------------------#
+
+@telemetry.timed("context_build")
+def build_context_and_sources(docs, max_tokens: int = CONTEXT_MAX_TOKENS):
+    """
+    Construye el contexto con metadata y extrae las fuentes de los documentos recuperados.
+
+    El contexto se empaqueta dentro de `max_tokens`: los chunks de la misma
+    página se fusionan, se descartan los casi duplicados y solo se citan
+    como fuentes los pasajes que entran en el prompt.
+    """
+    context, passages = pack_context(docs, max_tokens, CONTEXT_DEDUP_THRESHOLD)
+
+    sources = []
+    for passage in passages:
+        path_str = " | ".join(path for path in passage.section_paths if path) or "Sin sección"
+        snippet = (passage.text[:120] + "…") if len(passage.text) > 120 else passage.text
+
+        sources.append({
+            "Archivo": book_name(passage.document_name),
+            "Página": passage.page_number,
+            "Sección": path_str,
+            "Extracto": snippet,
+        })
+
+    return context, sources
+
+def context_budget(*prompt_parts: str) -> int:
+    """
+    Tokens disponibles para el contexto recuperado descontando otras partes del prompt.
+
+    Se reserva al menos una cuarta parte del presupuesto para el contexto.
+    """
+    if CONTEXT_MAX_TOKENS <= 0:
+        return CONTEXT_MAX_TOKENS
+    used = sum(estimate_tokens(part) for part in prompt_parts)
+    return max(CONTEXT_MAX_TOKENS - used, CONTEXT_MAX_TOKENS // 4)
+
+def parse_sub_questions(text: str) -> List[str]:
+    """Parsea la salida del LLM para extraer las sub-preguntas."""
+    questions = re.findall(r"^\d+\.\s*(.*)", text, re.MULTILINE)
+
+    if not questions:
+        # Si no hay lista numerada, podría ser una única pregunta devuelta
+        return [text.strip()]
+
+    return [q.strip() for q in questions]
+
+def _chunk_ids(docs) -> List[str]:
+    return [doc.metadata.get("chunk_id") or doc.id for doc in docs]
+
+# -------------------------------------------------------------------------#
+# 3. RESULTADOS
+# -------------------------------------------------------------------------#
+
+@dataclass
+class PreparedAnswer:
+    """
+    Respuesta lista para generarse: todo lo previo al paso final del LLM.
+
+    `token_stream` produce el texto de la respuesta (un único fragmento si
+    viene de la caché) y guarda la respuesta en caché al agotarse.
+    """
+    token_stream: Iterator[str]
+    sources: List[Dict[str, Any]]
+    mode: str
+    timings: Dict[str, float] = field(default_factory=dict)
+    cached: Optional[Dict[str, Any]] = None
+    trace: Optional[telemetry.Trace] = None
+
+@dataclass
+class QueryResult:
+    """Resultado completo de una consulta."""
+    answer: str
+    sources: List[Dict[str, Any]]
+    mode: str
+    timings: Dict[str, float] = field(default_factory=dict)
+    cached: Optional[str] = None
+    breakdown: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "answer": self.answer,
+            "sources": self.sources,
+            "mode": self.mode,
+            "timings": self.timings,
+            "cached": self.cached,
+            "breakdown": self.breakdown
+        }
+
+# -------------------------------------------------------------------------#
+# 4. MOTOR DE CONSULTAS
+# -------------------------------------------------------------------------#
+
+class QueryEngine:
+    """
+    Motor de consultas RAG sin dependencias de interfaz.
+
+    Es seguro usarlo desde varios hilos a la vez: el estado compartido
+    (retriever, cachés) está protegido por sus propios locks.
+    """
+
+    def __init__(self, retriever=None, model=None, answer_cache=None, k: int = RETRIEVAL_K,
+                 warm_up: bool = False):
+        # Sin retriever explícito se sigue al global, que el vigilante de DATA_DIR puede sustituir
+        self._live_k = k if retriever is None else None
+        if retriever is None:
+            from vector_pipeline import get_retriever
+            retriever = get_retriever(k=k)
+        if warm_up:
+            from vector_pipeline import get_embeddings
+            get_embeddings(warm_up=True)
+        self.chains = initialize_chains(model or create_model(warm_up=warm_up), retriever, answer_cache)
+
+    @property
+    def retriever(self):
+        if self._live_k is not None:
+            from vector_pipeline import get_retriever
+            return get_retriever(k=self._live_k)
+        return self.chains["retriever"]
+
+    # --- Caché de respuestas ---
+
+    def _lookup_cached(self, retriever, prompt: str, mode: str,
+                       docs) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        answer_cache = self.chains["answer_cache"]
+        if answer_cache is None:
+            return None, None
+
+        embed_query = getattr(retriever, "embed_query", None)
+        query_vector = embed_query(prompt) if embed_query else None
+        with telemetry.span("answer_cache_lookup"):
+            cached = answer_cache.lookup(prompt, mode, _chunk_ids(docs), query_vector)
+        telemetry.count("answer_cache", result=cached["match"] if cached else "miss")
+        return cached, query_vector
+
+    def _stream_and_cache(self, token_stream, prompt, mode, docs, sources, query_vector) -> Iterator[str]:
+        parts = []
+        for token in token_stream:
+            parts.append(token)
+            yield token
+        answer_cache = self.chains["answer_cache"]
+        if answer_cache is not None:
+            answer_cache.store(prompt, mode, _chunk_ids(docs), "".join(parts), sources, query_vector)
+
+    @staticmethod
+    def _finish_trace(token_stream: Iterator[str], trace: telemetry.Trace) -> Iterator[str]:
+        try:
+            yield from token_stream
+        finally:
+            trace.finish()
+
+    def _from_cache(self, cached: Dict[str, Any], mode: str, timings: Dict[str, float],
+                    notify: ProgressCallback) -> PreparedAnswer:
+        notify("cache_hit", {"match": cached["match"], "similarity": cached["similarity"]})
+        return PreparedAnswer(iter([cached["answer"]]), cached["sources"], mode, timings, cached)
+
+    # --- Flujos de consulta ---
+
+    def prepare(self, prompt: str, mode: str = MODE_NORMAL,
+                on_progress: Optional[ProgressCallback] = None) -> PreparedAnswer:
+        """
+        Ejecuta todo lo previo a la generación final (recuperación, plan, sub-respuestas).
+
+        Args:
+            prompt: Pregunta del usuario
+            mode: "normal" o "decomposition"
+            on_progress: Callback opcional (evento, datos) para mostrar progreso
+
+        Returns:
+            PreparedAnswer con el stream de tokens de la respuesta final
+        """
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Modo de consulta no válido: {mode!r}")
+        notify = on_progress or (lambda event, data: None)
+        telemetry.count("queries", mode=mode)
+
+        # Toda la consulta usa el mismo retriever aunque el vigilante lo sustituya entre medias
+        retriever = self.retriever
+
+        # La traza sigue abierta hasta que se consume el stream de la respuesta
+        with telemetry.query_trace("query", mode=mode) as trace:
+            if mode == MODE_DECOMPOSITION:
+                prepared = self._prepare_decomposition(retriever, prompt, notify)
+            else:
+                prepared = self._prepare_normal(retriever, prompt, notify)
+        prepared.trace = trace
+        prepared.token_stream = self._finish_trace(prepared.token_stream, trace)
+        return prepared
+
+    def _prepare_normal(self, retriever, prompt: str, notify: ProgressCallback) -> PreparedAnswer:
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        docs = retriever.invoke(prompt)
+        timings["retrieval"] = time.perf_counter() - start
+
+        cached, query_vector = self._lookup_cached(retriever, prompt, MODE_NORMAL, docs)
+        if cached is not None:
+            return self._from_cache(cached, MODE_NORMAL, timings, notify)
+        return self._answer_from_docs(prompt, docs, query_vector, MODE_NORMAL, timings)
+
+    def _answer_from_docs(self, prompt: str, docs, query_vector: Optional[List[float]],
+                          cache_mode: str, timings: Dict[str, float]) -> PreparedAnswer:
+        """Respuesta directa con documentos ya recuperados; se guarda en caché bajo `cache_mode`."""
+        context, sources = build_context_and_sources(docs)
+        token_stream = telemetry.traced_stream(
+            "llm", self.chains["answer_chain"].stream({"context": context, "query": prompt}), chain="answer"
+        )
+        stream = self._stream_and_cache(token_stream, prompt, cache_mode, docs, sources, query_vector)
+        return PreparedAnswer(stream, sources, MODE_NORMAL, timings)
+
+    def _prepare_decomposition(self, retriever, prompt: str, notify: ProgressCallback) -> PreparedAnswer:
+        """
+        Descomposición secuencial.
+
+        La recuperación de la pregunta original (y la consulta a la caché de
+        respuestas) se lanza en segundo plano mientras el LLM genera el plan de
+        sub-preguntas; después se recuperan todas las sub-preguntas en paralelo.
+        Solo las llamadas al LLM para responder quedan en serie.
+        """
+        timings: Dict[str, float] = {}
+        all_sources = []
+        sub_questions_and_answers = []
+
+        def retrieve_original():
+            start = time.perf_counter()
+            docs = retriever.invoke(prompt)
+            timings["retrieval"] = time.perf_counter() - start
+            cached, query_vector = self._lookup_cached(retriever, prompt, MODE_DECOMPOSITION, docs)
+            return docs, cached, query_vector
+
+        with ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS) as executor:
+            # 1. Recuperación especulativa de la pregunta original en segundo plano
+            original_future = executor.submit(telemetry.propagate(retrieve_original))
+
+            # 2. Generar TODAS las sub-preguntas mientras tanto
+            notify("plan_start", {})
+            start = time.perf_counter()
+            plan_tokens = []
+            plan_stream = telemetry.traced_stream(
+                "llm", self.chains["decomposition_chain"].stream({"query": prompt}), chain="decomposition"
+            )
+            with telemetry.span("plan"):
+                for token in plan_stream:
+                    plan_tokens.append(token)
+                    # Si la caché ya tiene la respuesta, se corta la generación del plan
+                    if original_future.done() and original_future.result()[1] is not None:
+                        plan_stream.close()
+                        break
+            timings["plan"] = time.perf_counter() - start
+
+            original_docs, cached, query_vector = original_future.result()
+            if cached is not None:
+                return self._from_cache(cached, MODE_DECOMPOSITION, timings, notify)
+
+            sub_questions = parse_sub_questions("".join(plan_tokens))
+
+            # Si solo hay una pregunta, no hubo descomposición: se responde con lo ya
+            # recuperado (la caché ya se consultó) y se guarda bajo este modo
+            if len(sub_questions) == 1 and sub_questions[0] == prompt:
+                notify("simple", {})
+                return self._answer_from_docs(prompt, original_docs, query_vector,
+                                              MODE_DECOMPOSITION, timings)
+            notify("plan_ready", {"sub_questions": sub_questions})
+
+            # 3. Recuperar documentos de todas las sub-preguntas en paralelo
+            start = time.perf_counter()
+            with telemetry.span("sub_retrieval"):
+                sub_docs = list(executor.map(telemetry.propagate(retriever.invoke), sub_questions))
+            timings["sub_retrieval"] = time.perf_counter() - start
+
+        # 4. Responder cada sub-pregunta secuencialmente con contexto acumulado
+        start = time.perf_counter()
+        for i, (sub_q, docs) in enumerate(zip(sub_questions, sub_docs)):
+            notify("sub_question", {"index": i, "total": len(sub_questions), "question": sub_q})
+
+            with telemetry.span("sub_answer"):
+                # Construir contexto histórico de sub-preguntas anteriores
+                historical_context = ""
+                if sub_questions_and_answers:
+                    historical_context = "\n\nINFORMACIÓN DE SUB-PREGUNTAS ANTERIORES:\n"
+                    for prev_q, prev_a in sub_questions_and_answers:
+                        historical_context += f"Pregunta: {prev_q}\nRespuesta: {prev_a}\n\n"
+
+                # El historial comparte el presupuesto de tokens con los documentos
+                context, sources = build_context_and_sources(docs, context_budget(historical_context))
+
+                # Generar respuesta usando el contexto ampliado
+                extended_context = context + historical_context
+                with telemetry.span("llm", chain="answer"):
+                    sub_answer = self.chains["answer_chain"].invoke({
+                        "context": extended_context,
+                        "query": sub_q
+                    })
+
+            # Guardar la sub-pregunta y su respuesta
+            sub_questions_and_answers.append((sub_q, sub_answer))
+            all_sources.extend(sources)
+        timings["sub_answers"] = time.perf_counter() - start
+
+        # 5. Contexto de la pregunta original (recuperado en segundo plano),
+        #    dentro del presupuesto que dejan las respuestas de las sub-preguntas
+        accumulated_context = ""
+        for sub_q, sub_a in sub_questions_and_answers:
+            accumulated_context += f"Sub-pregunta: {sub_q}\nRespuesta: {sub_a}\n\n"
+
+        original_context, original_sources = build_context_and_sources(
+            original_docs, context_budget(accumulated_context)
+        )
+        all_sources.extend(original_sources)
+
+        # 6. Sintetizar respuesta final con TODA la información
+        notify("synthesis", {})
+
+        token_stream = telemetry.traced_stream("llm", self.chains["synthesis_chain"].stream({
+            "original_query": prompt,
+            "subquerys": accumulated_context,
+            "context": original_context
+        }), chain="synthesis")
+        stream = self._stream_and_cache(token_stream, prompt, MODE_DECOMPOSITION,
+                                        original_docs, all_sources, query_vector)
+        return PreparedAnswer(stream, all_sources, MODE_DECOMPOSITION, timings)
+
+    # --- Puntos de entrada ---
+
+    def answer(self, prompt: str, mode: str = MODE_NORMAL,
+               on_progress: Optional[ProgressCallback] = None) -> QueryResult:
+        """
+        Responde una consulta de forma síncrona.
+
+        Args:
+            prompt: Pregunta del usuario
+            mode: "normal" o "decomposition"
+            on_progress: Callback opcional de progreso
+
+        Returns:
+            QueryResult con respuesta, fuentes y tiempos (ttft y total incluidos)
+        """
+        start = time.perf_counter()
+        prepared = self.prepare(prompt, mode, on_progress)
+
+        parts = []
+        timings = prepared.timings
+        for token in prepared.token_stream:
+            if not parts:
+                timings["ttft"] = time.perf_counter() - start
+            parts.append(token)
+        timings["total"] = time.perf_counter() - start
+
+        return QueryResult(
+            answer="".join(parts),
+            sources=prepared.sources,
+            mode=prepared.mode,
+            timings=timings,
+            cached=prepared.cached["match"] if prepared.cached else None,
+            breakdown=prepared.trace.breakdown() if prepared.trace else []
+        )
+
+    async def aanswer(self, prompt: str, mode: str = MODE_NORMAL) -> QueryResult:
+        """
+        Responde una consulta sin bloquear el bucle de eventos.
+
+        El trabajo (bloqueante: Ollama, Chroma, SQLite) se ejecuta en el
+        executor por defecto del bucle, de modo que varias consultas pueden
+        atenderse a la vez.
+        """
+        return await asyncio.to_thread(self.answer, prompt, mode)
@@ -0,0 +1,316 @@
+# -------------------------------------------------------------------------#
+# QUERY ROUTER - Enrutado de consultas por libro sin LLM
+# -------------------------------------------------------------------------#
+
+"""
+Enrutador de consultas para D&D 5E: predice qué libros consultar
+
+Funcionalidades principales:
+• Léxico de palabras clave por libro (monstruos ➜ Monster Manual, conjuros ➜ Manual del jugador...),
+  aplicado a los documentos de ese libro estén en la carpeta que estén
+• Vocabulario de encabezados construido al indexar (nombres de monstruos, reglas, capítulos)
+• Puntuación por especificidad: un término presente en varios libros reparte su peso
+• Devuelve los `document_name` a los que restringir la búsqueda, o None (búsqueda global)
+  cuando la evidencia es baja o apunta a todos los libros
+"""
+
+import os
+import re
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable, Any
+
+from lexical_index import fold_accents, STOPWORDS
+
+# -------------------------------------------------------------------------#
+# 1. CONFIGURACIÓN Y CONSTANTES
+# -------------------------------------------------------------------------#
+
+MONSTER_MANUAL = "Monster Manual.md"
+PLAYERS_HANDBOOK = "Manual del jugador.md"
+DUNGEON_MASTERS_GUIDE = "Guía del dungeon master.md"
+
+def book_name(document_name: str) -> str:
+    """
+    Libro de un documento: nombre base de su `document_name`.
+
+    El `document_name` (ruta relativa a DATA_DIR, o absoluta) identifica el
+    documento; el léxico, el Monster Manual y las fuentes mostradas usan el libro.
+
+    Args:
+        document_name: Identidad del documento ("libros/Monster Manual.md")
+
+    Returns:
+        Nombre base ("Monster Manual.md")
+    """
+    return document_name.replace("\\", "/").rsplit("/", 1)[-1]
+
+# Léxico por libro: término o frase ➜ peso (se normaliza igual que las consultas)
+BOOK_LEXICON: Dict[str, Dict[str, float]] = {
+    MONSTER_MANUAL: {
+        "monstruo": 2.0, "manual de monstruo": 3.0, "desafio": 2.0, "valor de desafio": 3.0,
+        "accion legendaria": 3.0, "guarida": 2.0, "accion de guarida": 3.0,
+        "efectos regionales": 2.0, "multiataque": 2.0,
+        "clase de armadura": 1.0, "punto de golpe": 1.0, "perfil": 1.0,
+        "dragon": 1.5, "demonio": 1.5, "diablo": 1.5, "no muerto": 1.5, "aberracion": 1.5,
+        "monstruosidad": 1.5, "gigante": 1.0, "limo": 1.5, "constructo": 1.5,
+        "infernal": 1.0, "feerico": 1.0, "lich": 2.0, "beholder": 2.0, "goblin": 1.5,
+        "orco": 1.0, "vampiro": 1.5, "zombi": 1.5, "esqueleto": 1.5, "licantropo": 1.5
+    },
+    PLAYERS_HANDBOOK: {
+        "conjuro": 2.0, "hechizo": 2.0, "truco": 1.5, "espacio de conjuro": 3.0,
+        "lanzamiento de conjuro": 3.0, "componente": 1.0, "concentracion": 1.5,
+        "clase": 1.0, "subclase": 2.0, "subir de nivel": 2.0, "multiclase": 2.0,
+        "raza": 2.0, "rasgos raciales": 3.0, "trasfondo": 2.0, "dote": 2.0,
+        "competencia": 1.5, "bonificador por competencia": 3.0, "tirada de salvacion": 1.5,
+        "puntuacion de caracteristica": 2.0, "ventaja": 1.5, "desventaja": 1.5,
+        "descanso corto": 2.0, "descanso largo": 2.0, "ataque de oportunidad": 3.0,
+        "accion adicional": 2.0, "reaccion": 1.0, "cobertura": 1.5, "esquivar": 2.0,
+        "estado": 1.0, "apresado": 2.0, "derribado": 2.0, "envenenado": 1.5, "cegado": 2.0,
+        "asustado": 2.0, "hechizado": 2.0, "aturdido": 2.0, "paralizado": 1.5,
+        "petrificado": 1.5, "incapacitado": 2.0, "inconsciente": 2.0, "ensordecido": 2.0,
+        "personaje": 1.0, "equipo": 1.0, "arma": 1.0, "armadura": 1.0,
+        "barbaro": 2.0, "bardo": 2.0, "brujo": 2.0, "clerigo": 2.0, "druida": 2.0,
+        "explorador": 2.0, "guerrero": 2.0, "hechicero": 2.0, "mago": 1.5, "monje": 2.0,
+        "paladin": 2.0, "picaro": 2.0, "enano": 1.5, "elfo": 1.5, "mediano": 1.5,
+        "humano": 1.5, "draconido": 2.0, "gnomo": 1.5, "semielfo": 2.0, "semiorco": 2.0,
+        "tiefling": 2.0
+    },
+    DUNGEON_MASTERS_GUIDE: {
+        "dm": 2.0, "dungeon master": 3.0, "master": 1.5, "objeto magico": 3.0, "tesoro": 2.0,
+        "artefacto": 2.0, "reliquia": 2.0, "sintonizacion": 2.0, "trampa": 2.0,
+        "encuentro": 1.5, "encuentro aleatorio": 3.0, "dificultad del encuentro": 3.0,
+        "mazmorra aleatoria": 3.0, "multiverso": 1.5, "cosmologia": 2.0, "campaña": 1.5,
+        "aventura": 1.0, "pnj": 2.0, "villano": 2.0, "regla opcional": 3.0, "variante": 1.0,
+        "locura": 2.0, "don epico": 3.0, "renombre": 2.0, "persecucion": 2.0,
+        "enfermedad": 1.0, "clima": 1.5, "pocion": 1.5, "pergamino de conjuro": 2.0,
+        "varita": 1.5, "anillo": 1.0, "poco comun": 2.0, "raro": 1.0,
+        "legendario": 1.0, "muy raro": 2.0
+    }
+}
+
+# Pesos del vocabulario de encabezados (se reparten entre los libros que lo contienen)
+HEADING_PHRASE_WEIGHT = 2.0
+HEADING_WORD_WEIGHT = 1.0
+HEADING_TERM_WEIGHT = 0.5
+
+# Longitud máxima (en palabras) de las frases buscadas en la consulta
+MAX_NGRAM = 4
+
+VOCABULARY_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PLURAL_ES_RE = re.compile(r"(?<=[nrldzj])es$")
+
+def _stem(token: str) -> str:
+    """Singular aproximado: "dragones" ➜ "dragon", "conjuros" ➜ "conjuro"."""
+    if len(token) > 4 and _PLURAL_ES_RE.search(token):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+def normalize_terms(text: str) -> List[str]:
+    """
+    Tokeniza un texto para el enrutado: minúsculas, sin tildes, sin números y en singular.
+
+    Args:
+        text: Consulta o encabezado
+
+    Returns:
+        Lista de términos normalizados, en orden
+    """
+    return [_stem(token) for token in _TOKEN_RE.findall(fold_accents(text)) if not token.isdigit()]
+
+def _ngrams(terms: List[str], max_n: int = MAX_NGRAM) -> Iterable[str]:
+    for n in range(1, max_n + 1):
+        for i in range(len(terms) - n + 1):
+            yield " ".join(terms[i:i + n])
+
+def _is_content_term(term: str) -> bool:
+    return len(term) > 2 and term not in STOPWORDS
+
+# -------------------------------------------------------------------------#
+# 2. VOCABULARIO DE ENCABEZADOS (construido al indexar)
+# -------------------------------------------------------------------------#
+
+def build_vocabulary(metadatas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Construye el vocabulario de encabezados a partir de los metadatos de los chunks.
+
+    Args:
+        metadatas: Metadatos de los chunks (`document_name`, `section_path`)
+
+    Returns:
+        Vocabulario serializable: chunks por libro, encabezados y términos ➜ libros
+    """
+    documents: Dict[str, int] = {}
+    headings: Dict[str, set] = {}
+    terms: Dict[str, set] = {}
+    seen_paths = set()
+
+    for metadata in metadatas:
+        doc_name = (metadata or {}).get("document_name")
+        if not doc_name:
+            continue
+        documents[doc_name] = documents.get(doc_name, 0) + 1
+
+        section_path = metadata.get("section_path", "")
+        if (doc_name, section_path) in seen_paths:
+            continue
+        seen_paths.add((doc_name, section_path))
+
+        for heading in section_path.split(" > "):
+            heading_terms = normalize_terms(heading)
+            for term in heading_terms:
+                if _is_content_term(term):
+                    terms.setdefault(term, set()).add(doc_name)
+            phrase = " ".join(heading_terms)
+            if len(phrase) >= 4 and len(heading_terms) <= MAX_NGRAM:
+                headings.setdefault(phrase, set()).add(doc_name)
+
+    return {
+        "version": VOCABULARY_VERSION,
+        "documents": documents,
+        "headings": {phrase: sorted(docs) for phrase, docs in sorted(headings.items())},
+        "terms": {term: sorted(docs) for term, docs in sorted(terms.items())}
+    }
+
+def save_vocabulary(vocabulary: Dict[str, Any], path: Path) -> None:
+    """Guarda el vocabulario de forma atómica (fichero temporal + rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# -------------------------------------------------------------------------#
+# 3. ENRUTADOR
+# -------------------------------------------------------------------------#
+
+@dataclass
+class RouteDecision:
+    """Resultado del enrutado: libros a consultar (None = todos) y puntuaciones."""
+    document_names: Optional[List[str]]
+    scores: Dict[str, float] = field(default_factory=dict)
+    confidence: float = 0.0
+
+    @property
+    def target(self) -> str:
+        return ", ".join(self.document_names) if self.document_names else "global"
+
+class QueryRouter:
+    """
+    Enrutador léxico: léxico fijo + vocabulario de encabezados del índice.
+
+    El vocabulario se relee cuando cambia el fichero (p. ej. tras una
+    ingestión desde `setup_db.py`), igual que la generación del índice.
+    """
+
+    def __init__(
+        self,
+        vocabulary_path: Path,
+        min_score: float = 1.5,
+        min_confidence: float = 0.7,
+        lexicon: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        self.vocabulary_path = Path(vocabulary_path)
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+        self._lexicon: Dict[str, Dict[str, float]] = {}
+        for book, entries in (lexicon if lexicon is not None else BOOK_LEXICON).items():
+            for phrase, weight in entries.items():
+                key = " ".join(normalize_terms(phrase))
+                self._lexicon.setdefault(key, {})[book] = weight
+        self._mtime = -1
+        self._vocabulary: Dict[str, Any] = {}
+        # Libro ➜ document_name indexados con ese nombre base
+        self._books: Dict[str, List[str]] = {}
+
+    def _load_vocabulary(self) -> Dict[str, Any]:
+        try:
+            mtime = self.vocabulary_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._vocabulary = -1, {}
+            return self._vocabulary
+        if mtime != self._mtime:
+            try:
+                with open(self.vocabulary_path, "r", encoding="utf-8") as f:
+                    vocabulary = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                vocabulary = {}
+            if vocabulary.get("version") != VOCABULARY_VERSION:
+                vocabulary = {}
+            books: Dict[str, List[str]] = {}
+            for doc_name in vocabulary.get("documents", {}):
+                books.setdefault(book_name(doc_name), []).append(doc_name)
+            self._mtime, self._vocabulary, self._books = mtime, vocabulary, books
+        return self._vocabulary
+
+    def score(self, query: str) -> Dict[str, float]:
+        """
+        Puntúa cada libro indexado según la evidencia léxica de la consulta.
+
+        Args:
+            query: Pregunta del usuario
+
+        Returns:
+            Diccionario document_name ➜ puntuación (solo libros con evidencia)
+        """
+        vocabulary = self._load_vocabulary()
+        books = self._books
+        documents = vocabulary.get("documents", {})
+        headings = vocabulary.get("headings", {})
+        terms = vocabulary.get("terms", {})
+
+        scores: Dict[str, float] = {}
+
+        def add(doc_names: Iterable[str], weight: float) -> None:
+            doc_names = [name for name in doc_names if name in documents]
+            for name in doc_names:
+                scores[name] = scores.get(name, 0.0) + weight / len(doc_names)
+
+        for ngram in set(_ngrams(normalize_terms(query))):
+            for book, weight in self._lexicon.get(ngram, {}).items():
+                add(books.get(book, []), weight)
+            is_phrase = " " in ngram
+            if not is_phrase and not _is_content_term(ngram):
+                continue
+            if ngram in headings:
+                add(headings[ngram], HEADING_PHRASE_WEIGHT if is_phrase else HEADING_WORD_WEIGHT)
+            if not is_phrase and ngram in terms:
+                add(terms[ngram], HEADING_TERM_WEIGHT)
+
+        return scores
+
+    def route(self, query: str) -> RouteDecision:
+        """
+        Decide en qué libros buscar.
+
+        Se eligen los libros mejor puntuados hasta acumular `min_confidence`
+        de la evidencia total. Si la evidencia es menor que `min_score` o la
+        selección incluye todos los libros, la búsqueda es global.
+
+        Args:
+            query: Pregunta del usuario
+
+        Returns:
+            RouteDecision con los document_name elegidos o None (búsqueda global)
+        """
+        scores = self.score(query)
+        total = sum(scores.values())
+        if total < self.min_score:
+            return RouteDecision(None, scores)
+
+        selected, share = [], 0.0
+        for doc_name, value in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            selected.append(doc_name)
+            share += value / total
+            if share >= self.min_confidence:
+                break
+
+        if len(selected) >= len(self._vocabulary.get("documents", {})):
+            return RouteDecision(None, scores, share)
+        return RouteDecision(sorted(selected), scores, share)
@@ -1,34 +1,23 @@
 # -------------------------------------------------------------------------#
-# RAG INTERFACE - Interfaz de usuario y motor de consultas para D&D 5E
+# RAG INTERFACE - Interfaz de usuario de Streamlit para D&D 5E
 # -------------------------------------------------------------------------#
 
+import time
 import streamlit as st
 import pandas as pd
-from typing import List, Dict, Any
+from typing import Dict, Iterator
 
 # Importaciones desde módulos internos del proyecto
-from config import (
-    LANGSMITH_TRACING,
-    LANGCHAIN_API_KEY,
-    LANGCHAIN_PROJECT,
-    LLM_MODEL,
-    RETRIEVAL_K
+from config import RETRIEVAL_K, TELEMETRY_SIDEBAR, OLLAMA_WARMUP
+from vector_pipeline import get_retriever, get_embeddings
+from ollama_client import get_warmup_timings
+from query_engine import (
+    QueryEngine,
+    MODE_NORMAL,
+    MODE_DECOMPOSITION,
+    create_model,
+    create_answer_cache
 )
-from vector_pipeline import get_retriever
-
-# Configuración de LangSmith para trazabilidad (opcional)
-if LANGSMITH_TRACING:
-    import os
-    os.environ["LANGSMITH_TRACING"] = "true"
-    os.environ["LANGCHAIN_API_KEY"] = LANGCHAIN_API_KEY
-    os.environ["LANGCHAIN_PROJECT"] = LANGCHAIN_PROJECT
-
-# Importaciones de LangChain
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from prompts import ANSWER_PROMPT, DECOMPOSITION_PROMPT, SYNTHESIS_PROMPT
-import re
 
 # -------------------------------------------------------------------------#
 # 1. CARGA DE MODELOS (CON CACHÉ)
@@ -37,74 +26,60 @@ import re
 @st.cache_resource
 def load_model():
     """Carga el modelo LLM con caché de Streamlit para evitar recargas."""
-    return OllamaLLM(model=LLM_MODEL, temperature=0)
+    # Se calientan ambos modelos al arrancar, no en la primera pregunta
+    get_embeddings(warm_up=OLLAMA_WARMUP)
+    return create_model(warm_up=OLLAMA_WARMUP)
 
-# -------------------------------------------------------------------------#
-# 2. CONFIGURACIÓN DE CADENAS DE PROCESAMIENTO
-# -------------------------------------------------------------------------#
+@st.cache_resource
+def load_answer_cache():
+    """Abre la caché persistente de respuestas (None si está deshabilitada)."""
+    return create_answer_cache()
 
-def initialize_chains(model, retriever):
-    """Inicializa las cadenas de procesamiento con el modelo y retriever dados."""
-    answer_chain = ANSWER_PROMPT | model | StrOutputParser()
-    decomposition_chain = DECOMPOSITION_PROMPT | model | StrOutputParser()
-    synthesis_chain = SYNTHESIS_PROMPT | model | StrOutputParser()
-    
-    return {
-        "answer_chain": answer_chain,
-        "decomposition_chain": decomposition_chain,
-        "synthesis_chain": synthesis_chain,
-        "retriever": retriever
-    }
+def load_engine() -> QueryEngine:
+    """Crea el motor de consultas con el modelo, el retriever y la caché compartidos."""
+    return QueryEngine(
+        retriever=get_retriever(k=RETRIEVAL_K),
+        model=load_model(),
+        answer_cache=load_answer_cache()
+    )
 
 # -------------------------------------------------------------------------#
-# 3. UTILIDADES
+# 2. UTILIDADES
 # -------------------------------------------------------------------------#
 
-def build_context_and_sources(docs):
-    """Construye el contexto con metadata y extrae las fuentes de los documentos recuperados."""
-    context_parts = []
-    sources = []
-    seen_sources = set()
-    
-    for i, doc in enumerate(docs, 1):
-        fn = doc.metadata.get("document_name", "desconocido")
-        page = doc.metadata.get("page_number", "N/A")
-        source_key = (fn, page)
-        
-        # Incluir metadata en el contexto para el modelo
-        metadata_header = f"[FUENTE: {fn}, Página: {page}]"
-        content_with_metadata = f"{metadata_header}\n{doc.page_content}"
-        context_parts.append(content_with_metadata)
-        
-        if source_key not in seen_sources:
-            path = doc.metadata.get("section_path", "")
-            path_str = path if path else "Sin sección"
-            snippet = (doc.page_content[:120] + "…") if len(doc.page_content) > 120 else doc.page_content
-            
-            sources.append({
-                "Archivo": fn,
-                "Página": page,
-                "Sección": path_str,
-                "Extracto": snippet,
-            })
-            seen_sources.add(source_key)
+def timed_stream(token_stream, start: float, timings: Dict[str, float]) -> Iterator[str]:
+    """
+    Reenvía un stream de tokens registrando el tiempo hasta el primer token y el total.
     
-    return "\n\n---\n\n".join(context_parts), sources
-
+    Args:
+        token_stream: Iterador de fragmentos de texto (o un texto completo)
+        start: Instante (perf_counter) en que se envió la pregunta
+        timings: Diccionario donde se guardan `ttft` y `total` en segundos
+    """
+    if isinstance(token_stream, str):
+        token_stream = [token_stream]
+    for token in token_stream:
+        if "ttft" not in timings:
+            timings["ttft"] = time.perf_counter() - start
+        yield token
+    timings["total"] = time.perf_counter() - start
 
+def format_timings(timings: Dict[str, float]) -> str:
+    """Texto breve con los tiempos de una respuesta."""
+    if not timings:
+        return ""
+    ttft = timings.get("ttft", timings.get("total", 0.0))
+    return f"⏱️ Primer token: {ttft:.2f}s · Total: {timings.get('total', 0.0):.2f}s"
 
-def parse_sub_questions(text: str) -> List[str]:
-    """Parsea la salida del LLM para extraer las sub-preguntas."""
-    questions = re.findall(r"^\d+\.\s*(.*)", text, re.MULTILINE)
-    
-    if not questions:
-        # Si no hay lista numerada, podría ser una única pregunta devuelta
-        return [text.strip()]
-        
-    return [q.strip() for q in questions]
+def show_cache_hit(cached):
+    """Indica en la UI que la respuesta procede de la caché."""
+    if cached["match"] == "exact":
+        st.caption("⚡ Respuesta recuperada de la caché")
+    else:
+        st.caption(f"⚡ Respuesta recuperada de la caché (pregunta similar, {cached['similarity']:.0%})")
 
 # -------------------------------------------------------------------------#
-# 4. INTERFAZ DE STREAMLIT
+# 3. INTERFAZ DE STREAMLIT
 # -------------------------------------------------------------------------#
 
 def create_ui():
@@ -128,89 +103,98 @@ def create_ui():
     
     return query_mode
 
+def show_query_cache_stats(retriever):
+    """Muestra en el sidebar los aciertos y el tiempo ahorrado por la caché de consultas."""
+    query_cache = getattr(retriever, "query_cache", None)
+    if query_cache is None:
+        return
+    
+    stats = query_cache.stats()
+    with st.sidebar.expander("⚡ Caché de consultas"):
+        st.caption(f"Generación del índice: {stats['generation']}")
+        for label, key in (("Embeddings de consulta", "embeddings"), ("Resultados top-k", "results")):
+            cache_stats = stats[key]
+            hit_rate = cache_stats["hit_rate"]
+            st.markdown(
+                f"**{label}**: {cache_stats['hits']} aciertos / {cache_stats['misses']} fallos "
+                f"({hit_rate:.0%} acierto)" if hit_rate is not None else f"**{label}**: sin consultas"
+            )
+            st.caption(f"Latencia ahorrada: {cache_stats['saved_seconds']:.2f}s")
+
+def show_warmup_timings():
+    """Muestra en el sidebar lo que tardó cada modelo en cargarse al arrancar."""
+    timings = get_warmup_timings()
+    if not timings:
+        return
+    
+    with st.sidebar.expander("🔥 Calentamiento de modelos"):
+        for model, seconds in timings.items():
+            st.markdown(f"**{model}**: {seconds:.2f}s")
+        st.caption("Medido al arrancar, fuera de la latencia de las consultas")
+
+def show_query_breakdown():
+    """Muestra en el sidebar el desglose de tiempos por etapa de la última consulta."""
+    breakdown = st.session_state.get("last_breakdown")
+    if not TELEMETRY_SIDEBAR or not breakdown:
+        return
+    
+    with st.sidebar.expander("⏱️ Desglose de la última consulta"):
+        df = pd.DataFrame(breakdown)
+        df["ms"] = (df.pop("seconds") * 1000).round(1)
+        st.dataframe(df.rename(columns={"span": "Etapa", "count": "Llamadas"}),
+                     hide_index=True, use_container_width=True)
+        st.caption("Las etapas se solapan (p. ej. `retrieval` incluye `vector_search`).")
+
 # -------------------------------------------------------------------------#
-# 5. LÓGICA PRINCIPAL DE PROCESAMIENTO
+# 4. LÓGICA PRINCIPAL DE PROCESAMIENTO
 # -------------------------------------------------------------------------#
 
-def process_normal_query(chains, prompt):
-    """Procesa una consulta normal sin descomposición."""
-    with st.spinner("🔍 Recuperando información y generando respuesta..."):
-        docs = chains["retriever"].invoke(prompt)
-        context, sources = build_context_and_sources(docs)
-        answer = chains["answer_chain"].invoke({"context": context, "query": prompt})
-        
-    return answer, sources
+def process_normal_query(engine, prompt):
+    """
+    Procesa una consulta normal sin descomposición.
+    
+    Returns:
+        PreparedAnswer con el stream de tokens de la respuesta
+    """
+    with st.spinner("🔍 Recuperando información..."):
+        prepared = engine.prepare(prompt, MODE_NORMAL)
+    if prepared.cached is not None:
+        show_cache_hit(prepared.cached)
+    return prepared
 
-def process_decomposition_query(chains, prompt):
-    """Procesa una consulta con descomposición secuencial."""
-    all_sources = []
-    sub_questions_and_answers = []
+def process_decomposition_query(engine, prompt):
+    """
+    Procesa una consulta con descomposición secuencial mostrando el progreso.
     
+    Returns:
+        PreparedAnswer con el stream de tokens de la síntesis
+    """
     with st.status("🧠 Analizando y descomponiendo la pregunta...", expanded=True) as status:
-        # 1. Generar TODAS las sub-preguntas primero
-        st.write("Generando plan de consulta completo...")
-        sub_questions_text = chains["decomposition_chain"].invoke({"query": prompt})
-        sub_questions = parse_sub_questions(sub_questions_text)
-        
-        # Si solo hay una pregunta, no hubo descomposición
-        if len(sub_questions) == 1 and sub_questions[0] == prompt:
-            status.update(label="La pregunta es simple. Procediendo con consulta normal.", state="complete", expanded=False)
-            return process_normal_query(chains, prompt)
-        else:
-            status.update(label=f"Plan generado: {len(sub_questions)} sub-preguntas.", state="running", expanded=True)
-        
-        # 2. Procesar cada sub-pregunta secuencialmente con contexto acumulado
-        for i, sub_q in enumerate(sub_questions):
-            st.write(f"**Paso {i+1}/{len(sub_questions)}: Respondiendo a _'{sub_q}'_**")
-            
-            # Recuperar documentos para la sub-pregunta
-            docs = chains["retriever"].invoke(sub_q)
-            context, sources = build_context_and_sources(docs)
-            
-            # Construir contexto histórico de sub-preguntas anteriores
-            historical_context = ""
-            if sub_questions_and_answers:
-                historical_context = "\n\nINFORMACIÓN DE SUB-PREGUNTAS ANTERIORES:\n"
-                for prev_q, prev_a in sub_questions_and_answers:
-                    historical_context += f"Pregunta: {prev_q}\nRespuesta: {prev_a}\n\n"
-            
-            # Generar respuesta usando el contexto ampliado
-            extended_context = context + historical_context
-            sub_answer = chains["answer_chain"].invoke({
-                "context": extended_context, 
-                "query": sub_q
-            })
-            
-            # Guardar la sub-pregunta y su respuesta
-            sub_questions_and_answers.append((sub_q, sub_answer))
-            all_sources.extend(sources)
+        def on_progress(event, data):
+            if event == "plan_start":
+                st.write("Generando plan de consulta completo...")
+            elif event == "cache_hit":
+                status.update(label="Respuesta encontrada en caché.", state="complete", expanded=False)
+            elif event == "simple":
+                status.update(label="La pregunta es simple. Procediendo con consulta normal.", state="complete", expanded=False)
+            elif event == "plan_ready":
+                status.update(label=f"Plan generado: {len(data['sub_questions'])} sub-preguntas.", state="running", expanded=True)
+            elif event == "sub_question":
+                st.write(f"**Paso {data['index']+1}/{data['total']}: Respondiendo a _'{data['question']}'_**")
+            elif event == "synthesis":
+                status.update(label="Sintetizando la respuesta final...", state="running")
+                st.write("✍️ Creando la respuesta final integrando todo el conocimiento...")
         
-        # 3. Recuperar contexto para la pregunta original
-        status.update(label="Recuperando contexto para la pregunta original...", state="running")
-        original_docs = chains["retriever"].invoke(prompt)
-        original_context, original_sources = build_context_and_sources(original_docs)
-        all_sources.extend(original_sources)
-        
-        # 4. Sintetizar respuesta final con TODA la información
-        status.update(label="Sintetizando la respuesta final...", state="running")
-        st.write("✍️ Creando la respuesta final integrando todo el conocimiento...")
-        
-        # Construir el contexto completo de sub-preguntas
-        accumulated_context = ""
-        for sub_q, sub_a in sub_questions_and_answers:
-            accumulated_context += f"Sub-pregunta: {sub_q}\nRespuesta: {sub_a}\n\n"
-        
-        final_answer = chains["synthesis_chain"].invoke({
-            "original_query": prompt,
-            "subquerys": accumulated_context,
-            "context": original_context
-        })
-        
-        status.update(label="¡Respuesta completada!", state="complete", expanded=False)
+        prepared = engine.prepare(prompt, MODE_DECOMPOSITION, on_progress=on_progress)
+        if prepared.cached is None:
+            status.update(label="¡Plan completado! Generando la respuesta final...", state="complete", expanded=False)
     
-    return final_answer, all_sources
+    if prepared.cached is not None:
+        show_cache_hit(prepared.cached)
+    return prepared
+
 # -------------------------------------------------------------------------#
-# 6. PUNTO DE ENTRADA PRINCIPAL
+# 5. PUNTO DE ENTRADA PRINCIPAL
 # -------------------------------------------------------------------------#
 
 def main():
@@ -226,17 +210,17 @@ def main():
     for m in st.session_state.messages:
         with st.chat_message(m["role"]):
             st.markdown(m["content"])
+            if m.get("timings"):
+                st.caption(format_timings(m["timings"]))
             if "sources" in m and m["sources"]:
                 with st.expander("📚 Fuentes Consultadas"):
                     df = pd.DataFrame(m["sources"])
                     st.dataframe(df, hide_index=True, use_container_width=True)
     
-    # Cargar modelo y retriever
-    model = load_model()
-    retriever = get_retriever(k=RETRIEVAL_K)
-    
-    # Inicializar cadenas de procesamiento
-    chains = initialize_chains(model, retriever)
+    # Cargar el motor de consultas (modelo, retriever y cachés)
+    engine = load_engine()
+    show_query_cache_stats(engine.retriever)
+    show_warmup_timings()
     
     # Procesar entrada del usuario
     if prompt := st.chat_input("Escribe tu pregunta sobre D&D…"):
@@ -247,14 +231,19 @@ def main():
             
         # Mostrar mensaje del asistente
         with st.chat_message("assistant"):
+            start = time.perf_counter()
+            timings: Dict[str, float] = {}
+            
             # Elegir flujo de procesamiento según modo seleccionado
             if query_mode == "Descomposición Secuencial":
-                final_answer, final_sources = process_decomposition_query(chains, prompt)
+                prepared = process_decomposition_query(engine, prompt)
             else:
-                final_answer, final_sources = process_normal_query(chains, prompt)
+                prepared = process_normal_query(engine, prompt)
+            final_sources = prepared.sources
                 
-            # Mostrar respuesta
-            st.markdown(final_answer)
+            # Mostrar respuesta a medida que se genera
+            final_answer = st.write_stream(timed_stream(prepared.token_stream, start, timings))
+            st.caption(format_timings(timings))
             
             # Mostrar fuentes consolidadas
             if final_sources:
@@ -265,12 +254,18 @@ def main():
                     with st.expander("📚 Fuentes Consultadas"):
                         st.dataframe(df[["Archivo", "Página", "Extracto"]], hide_index=True, use_container_width=True)
             
+            if prepared.trace is not None:
+                st.session_state.last_breakdown = prepared.trace.breakdown()
+            
             # Guardar en historial
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": final_answer,
-                "sources": final_sources
+                "sources": final_sources,
+                "timings": timings
             })
+    
+    show_query_breakdown()
 
 # Ejecutar la aplicación solo si se ejecuta directamente (no al importar)
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+# -------------------------------------------------------------------------#
+# RETRIEVERS - Recuperadores de chunks para el motor de consultas
+# -------------------------------------------------------------------------#
+
+"""
+Recuperadores de LangChain para D&D 5E
+
+Funcionalidades principales:
+• Búsqueda vectorial con caché de embeddings de consulta y de resultados
+• Búsqueda híbrida: similitud vectorial (Chroma) + BM25 (FTS5)
+• Fusión de rankings con Reciprocal Rank Fusion
+• Enrutado opcional por libro: filtro por document_name con vuelta a la búsqueda global
+• Diversificación en dos etapas: pool de candidatos con sus vectores + MMR vectorizado
+• Backend vectorial intercambiable: Chroma o índice mmap cuantizado (MmapVectorIndex)
+• Inyección del bloque de estadísticas exacto cuando la consulta nombra un monstruo
+• Atajo por encabezado: si la consulta nombra una sección conocida, sus chunks por ID sin embedding
+• Recuperación padre-hijo: los chunks encontrados se amplían a su página o a su texto vecino
+"""
+
+from typing import List, Any, Optional, Tuple, Dict
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from lexical_index import reciprocal_rank_fusion
+from mmap_index import MmapVectorIndex
+import telemetry
+
+# Resultado de la primera etapa: (chunks, vectores o None, relevancia o None)
+Candidates = Tuple[List[Document], Optional[np.ndarray], Optional[np.ndarray]]
+
+def _chunk_key(doc: Document) -> str:
+    return doc.metadata.get("chunk_id") or doc.id or doc.page_content
+
+# -------------------------------------------------------------------------#
+# 1. MAXIMAL MARGINAL RELEVANCE
+# -------------------------------------------------------------------------#
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def mmr_select(
+    query_vector: np.ndarray,
+    candidate_vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.7,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    Selecciona k candidatos con Maximal Marginal Relevance.
+
+    Se calcula una única matriz de similitud coseno entre candidatos; cada
+    paso actualiza con NumPy la similitud máxima de todos los candidatos
+    con los ya elegidos (k pasos, sin bucles por pares).
+
+    Args:
+        query_vector: Embedding de la consulta
+        candidate_vectors: Matriz (n, d) con los vectores de los candidatos
+        k: Número de candidatos a elegir
+        lambda_mult: Peso de la relevancia frente a la diversidad (1 = solo relevancia)
+        relevance: Relevancia de cada candidato; por defecto, su coseno con la consulta
+
+    Returns:
+        Índices de los candidatos elegidos, en orden de selección
+    """
+    n = len(candidate_vectors)
+    if n <= k:
+        return list(range(n))
+
+    vectors = _normalize_rows(np.asarray(candidate_vectors, dtype=np.float32))
+    if relevance is None:
+        relevance = vectors @ _normalize_rows(np.asarray(query_vector, dtype=np.float32))
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
+
+# -------------------------------------------------------------------------#
+# 2. RECUPERADOR VECTORIAL
+# -------------------------------------------------------------------------#
+
+class VectorRetriever(BaseRetriever):
+    """
+    Búsqueda por similitud en Chroma con caché opcional del lado de la consulta.
+
+    El embedding de la consulta se calcula aquí (y no dentro de Chroma) para
+    poder reutilizarlo entre consultas equivalentes. Con un `router`, la
+    búsqueda se limita a los libros predichos; si el filtro devuelve menos
+    de `k` chunks se repite sin filtro. Con `mmr_lambda`, se recuperan
+    `mmr_fetch_k` candidatos junto con sus vectores y MMR elige los `k` finales.
+    Con un `monster_index`, los bloques de estadísticas (o la tabla filtrada)
+    que pide la consulta ocupan los primeros puestos y sustituyen a los chunks
+    recuperados de la misma página; siempre queda al menos un chunk recuperado.
+    Con un `heading_index`, si la consulta solo nombra secciones conocidas
+    ("¿Qué es el estado apresado?") se devuelven sus chunks sin calcular el
+    embedding; si pide algo más, esas secciones encabezan los resultados.
+    Con un `page_store` y `parent_mode` ("page" o "neighbors"), cada chunk
+    encontrado se sustituye por su página completa (sin repetir páginas) o
+    por una ventana con el texto que lo rodea.
+    """
+
+    vector_store: Any
+    k: int = 4
+    query_cache: Optional[Any] = None
+    router: Optional[Any] = None
+    route_overfetch: int = 3
+    mmr_lambda: Optional[float] = None
+    mmr_fetch_k: int = 20
+    monster_index: Optional[Any] = None
+    heading_index: Optional[Any] = None
+    page_store: Optional[Any] = None
+    parent_mode: str = "off"
+    parent_max_chars: int = 4000
+    parent_window_chars: int = 600
+
+    @property
+    def use_mmr(self) -> bool:
+        return self.mmr_lambda is not None and self.mmr_lambda < 1
+
+    def embed_query(self, query: str) -> List[float]:
+        """Calcula (o recupera de la caché) el embedding de la consulta."""
+        embed = self.vector_store.embeddings.embed_query
+        with telemetry.span("query_embedding"):
+            if self.query_cache is None:
+                return embed(query)
+            return self.query_cache.get_or_embed(query, embed)
+
+    def route(self, query: str) -> Optional[List[str]]:
+        """Libros en los que buscar según el router (None = todos)."""
+        if self.router is None:
+            return None
+        with telemetry.span("routing"):
+            decision = self.router.route(query)
+        telemetry.count("route", target=decision.target)
+        return decision.document_names
+
+    def _query_collection(self, vector: List[float], k: int, where: Optional[Dict[str, Any]] = None,
+                          with_vectors: bool = False) -> Tuple[List[Document], Optional[np.ndarray]]:
+        include = ["documents", "metadatas"] + (["embeddings"] if with_vectors else [])
+        result = self.vector_store._collection.query(
+            query_embeddings=[vector], n_results=k, where=where, include=include
+        )
+        docs = [
+            Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+            for chunk_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+        ]
+        vectors = np.asarray(result["embeddings"][0], dtype=np.float32) if with_vectors else None
+        return docs, vectors
+
+    def _vector_search(self, vector: List[float], k: int,
+                       document_names: Optional[List[str]] = None,
+                       min_results: Optional[int] = None,
+                       with_vectors: bool = False) -> Tuple[List[Document], Optional[np.ndarray]]:
+        with telemetry.span("vector_search"):
+            # El índice mmap filtra por libro recorriendo solo sus filas
+            if isinstance(self.vector_store, MmapVectorIndex):
+                return self.vector_store.search(vector, k, document_names, with_vectors)
+
+            if not document_names:
+                return self._query_collection(vector, k, with_vectors=with_vectors)
+
+            # El filtro `where` de Chroma recorre los metadatos antes de buscar y es
+            # varias veces más lento: primero se sobremuestrea sin filtro y se filtra aquí
+            allowed = set(document_names)
+            candidates, vectors = self._query_collection(vector, k * self.route_overfetch, with_vectors=with_vectors)
+            keep = [i for i, doc in enumerate(candidates) if doc.metadata.get("document_name") in allowed][:k]
+            if len(keep) >= (min_results or k):
+                return [candidates[i] for i in keep], (vectors[keep] if with_vectors else None)
+
+            telemetry.count("route_where_filter")
+            return self._query_collection(
+                vector, k, where={"document_name": {"$in": document_names}}, with_vectors=with_vectors
+            )
+
+    def _stored_vectors(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Vectores almacenados de los chunks indicados (chunk_id ➜ vector)."""
+        if isinstance(self.vector_store, MmapVectorIndex):
+            return self.vector_store.get_vectors(chunk_ids)
+        result = self.vector_store._collection.get(ids=chunk_ids, include=["embeddings"])
+        return dict(zip(result["ids"], np.asarray(result["embeddings"], dtype=np.float32)))
+
+    def _stored_documents(self, chunk_ids: List[str]) -> List[Document]:
+        """Chunks indicados, en el mismo orden (se omiten los IDs desconocidos)."""
+        if isinstance(self.vector_store, MmapVectorIndex):
+            return self.vector_store.get_documents(chunk_ids)
+        result = self.vector_store._collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+        found = {
+            chunk_id: Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [found[chunk_id] for chunk_id in chunk_ids if chunk_id in found]
+
+    def _candidates(self, query: str, vector: List[float],
+                    document_names: Optional[List[str]] = None) -> Candidates:
+        """Primera etapa: candidatos ordenados por relevancia (con vectores si hay MMR)."""
+        pool = max(self.k, self.mmr_fetch_k) if self.use_mmr else self.k
+        docs, vectors = self._vector_search(vector, pool, document_names, min_results=self.k,
+                                            with_vectors=self.use_mmr)
+        return docs, vectors, None
+
+    def _select(self, vector: List[float], candidates: Candidates) -> List[Document]:
+        """Segunda etapa: MMR sobre el pool (o los k primeros si no hay MMR)."""
+        docs, vectors, relevance = candidates
+        if not self.use_mmr or vectors is None or len(docs) <= self.k:
+            return docs[:self.k]
+        with telemetry.span("mmr"):
+            selected = mmr_select(np.asarray(vector, dtype=np.float32), vectors, self.k,
+                                  self.mmr_lambda, relevance)
+        return [docs[i] for i in selected]
+
+    def _retrieve(self, query: str) -> List[Document]:
+        vector = self.embed_query(query)
+        document_names = self.route(query)
+        if document_names:
+            candidates = self._candidates(query, vector, document_names)
+            if len(candidates[0]) >= self.k:
+                return self._select(vector, candidates)
+            telemetry.count("route_fallback")
+        return self._select(vector, self._candidates(query, vector))
+
+    def _match_heading(self, query: str) -> Optional[Any]:
+        if self.heading_index is None:
+            return None
+        with telemetry.span("heading_lookup"):
+            match = self.heading_index.match(query)
+        result = "miss" if match is None else "shortcut" if match.complete else "inject"
+        telemetry.count("heading_lookup", result=result)
+        return match
+
+    def _expand(self, docs: List[Document]) -> List[Document]:
+        if self.page_store is None:
+            return docs
+        return self.page_store.expand(docs, self.parent_mode, self.parent_max_chars, self.parent_window_chars)
+
+    def _search(self, query: str) -> List[Document]:
+        return self._expand(self._search_chunks(query))
+
+    def _search_chunks(self, query: str) -> List[Document]:
+        injected = self.monster_index.documents_for(query) if self.monster_index is not None else []
+        heading = self._match_heading(query)
+        docs: List[Document] = []
+        if heading is not None and heading.complete:
+            # La consulta solo nombra secciones conocidas: sin embedding ni búsqueda vectorial
+            docs = self._stored_documents(heading.chunk_ids[:self.k])
+        if not docs:
+            docs = self._retrieve(query)
+            if heading is not None:
+                # Las secciones nombradas encabezan los resultados sin desplazarlos del todo
+                sections = self._stored_documents(heading.chunk_ids[:max(1, self.k // 2)])
+                keys = {_chunk_key(doc) for doc in sections}
+                docs = sections + [doc for doc in docs if _chunk_key(doc) not in keys]
+        if not injected:
+            return docs[:self.k]
+
+        # El bloque estructurado sustituye a los chunks de su misma página (las tablas no tienen página)
+        pages = {(doc.metadata.get("document_name"), doc.metadata.get("page_number"))
+                 for doc in injected if doc.metadata.get("chunk_id", "").startswith("statblock:")}
+        docs = [doc for doc in docs
+                if (doc.metadata.get("document_name"), doc.metadata.get("page_number")) not in pages]
+        # Con k == 1 el bloque estructurado ocupa el único hueco
+        injected = injected[:max(1, self.k - 1)] if docs else injected[:self.k]
+        return injected + docs[:self.k - len(injected)]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with telemetry.span("retrieval", retriever=type(self).__name__):
+            if self.query_cache is None:
+                return self._search(query)
+            return self.query_cache.get_or_search(query, self.k, self._search, extra_key=type(self).__name__)
+
+# -------------------------------------------------------------------------#
+# 3. RECUPERADOR HÍBRIDO
+# -------------------------------------------------------------------------#
+
+class HybridRetriever(VectorRetriever):
+    """
+    Combina búsqueda vectorial y léxica mediante Reciprocal Rank Fusion.
+
+    Cada fuente aporta `fetch_k` candidatos; la fusión devuelve los `k` mejores.
+    Los términos exactos (conjuros, estados, monstruos) que la búsqueda
+    densa clasifica mal suben gracias al ranking BM25. Con MMR, la relevancia
+    de cada candidato es su puntuación RRF normalizada.
+    """
+
+    lexical_index: Any
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _stored_documents(self, chunk_ids: List[str]) -> List[Document]:
+        # El índice léxico guarda texto y metadatos: lectura por clave en SQLite
+        return self.lexical_index.get_documents(chunk_ids)
+
+    def _vectors_for(self, pool: List[Tuple[Document, float]],
+                     known: Dict[str, np.ndarray]) -> Tuple[List[Tuple[Document, float]], Optional[np.ndarray]]:
+        """
+        Vectores de los candidatos; los que solo vienen del índice léxico se leen del backend.
+
+        Los candidatos sin vector almacenado (p. ej. borrados del backend vectorial
+        mientras el índice léxico aún los tiene) se descartan.
+        """
+        missing = [_chunk_key(doc) for doc, _ in pool if _chunk_key(doc) not in known]
+        if missing:
+            known.update(self._stored_vectors(missing))
+        stored = [(doc, score) for doc, score in pool if _chunk_key(doc) in known]
+        if len(stored) < len(pool):
+            telemetry.count("hybrid_missing_vector")
+        if not stored:
+            return stored, None
+        return stored, np.stack([known[_chunk_key(doc)] for doc, _ in stored])
+
+    def _candidates(self, query: str, vector: List[float],
+                    document_names: Optional[List[str]] = None) -> Candidates:
+        # Para la fusión basta con que el filtro deje `k` candidatos vectoriales
+        vector_docs, vectors = self._vector_search(vector, self.fetch_k, document_names,
+                                                   min_results=self.k, with_vectors=self.use_mmr)
+        lexical_docs = [doc for doc, _ in self.lexical_index.search(query, self.fetch_k, document_names)]
+
+        with telemetry.span("rank_fusion"):
+            fused = reciprocal_rank_fusion([vector_docs, lexical_docs], rrf_k=self.rrf_k)
+
+        if not self.use_mmr:
+            return [doc for doc, _ in fused[:self.k]], None, None
+
+        known = {_chunk_key(doc): vec for doc, vec in zip(vector_docs, vectors)}
+        pool, pool_vectors = self._vectors_for(fused[:max(self.k, self.mmr_fetch_k)], known)
+        docs = [doc for doc, _ in pool]
+        if not docs:
+            return docs, None, None
+        scores = np.array([score for _, score in pool], dtype=np.float32)
+        return docs, pool_vectors, scores / scores.max()
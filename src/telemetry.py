@@ -0,0 +1,340 @@
+# -------------------------------------------------------------------------#
+# TELEMETRY - Instrumentación ligera: spans, contadores e histogramas
+# -------------------------------------------------------------------------#
+
+"""
+Instrumentación integrada del pipeline de D&D 5E (sin servicios externos)
+
+Funcionalidades principales:
+• Spans de tiempo con `span(...)`: alimentan el histograma `dnd_span_seconds`
+• Contadores con etiquetas (`count(...)`)
+• Trazas por consulta con desglose de etapas, también entre hilos
+• Exportación en formato de texto de Prometheus o en JSON lines
+"""
+
+import json
+import time
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
+
+from config import TELEMETRY_ENABLED, TELEMETRY_TRACE_LOG
+
+# Límites de los buckets del histograma (segundos): de 1 ms a 2 min
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRIC_PREFIX = "dnd"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+# -------------------------------------------------------------------------#
+# 1. REGISTRO DE MÉTRICAS
+# -------------------------------------------------------------------------#
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[int]:
+        result, running = [], 0
+        for c in self.counts:
+            running += c
+            result.append(running)
+        return result
+
+class MetricsRegistry:
+    """Contadores e histogramas de duración del proceso, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._spans: Dict[Labels, _Histogram] = {}
+
+    def count(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, span_name: str, seconds: float, **labels: Any) -> None:
+        key = _labels({"span": span_name, **labels})
+        with self._lock:
+            histogram = self._spans.get(key)
+            if histogram is None:
+                histogram = self._spans[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia de todas las métricas: contadores y resumen de cada span."""
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "spans": [
+                    {
+                        "labels": dict(labels),
+                        "count": h.count,
+                        "sum": h.total,
+                        "buckets": dict(zip(map(str, BUCKETS), h.cumulative()))
+                    }
+                    for labels, h in sorted(self._spans.items())
+                ]
+            }
+
+    # --- Exportación ---
+
+    def to_prometheus(self) -> str:
+        """Métricas en el formato de texto de Prometheus (exposition format 0.0.4)."""
+        def fmt(labels: Labels, extra: str = "") -> str:
+            parts = [f'{key}="{value}"' for key, value in labels]
+            if extra:
+                parts.append(extra)
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            spans = sorted((labels, h.count, h.total, h.cumulative()) for labels, h in self._spans.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{fmt(labels)} {value:g}")
+
+        metric = f"{METRIC_PREFIX}_span_seconds"
+        if spans:
+            lines.append(f"# HELP {metric} Duración de las etapas instrumentadas")
+            lines.append(f"# TYPE {metric} histogram")
+        for labels, count, total, cumulative in spans:
+            for bound, value in zip(BUCKETS, cumulative):
+                le = 'le="%s"' % bound
+                lines.append(f"{metric}_bucket{fmt(labels, le)} {value}")
+            le = 'le="+Inf"'
+            lines.append(f"{metric}_bucket{fmt(labels, le)} {count}")
+            lines.append(f"{metric}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{fmt(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self) -> str:
+        """Métricas como JSON lines: una línea por contador o span."""
+        snapshot = self.snapshot()
+        timestamp = time.time()
+        lines = [
+            json.dumps({"type": "counter", "ts": timestamp, **counter}, ensure_ascii=False)
+            for counter in snapshot["counters"]
+        ]
+        lines.extend(
+            json.dumps({"type": "histogram", "ts": timestamp, **span}, ensure_ascii=False)
+            for span in snapshot["spans"]
+        )
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Resumen por span (número, total y media), ordenado por tiempo total."""
+        rows = [
+            {
+                "span": span["labels"].get("span"),
+                "labels": {k: v for k, v in span["labels"].items() if k != "span"},
+                "count": span["count"],
+                "seconds": span["sum"],
+                "mean_ms": span["sum"] / span["count"] * 1000 if span["count"] else 0.0
+            }
+            for span in self.snapshot()["spans"]
+        ]
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
+
+metrics = MetricsRegistry()
+
+def write_metrics(path: Path) -> None:
+    """
+    Escribe las métricas del proceso en disco.
+
+    Args:
+        path: Destino; `.jsonl` exporta JSON lines (añadiendo al final) y
+              cualquier otra extensión, texto de Prometheus
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".jsonl":
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(metrics.to_jsonl())
+    else:
+        path.write_text(metrics.to_prometheus(), encoding="utf-8")
+
+# -------------------------------------------------------------------------#
+# 2. TRAZAS POR CONSULTA
+# -------------------------------------------------------------------------#
+
+class Trace:
+    """Spans registrados durante una consulta, con su desglose por etapa."""
+
+    def __init__(self, name: str, **attributes: Any):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.total: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, span_name: str, start: float, seconds: float, labels: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append({
+                "span": span_name,
+                "offset": start - self.start,
+                "seconds": seconds,
+                **({"labels": labels} if labels else {})
+            })
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Tiempo por etapa (sumando repeticiones), en orden de aparición."""
+        rows: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["offset"])
+        for s in spans:
+            name = s["span"]
+            if s.get("labels"):
+                name += f" ({', '.join(map(str, s['labels'].values()))})"
+            row = rows.setdefault(name, {"span": name, "count": 0, "seconds": 0.0})
+            row["count"] += 1
+            row["seconds"] += s["seconds"]
+        return list(rows.values())
+
+    def finish(self) -> None:
+        """Cierra la traza y la añade al registro JSONL si está configurado."""
+        if self.total is not None:
+            return
+        self.total = time.perf_counter() - self.start
+        if TELEMETRY_TRACE_LOG:
+            path = Path(TELEMETRY_TRACE_LOG)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_dict(), ensure_ascii=False) + "\n")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["offset"])
+        return {"name": self.name, "ts": time.time(), "total": self.total,
+                **self.attributes, "spans": spans}
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("dnd_trace", default=None)
+
+@contextmanager
+def query_trace(name: str, **attributes: Any) -> Iterator[Trace]:
+    """Activa una traza: los spans de este contexto (y de `propagate`) se añaden a ella."""
+    current = Trace(name, **attributes)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def propagate(fn: Callable) -> Callable:
+    """Envuelve `fn` para que se ejecute con la traza activa (p. ej. en un ThreadPoolExecutor)."""
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+# -------------------------------------------------------------------------#
+# 3. API DE INSTRUMENTACIÓN
+# -------------------------------------------------------------------------#
+
+@contextmanager
+def span(name: str, trace: Optional[Trace] = None, **labels: Any) -> Iterator[None]:
+    """
+    Mide la duración de un bloque.
+
+    Args:
+        name: Nombre de la etapa (etiqueta `span` del histograma)
+        trace: Traza destino (por defecto, la activa en el contexto)
+        **labels: Etiquetas adicionales de la métrica
+    """
+    if not TELEMETRY_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, trace, _start=start, **labels)
+
+def timed(name: str, **labels: Any) -> Callable:
+    """Decorador: mide cada llamada a la función como un span."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe(name: str, seconds: float, trace: Optional[Trace] = None,
+            _start: Optional[float] = None, **labels: Any) -> None:
+    """Registra una duración medida fuera de `span` (p. ej. en otro proceso)."""
+    if not TELEMETRY_ENABLED:
+        return
+    metrics.observe(name, seconds, **labels)
+    target = trace or _current_trace.get()
+    if target is not None:
+        start = _start if _start is not None else time.perf_counter() - seconds
+        target.add(name, start, seconds, labels)
+
+def count(name: str, value: float = 1, **labels: Any) -> None:
+    """Incrementa un contador (exportado como `dnd_<name>_total`)."""
+    if TELEMETRY_ENABLED:
+        metrics.count(name, value, **labels)
+
+def traced_stream(name: str, token_stream: Iterator[str], trace: Optional[Trace] = None,
+                  **labels: Any) -> Iterator[str]:
+    """
+    Reenvía un stream registrando el span completo y el tiempo hasta el primer token.
+
+    La traza se captura al crear el stream, ya que puede consumirse más tarde
+    o desde otro hilo (p. ej. el de Streamlit).
+    """
+    trace = trace or _current_trace.get()
+
+    def stream() -> Iterator[str]:
+        start = time.perf_counter()
+        first = True
+        try:
+            for token in token_stream:
+                if first:
+                    observe(f"{name}_first_token", time.perf_counter() - start, trace, _start=start, **labels)
+                    first = False
+                yield token
+        finally:
+            observe(name, time.perf_counter() - start, trace, _start=start, **labels)
+    return stream()
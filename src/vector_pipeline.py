@@ -8,24 +8,62 @@ Pipeline de procesamiento de documentos Markdown para D&D 5E
 Funcionalidades principales:
 • Divide cada fichero por páginas marcadas con '---'
 • Dentro de cada página aplica (Headers ➜ Tokens) para producir chunks ≤ 800 tokens
-• Almacena metadatos: document_name, page_number, section_path
-• Gestiona actualizaciones incrementales basadas en hash MD5
+• Splitter de tamaño fijo o definido por el contenido (CDC) para las secciones largas
+• Reparte el parseo por rangos de páginas en un pool de procesos
+• Almacena metadatos: document_name, page_number, section_path, chunk_id
+• Ingesta en streaming con memoria acotada (lectura ➜ chunks ➜ embeddings ➜ escritura)
+• Genera embeddings por lotes con concurrencia acotada (cliente HTTP compartido con el LLM)
+• Reutiliza embeddings ya calculados mediante una caché en disco
+• Detecta cambios con un manifiesto por ruta relativa (tamaño, mtime y hash MD5 solo si cambian)
+• Sincroniza a nivel de chunk con IDs deterministas (añadir/borrar/mantener)
+• Mantiene un índice léxico BM25 sincronizado para la búsqueda híbrida
+• Construye el vocabulario de encabezados del enrutador de consultas por libro
+• Extrae los bloques de estadísticas de monstruos a una tabla consultable
+• Construye el índice de encabezados ➜ chunk IDs para el atajo por sección
+• Guarda las páginas completas en un almacén mmap para la recuperación padre-hijo
+• Exporta opcionalmente un índice vectorial mmap cuantizado (arranque sin abrir Chroma)
+• Incrementa una generación de índice en cada cambio (invalida cachés de consulta)
+• Vigila opcionalmente DATA_DIR: re-ingesta incremental y cambio atómico del retriever
 """
 
+from __future__ import annotations
+
 import os
 import re
 import json
+import time
+import uuid
 import hashlib
+import threading
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Optional, Any
-from tqdm import tqdm
+from typing import List, Dict, Optional, Any, Tuple, Iterable, Iterator, Callable, TYPE_CHECKING
+
+# Importaciones de LangChain: solo las ligeras a nivel de módulo. Los splitters,
+# Chroma, el cliente de Ollama y los retrievers se importan al usarse, para que
+# importar este módulo (p. ej. `setup_db.py stats`) sea rápido.
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
-# Importaciones de LangChain
-from langchain.schema import Document
-from langchain.text_splitter import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
+from cdc_chunker import ContentDefinedSplitter
+from embedding_cache import EmbeddingCache, CachedEmbeddings, get_embedding_cache_stats
+from lexical_index import LexicalIndex
+from query_cache import QueryCache
+import heading_index
+import mmap_index
+import monster_index
+import ollama_client
+import page_store
+import query_router
+import telemetry
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
 
 # Importación de configuración interna
 from config import (
@@ -35,7 +73,50 @@ from config import (
     STORAGE_DIR,
     EMBEDDINGS_MODEL,
     CHUNK_SIZE,
-    CHUNK_OVERLAP
+    CHUNK_OVERLAP,
+    CHUNKER,
+    CDC_CHUNK_SIZE,
+    PARSE_WORKERS,
+    PARSE_PAGES_PER_TASK,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    INGEST_MAX_PENDING_BATCHES,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_PATH,
+    EMBED_CACHE_MAX_MB,
+    LEXICAL_INDEX_PATH,
+    LEXICAL_SNAPSHOT_DIR,
+    HYBRID_SEARCH,
+    HYBRID_FETCH_K,
+    RRF_K,
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    MMR_FETCH_K,
+    QUERY_CACHE_ENABLED,
+    QUERY_EMBED_CACHE_SIZE,
+    QUERY_RESULTS_CACHE_SIZE,
+    INDEX_META_PATH,
+    QUERY_ROUTING,
+    ROUTER_MIN_SCORE,
+    ROUTER_MIN_CONFIDENCE,
+    ROUTER_OVERFETCH,
+    ROUTER_VOCAB_PATH,
+    MONSTER_INDEX,
+    MONSTER_LIST_MAX,
+    MONSTER_INDEX_PATH,
+    HEADING_INDEX,
+    HEADING_INDEX_PATH,
+    WATCH_DATA_DIR,
+    WATCH_INTERVAL,
+    WATCH_DEBOUNCE,
+    PARENT_MODE,
+    PARENT_MAX_CHARS,
+    PARENT_WINDOW_CHARS,
+    PAGE_STORE_PATH,
+    VECTOR_BACKEND,
+    MMAP_INDEX_DTYPE,
+    MMAP_RESCORE_FACTOR,
+    MMAP_INDEX_DIR
 )
 
 # -------------------------------------------------------------------------#
@@ -43,14 +124,33 @@ from config import (
 # -------------------------------------------------------------------------#
 
 # Archivos y directorios
+MANIFEST_PATH = DB_DIR / "manifest.json"
+MANIFEST_VERSION = 2
+# Log anterior (claves por nombre base, solo hash); se migra al cargar el manifiesto
 PROCESSED_LOG = DB_DIR / "processed_files.json"
 
+# Bloque de lectura del hash en streaming
+HASH_BLOCK_SIZE = 1024 * 1024
+
 # Expresión regular para separar páginas lógicas
 PAGE_RE = re.compile(r"(?<=\n)---+\n")
 
 # Instancia global de embeddings (inicializada bajo demanda)
-_embeddings: Optional[OllamaEmbeddings] = None
+_embeddings: Optional[Embeddings] = None
+_lexical_index: Optional[LexicalIndex] = None
 _retriever: Optional[Any] = None
+_watcher: Optional[Any] = None
+# Protege la creación y el cambio de `_retriever` (solo se retiene brevemente al recargar)
+_retriever_lock = threading.Lock()
+# Serializa las recargas del vigilante (re-ingesta incluida)
+_reload_lock = threading.Lock()
+_watcher_lock = threading.Lock()
+
+# Generación del índice leída de disco: (mtime_ns, generación)
+_generation_cache: Tuple[int, int] = (-1, 0)
+
+# Hashes calculados en este proceso: (ruta, tamaño, mtime_ns) ➜ hash
+_hash_cache: Dict[Tuple[str, int, int], str] = {}
 
 # -------------------------------------------------------------------------#
 # 2. UTILIDADES DE ARCHIVOS Y HASH
@@ -58,7 +158,10 @@ _retriever: Optional[Any] = None
 
 def normalize_filename(path: str | bytes) -> str:
     """
-    Normaliza el nombre de archivo para usar como clave única.
+    Normaliza el nombre base de un archivo (claves del log anterior y nombres de libro).
+    
+    Los documentos se identifican por `manifest_key`: dos archivos con el
+    mismo nombre en carpetas distintas son documentos distintos.
     
     Args:
         path: Ruta del archivo (str o bytes)
@@ -70,9 +173,38 @@ def normalize_filename(path: str | bytes) -> str:
         path = path.decode("utf-8", "ignore")
     return os.path.basename(path).replace("\\", "/").split("/")[-1].strip()
 
+def manifest_key(file_path: str) -> str:
+    """
+    Identidad de un archivo: ruta relativa a DATA_DIR con '/'.
+    
+    Es la clave del manifiesto y el `document_name` de sus chunks (para los
+    archivos en la raíz de DATA_DIR coincide con el nombre base). Los
+    archivos fuera de DATA_DIR usan su ruta absoluta.
+    """
+    path = os.path.abspath(file_path)
+    try:
+        relative = os.path.relpath(path, DATA_DIR)
+    except ValueError:  # otra unidad en Windows
+        relative = os.pardir
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        relative = path
+    return relative.replace(os.sep, "/")
+
+def file_state(file_path: str) -> Optional[Dict[str, int]]:
+    """Tamaño y mtime (ns) de un archivo, o None si no se puede leer."""
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        print(f"Error leyendo {file_path}: {e}")
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
 def calculate_file_hash(file_path: str) -> Optional[str]:
     """
-    Calcula el hash MD5 de un archivo.
+    Calcula el hash MD5 de un archivo leyéndolo por bloques.
+    
+    El resultado se recuerda por (ruta, tamaño, mtime), así que cada
+    archivo se lee como mucho una vez por proceso mientras no cambie.
     
     Args:
         file_path: Ruta del archivo
@@ -80,12 +212,22 @@ def calculate_file_hash(file_path: str) -> Optional[str]:
     Returns:
         Hash MD5 del archivo o None si hay error
     """
+    state = file_state(file_path)
+    if state is None:
+        return None
+    key = (os.path.abspath(file_path), state["size"], state["mtime_ns"])
+    if key in _hash_cache:
+        return _hash_cache[key]
     try:
-        with open(file_path, "rb") as f:
-            return hashlib.md5(f.read()).hexdigest()
+        digest = hashlib.md5()
+        with telemetry.span("file_hash"), open(file_path, "rb") as f:
+            for block in iter(partial(f.read, HASH_BLOCK_SIZE), b""):
+                digest.update(block)
     except Exception as e:
         print(f"Error calculando hash para {file_path}: {e}")
         return None
+    _hash_cache[key] = digest.hexdigest()
+    return _hash_cache[key]
 
 def list_markdown_files(root_dir: str) -> List[str]:
     """
@@ -104,132 +246,355 @@ def list_markdown_files(root_dir: str) -> List[str]:
                 markdown_files.append(os.path.normpath(os.path.join(root, file)))
     return markdown_files
 
+def make_chunk_id(doc_name: str, page_number: int, section_path: str,
+                  content: str, occurrence: int = 0) -> str:
+    """
+    Genera un ID determinista para un chunk.
+    
+    El ID depende del documento, la página, la ruta de secciones y el hash
+    del contenido, de modo que un chunk sin cambios conserva su ID entre
+    ejecuciones. `occurrence` distingue chunks idénticos en la misma sección.
+    
+    Args:
+        doc_name: Nombre del documento
+        page_number: Número de página lógica
+        section_path: Jerarquía de encabezados del chunk
+        content: Texto del chunk
+        occurrence: Índice de repetición de un chunk idéntico
+        
+    Returns:
+        ID hexadecimal estable del chunk
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    raw = "\x1f".join([doc_name, str(page_number), section_path, content_hash, str(occurrence)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
 # -------------------------------------------------------------------------#
 # 3. GESTIÓN DE LOG DE PROCESAMIENTO
 # -------------------------------------------------------------------------#
 
+def _migrate_processing_log(legacy: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte el log anterior (nombre base ➜ hash) al manifiesto v2.
+    
+    Solo se conservan las entradas de los archivos en la raíz de DATA_DIR,
+    cuyo `document_name` no cambia; los de subcarpetas se re-ingieren con su
+    ruta relativa como identidad. Sin tamaño ni mtime, las entradas se
+    verifican por hash la primera vez que se comprueban.
+    """
+    files = {}
+    for file_path in list_markdown_files(str(DATA_DIR)):
+        if manifest_key(file_path) != normalize_filename(file_path):
+            continue
+        entry = legacy.get(normalize_filename(file_path))
+        if isinstance(entry, dict) and entry.get("hash"):
+            files[manifest_key(file_path)] = {"hash": entry["hash"], "processed": entry.get("processed", "")}
+    print(f"🔄 Log de procesamiento migrado al manifiesto v{MANIFEST_VERSION}: {len(files)} archivos")
+    return {"version": MANIFEST_VERSION, "files": files}
+
 def load_processing_log() -> Dict[str, Any]:
     """
-    Carga el log de archivos procesados desde disco.
+    Carga el manifiesto de archivos procesados desde disco.
+    
+    Si solo existe el log anterior (`processed_files.json`), se migra.
     
     Returns:
-        Diccionario con información de archivos procesados
+        Manifiesto {"version", "files": ruta relativa ➜ size, mtime_ns, hash, processed, chunk_ids}
     """
-    if PROCESSED_LOG.exists():
+    for path in (MANIFEST_PATH, PROCESSED_LOG):
+        if not path.exists():
+            continue
         try:
-            with open(PROCESSED_LOG, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
         except (json.JSONDecodeError, IOError) as e:
             print(f"Error cargando log de procesamiento: {e}")
-            return {}
-    return {}
+            continue
+        if path == PROCESSED_LOG:
+            return _migrate_processing_log(data)
+        if data.get("version") == MANIFEST_VERSION:
+            return data
+    return {"version": MANIFEST_VERSION, "files": {}}
 
 def save_processing_log(log_data: Dict[str, Any]) -> None:
     """
-    Guarda el log de archivos procesados a disco.
+    Guarda el manifiesto de forma atómica (fichero temporal + rename).
     
     Args:
-        log_data: Datos del log a guardar
+        log_data: Manifiesto a guardar
     """
     try:
         # Crear directorio si no existe
         DB_DIR.mkdir(parents=True, exist_ok=True)
         
-        with open(PROCESSED_LOG, "w", encoding="utf-8") as f:
+        tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(log_data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, MANIFEST_PATH)
     except IOError as e:
         print(f"Error guardando log de procesamiento: {e}")
 
-def update_processing_log(processed_log: Dict[str, Any], file_paths: List[str]) -> None:
+def update_processing_log(processed_log: Dict[str, Any], file_paths: List[str],
+                          chunk_ids: Optional[Dict[str, List[str]]] = None,
+                          before: Optional[Dict[str, Any]] = None) -> None:
     """
-    Actualiza el log con los archivos recién procesados.
+    Actualiza el manifiesto con los archivos recién procesados.
     
     Args:
-        processed_log: Log actual de archivos procesados
+        processed_log: Manifiesto actual (un diccionario vacío empieza uno nuevo)
         file_paths: Lista de rutas de archivos procesados
+        chunk_ids: IDs de chunk generados por documento (`manifest_key`, de `ingest_files`)
+        before: Estado (`file_state`) de cada archivo antes de ingerirlo; los que
+                cambiaron durante la ingesta no se registran y se procesan en la
+                siguiente actualización
     """
+    processed_log["version"] = MANIFEST_VERSION
+    files = processed_log.setdefault("files", {})
     for file_path in file_paths:
+        state = file_state(file_path)
+        if before is not None and before.get(file_path) != state:
+            print(f"⚠️  {manifest_key(file_path)} cambió durante la ingesta; se procesará de nuevo")
+            continue
         file_hash = calculate_file_hash(file_path)
-        if file_hash:
-            key = normalize_filename(file_path)
-            processed_log[key] = {
+        if state and file_hash:
+            files[manifest_key(file_path)] = {
+                **state,
                 "hash": file_hash,
-                "processed": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                "processed": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "chunk_ids": sorted((chunk_ids or {}).get(manifest_key(file_path), []))
             }
     save_processing_log(processed_log)
 
 def identify_new_files(all_files: List[str], processed_log: Dict[str, Any]) -> List[str]:
     """
-    Identifica archivos nuevos o modificados comparando con el log.
+    Identifica archivos nuevos o modificados comparando con el manifiesto.
+    
+    Los archivos con el mismo tamaño y mtime que en el manifiesto no se
+    leen. Si cambia el mtime pero no el contenido (p. ej. tras un checkout),
+    se actualiza su entrada y se guarda el manifiesto para no volver a
+    calcular el hash en el siguiente arranque.
     
     Args:
         all_files: Lista de todos los archivos encontrados
-        processed_log: Log de archivos ya procesados
+        processed_log: Manifiesto de archivos ya procesados
         
     Returns:
         Lista de archivos que necesitan procesamiento
     """
+    files = processed_log.setdefault("files", {})
     new_files = []
+    refreshed = False
     
     for file_path in all_files:
+        state = file_state(file_path)
+        if state is None:
+            continue
+        entry = files.get(manifest_key(file_path))
+        
+        # Mismo tamaño y mtime: sin cambios, sin leer el archivo
+        if entry and all(entry.get(field) == value for field, value in state.items()):
+            telemetry.count("manifest_check", result="stat")
+            continue
+        
         current_hash = calculate_file_hash(file_path)
         if not current_hash:
             continue
-            
-        file_key = normalize_filename(file_path)
         
-        # Archivo es nuevo o ha cambiado
-        if (file_key not in processed_log or 
-            processed_log[file_key]["hash"] != current_hash):
+        if entry and entry.get("hash") == current_hash:
+            telemetry.count("manifest_check", result="hash")
+            entry.update(state)
+            refreshed = True
+        else:
+            # Archivo nuevo o con contenido distinto
+            telemetry.count("manifest_check", result="changed")
             new_files.append(file_path)
     
+    if refreshed:
+        save_processing_log(processed_log)
     return new_files
 
-# -------------------------------------------------------------------------#
-# 4. PROCESAMIENTO DE DOCUMENTOS MARKDOWN
-# -------------------------------------------------------------------------#
+def identify_removed_files(processed_log: Dict[str, Any]) -> List[str]:
+    """
+    Identifica las entradas del manifiesto cuyo archivo ya no existe (borrado o renombrado).
+    
+    Args:
+        processed_log: Manifiesto de archivos ya procesados
+        
+    Returns:
+        Claves (`manifest_key`) de los archivos desaparecidos
+    """
+    # Las claves son relativas a DATA_DIR o absolutas (archivos de fuera)
+    return [key for key in processed_log.get("files", {}) if not (DATA_DIR / key).is_file()]
 
-def split_markdown_document(md_text: str, doc_name: str) -> List[Document]:
+def list_indexed_files() -> List[str]:
     """
-    Divide un documento Markdown en chunks procesables.
+    Lista los archivos Markdown indexados: los de DATA_DIR y los añadidos
+    desde fuera con `setup_db.py add` (claves absolutas del manifiesto).
     
-    Proceso:
-    1. Divide por páginas lógicas (separadas por '---')
-    2. Dentro de cada página, divide por headers
-    3. Si los chunks son muy grandes, divide por tamaño
-    4. Añade metadatos completos incluyendo jerarquía de secciones
+    Returns:
+        Rutas de los archivos que existen
+    """
+    files = list_markdown_files(str(DATA_DIR))
+    for key in load_processing_log().get("files", {}):
+        if os.path.isabs(key) and os.path.isfile(key):
+            files.append(key)
+    return files
+
+def load_index_meta() -> Dict[str, Any]:
+    """
+    Carga los metadatos del índice (generación, última actualización).
+    
+    Returns:
+        Diccionario de metadatos o vacío si no existe
+    """
+    try:
+        with open(INDEX_META_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_index_meta(meta: Dict[str, Any]) -> None:
+    """
+    Guarda los metadatos del índice de forma atómica (fichero temporal + rename).
     
     Args:
-        md_text: Contenido completo del archivo Markdown
-        doc_name: Nombre del documento para metadatos
+        meta: Metadatos a guardar
+    """
+    INDEX_META_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = INDEX_META_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, INDEX_META_PATH)
+
+def get_index_generation() -> int:
+    """
+    Obtiene la generación actual del índice.
+    
+    Solo relee el fichero cuando cambia su mtime, así que es lo bastante
+    barato para comprobarse en cada consulta (también detecta cambios
+    hechos por otro proceso, p. ej. `setup_db.py`).
+    
+    Returns:
+        Número de generación (0 si nunca se ha construido el índice)
+    """
+    global _generation_cache
+    try:
+        mtime = INDEX_META_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+    if mtime != _generation_cache[0]:
+        _generation_cache = (mtime, int(load_index_meta().get("generation", 0)))
+    return _generation_cache[1]
+
+def bump_index_generation() -> int:
+    """
+    Incrementa la generación del índice tras cualquier cambio en los chunks.
+    
+    Returns:
+        Nueva generación
+    """
+    meta = load_index_meta()
+    meta["generation"] = int(meta.get("generation", 0)) + 1
+    meta["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    save_index_meta(meta)
+    return meta["generation"]
+
+def _directory_size(path: Path) -> int:
+    """Tamaño total en bytes de los ficheros bajo `path`."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def write_index_stats(vector_store: Chroma) -> Dict[str, Any]:
+    """
+    Calcula las estadísticas del índice y las guarda en los metadatos.
+    
+    Se llama al construir o actualizar la base de datos, de modo que
+    `get_database_stats` solo tiene que leer un JSON pequeño.
+    
+    Args:
+        vector_store: Base de datos vectorial recién actualizada
         
     Returns:
-        Lista de documentos procesados con metadatos
+        Estadísticas guardadas
     """
-    # Dividir por páginas lógicas
-    pages = PAGE_RE.split(md_text)
-    print(f"📄 Documento: {doc_name} - Páginas lógicas: {len(pages)}")
+    processed_files = load_processing_log()["files"]
+    stats = {
+        "document_count": vector_store._collection.count(),
+        "processed_files": len(processed_files),
+        "last_update": max(
+            [info.get("processed", "") for info in processed_files.values()],
+            default="never"
+        ),
+        "size_bytes": _directory_size(DB_DIR),
+        "embeddings_model": EMBEDDINGS_MODEL
+    }
+    meta = load_index_meta()
+    meta["stats"] = stats
+    save_index_meta(meta)
+    return stats
+
+# -------------------------------------------------------------------------#
+# 4. PROCESAMIENTO DE DOCUMENTOS MARKDOWN
+# -------------------------------------------------------------------------#
+
+def _build_splitters(chunker: Optional[str] = None):
+    """Crea los splitters de encabezados y de tamaño usados en cada página (`chunker`: por defecto CHUNKER)."""
+    # Los marcadores van sin espacio: el splitter comprueba el espacio por su cuenta.
+    # Se conservan las líneas de encabezado en el texto (nombres de monstruos, conjuros...)
+    from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
     
-    # Configurar splitters
     header_splitter = MarkdownHeaderTextSplitter(
         headers_to_split_on=[
-            ("# ", "H1"),
-            ("## ", "H2"), 
-            ("### ", "H3"),
-            ("#### ", "H4")
-        ]
+            ("#", "H1"),
+            ("##", "H2"), 
+            ("###", "H3"),
+            ("####", "H4")
+        ],
+        strip_headers=False
     )
     
-    token_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", " "],
-        length_function=len
-    )
+    if (chunker or CHUNKER) == "cdc":
+        # Las secciones de hasta 2 × CHUNK_SIZE no se dividen, igual que con el splitter recursivo
+        token_splitter = ContentDefinedSplitter(CDC_CHUNK_SIZE, max_size=CHUNK_SIZE * 2)
+    else:
+        token_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", " "],
+            length_function=len
+        )
+    
+    return header_splitter, token_splitter
+
+def split_markdown_pages(pages: List[str], doc_name: str, first_page: int = 1,
+                         chunker: Optional[str] = None) -> List[Document]:
+    """
+    Divide un rango de páginas lógicas en chunks con metadatos.
+    
+    Cada página se procesa de forma independiente, así que un documento puede
+    repartirse en rangos de páginas sin alterar el resultado ni los IDs.
+    
+    Args:
+        pages: Textos de las páginas del rango
+        doc_name: Nombre del documento para metadatos
+        first_page: Número de página lógica de la primera página del rango
+        chunker: "recursive" o "cdc" (por defecto: CHUNKER)
+        
+    Returns:
+        Lista de chunks del rango, en orden
+    """
+    header_splitter, token_splitter = _build_splitters(chunker)
     
     chunks = []
+    occurrences: Counter = Counter()
     
-    for page_idx, page_content in enumerate(pages):
+    for page_number, page_content in enumerate(pages, first_page):
         if not page_content.strip():
             continue
             
@@ -253,44 +618,158 @@ def split_markdown_document(md_text: str, doc_name: str) -> List[Document]:
                     if chunk_doc.metadata.get(header)
                 ])
                 
+                # ID estable: chunks idénticos en la misma sección se numeran
+                id_key = (page_number, section_path, chunk_doc.page_content)
+                chunk_id = make_chunk_id(doc_name, page_number, section_path,
+                                         chunk_doc.page_content, occurrences[id_key])
+                occurrences[id_key] += 1
+                
                 # Actualizar metadatos
+                chunk_doc.id = chunk_id
                 chunk_doc.metadata.update({
                     "document_name": doc_name,
-                    "page_number": page_idx + 1,
+                    "page_number": page_number,
                     "section_path": section_path,
-                    "chunk_size": len(chunk_doc.page_content)
+                    "chunk_size": len(chunk_doc.page_content),
+                    "chunk_id": chunk_id
                 })
                 
                 chunks.append(chunk_doc)
     
+    return chunks
+
+def _split_page_range(task: Tuple[str, List[str], int]) -> Tuple[List[Document], float]:
+    """
+    Punto de entrada de los procesos del pool: divide un rango de páginas.
+    
+    Devuelve también la duración, que se registra en el proceso principal
+    (la telemetría de los procesos del pool no se recoge).
+    """
+    doc_name, pages, first_page = task
+    start = time.perf_counter()
+    chunks = split_markdown_pages(pages, doc_name, first_page)
+    return chunks, time.perf_counter() - start
+
+def split_markdown_document(md_text: str, doc_name: str) -> List[Document]:
+    """
+    Divide un documento Markdown en chunks procesables.
+    
+    Proceso:
+    1. Divide por páginas lógicas (separadas por '---')
+    2. Dentro de cada página, divide por headers
+    3. Si los chunks son muy grandes, divide por tamaño
+    4. Añade metadatos completos incluyendo jerarquía de secciones
+    
+    Args:
+        md_text: Contenido completo del archivo Markdown
+        doc_name: Nombre del documento para metadatos
+        
+    Returns:
+        Lista de documentos procesados con metadatos
+    """
+    # Dividir por páginas lógicas
+    pages = PAGE_RE.split(md_text)
+    print(f"📄 Documento: {doc_name} - Páginas lógicas: {len(pages)}")
+    
+    chunks = split_markdown_pages(pages, doc_name)
+    
     print(f"📑 Generados {len(chunks)} chunks para {doc_name}")
     return chunks
 
-def process_markdown_files(file_paths: List[str]) -> List[Document]:
+def iter_page_ranges(file_paths: List[str]) -> Iterator[Tuple[str, List[str], int]]:
+    """
+    Lee los archivos de uno en uno y produce rangos de páginas a dividir.
+    
+    Solo el archivo en curso se mantiene en memoria.
+    
+    Args:
+        file_paths: Lista de rutas de archivos a procesar
+        
+    Yields:
+        Tuplas (document_name, páginas del rango, primera página)
+    """
+    for file_path in file_paths:
+        doc_name = manifest_key(file_path)
+        try:
+            with telemetry.span("parse"), open(file_path, "r", encoding="utf-8") as f:
+                pages = PAGE_RE.split(f.read())
+        except Exception as e:
+            print(f"❌ Error procesando {doc_name}: {e}")
+            continue
+        
+        print(f"📄 Documento: {doc_name} - Páginas lógicas: {len(pages)}")
+        for start in range(0, len(pages), PARSE_PAGES_PER_TASK):
+            yield doc_name, pages[start:start + PARSE_PAGES_PER_TASK], start + 1
+
+def _bounded_map(executor: Executor, fn: Callable, items: Iterable, max_pending: int) -> Iterator:
+    """
+    Aplica `fn` en el executor manteniendo como máximo `max_pending` tareas en vuelo.
+    
+    Los resultados se devuelven en el orden de entrada y la entrada solo se
+    consume cuando hay hueco, lo que aplica contrapresión a la etapa anterior.
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_document_chunks(file_paths: List[str], workers: Optional[int] = None) -> Iterator[Document]:
+    """
+    Genera los chunks de varios archivos en streaming y en orden determinista.
+    
+    Con más de un worker, los rangos de PARSE_PAGES_PER_TASK páginas se
+    reparten en un pool de procesos con un número acotado de tareas en vuelo.
+    Los procesos se crean con "spawn": la ingestión puede lanzarse desde el
+    hilo del vigilante dentro de la app o la API, y hacer fork de un proceso
+    con varios hilos puede heredar locks tomados y bloquear a los hijos.
+    
+    Args:
+        file_paths: Lista de rutas de archivos a procesar
+        workers: Procesos del pool (por defecto PARSE_WORKERS; 1 = secuencial)
+        
+    Yields:
+        Chunks en orden (archivo, página)
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    ranges = iter_page_ranges(file_paths)
+    
+    if workers <= 1:
+        for chunks, seconds in map(_split_page_range, ranges):
+            telemetry.observe("split", seconds)
+            yield from chunks
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for chunks, seconds in _bounded_map(executor, _split_page_range, ranges, max_pending=workers * 2):
+            telemetry.observe("split", seconds)
+            yield from chunks
+
+def process_markdown_files(file_paths: List[str], workers: Optional[int] = None) -> List[Document]:
     """
     Procesa múltiples archivos Markdown y devuelve todos los chunks.
     
+    Materializa `iter_document_chunks`; la ingestión usa el generador
+    directamente para no mantener todo el corpus en memoria.
+    
     Args:
         file_paths: Lista de rutas de archivos a procesar
+        workers: Procesos del pool (por defecto PARSE_WORKERS; 1 = secuencial)
         
     Returns:
         Lista de todos los documentos procesados
     """
-    all_documents = []
+    from tqdm import tqdm
     
     print(f"🔄 Procesando {len(file_paths)} archivos Markdown...")
     
-    for file_path in tqdm(file_paths, desc="📖 Parseando archivos"):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                
-            doc_name = normalize_filename(file_path)
-            chunks = split_markdown_document(content, doc_name)
-            all_documents.extend(chunks)
-            
-        except Exception as e:
-            print(f"❌ Error procesando {normalize_filename(file_path)}: {e}")
+    all_documents = list(tqdm(
+        iter_document_chunks(file_paths, workers),
+        desc="📖 Parseando archivos",
+        unit="chunk"
+    ))
     
     print(f"✅ Total de chunks generados: {len(all_documents)}")
     return all_documents
@@ -299,39 +778,278 @@ def process_markdown_files(file_paths: List[str]) -> List[Document]:
 # 5. GESTIÓN DE EMBEDDINGS Y BASE DE DATOS VECTORIAL
 # -------------------------------------------------------------------------#
 
-def get_embeddings() -> OllamaEmbeddings:
+def get_embeddings(warm_up: bool = False) -> Embeddings:
     """
     Obtiene la instancia de embeddings (singleton pattern).
     
+    Si la caché está habilitada, el modelo de Ollama queda detrás de una
+    caché en disco para que los chunks sin cambios no se vuelvan a calcular.
+    
+    Args:
+        warm_up: Carga el modelo en Ollama ahora (al arrancar) y no en la primera consulta
+    
     Returns:
-        Instancia de OllamaEmbeddings configurada
+        Instancia de embeddings configurada
     """
     global _embeddings
     if _embeddings is None:
         print(f"🤖 Inicializando modelo de embeddings: {EMBEDDINGS_MODEL}")
-        _embeddings = OllamaEmbeddings(model=EMBEDDINGS_MODEL)
+        from langchain_ollama import OllamaEmbeddings
+        _embeddings = ollama_client.attach_client(
+            OllamaEmbeddings(model=EMBEDDINGS_MODEL, keep_alive=ollama_client.KEEP_ALIVE)
+        )
+        
+        if EMBED_CACHE_ENABLED:
+            cache = EmbeddingCache(
+                EMBED_CACHE_PATH,
+                EMBEDDINGS_MODEL,
+                max_bytes=EMBED_CACHE_MAX_MB * 1024 * 1024
+            )
+            _embeddings = CachedEmbeddings(_embeddings, cache)
+    
+    if warm_up:
+        ollama_client.warm_up(EMBEDDINGS_MODEL, ollama_client.KIND_EMBEDDINGS)
     return _embeddings
 
-def create_vector_database(documents: List[Document]) -> Chroma:
+def _embed_batch(embeddings: Embeddings, batch: List[Document]) -> Tuple[List[Document], List[List[float]]]:
+    """Calcula los embeddings de un lote de documentos."""
+    with telemetry.span("embed"):
+        vectors = embeddings.embed_documents([doc.page_content for doc in batch])
+    telemetry.count("chunks_embedded", len(batch))
+    return batch, vectors
+
+def iter_batches(items: Iterable[Document], batch_size: int) -> Iterator[List[Document]]:
+    """Agrupa un iterable en listas de tamaño fijo (la última puede ser menor)."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def embed_and_store(
+    vector_store: Chroma,
+    documents: Iterable[Document],
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    on_batch: Optional[Callable[[List[Document]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Genera embeddings por lotes en paralelo y los escribe en la base de datos.
+    
+    Los documentos se consumen en streaming: como mucho `max_pending` lotes
+    están en memoria a la vez (contrapresión sobre el parseo), y se envían a
+    un pool de hilos para mantener ocupado el backend de embeddings. Las
+    escrituras en Chroma se hacen desde el hilo principal, en orden.
+    
+    Args:
+        vector_store: Base de datos vectorial de destino
+        documents: Documentos a indexar (lista o generador)
+        batch_size: Tamaño de lote (por defecto EMBED_BATCH_SIZE)
+        workers: Lotes concurrentes (por defecto EMBED_WORKERS)
+        max_pending: Lotes en vuelo (por defecto INGEST_MAX_PENDING_BATCHES)
+        on_batch: Función llamada con cada lote ya escrito en Chroma
+        
+    Returns:
+        Diccionario con chunks indexados, lotes, segundos y chunks/s
+    """
+    batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+    workers = max(1, workers or EMBED_WORKERS)
+    max_pending = max(workers, max_pending or INGEST_MAX_PENDING_BATCHES)
+    total = len(documents) if isinstance(documents, list) else None
+    
+    from tqdm import tqdm
+    
+    embeddings = get_embeddings()
+    start = time.perf_counter()
+    chunk_count = 0
+    batch_count = 0
+    
+    print(f"🧠 Generando embeddings: lotes de {batch_size}, {workers} en paralelo, "
+          f"máx. {max_pending} lotes en memoria")
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            tqdm(total=total, desc="🧠 Embeddings", unit="chunk") as progress:
+        embed = partial(_embed_batch, embeddings)
+        for batch, vectors in _bounded_map(executor, embed, iter_batches(documents, batch_size), max_pending):
+            with telemetry.span("vector_write"):
+                vector_store._collection.upsert(
+                    ids=[doc.metadata.get("chunk_id") or str(uuid.uuid4()) for doc in batch],
+                    embeddings=vectors,
+                    metadatas=[doc.metadata for doc in batch],
+                    documents=[doc.page_content for doc in batch]
+                )
+            if on_batch is not None:
+                on_batch(batch)
+            chunk_count += len(batch)
+            batch_count += 1
+            progress.update(len(batch))
+    
+    elapsed = time.perf_counter() - start
+    throughput = chunk_count / elapsed if elapsed > 0 else 0.0
+    if chunk_count:
+        print(f"⚡ {chunk_count} chunks indexados en {elapsed:.1f}s ({throughput:.1f} chunks/s)")
+    
+    return {
+        "chunks": chunk_count,
+        "batches": batch_count,
+        "seconds": elapsed,
+        "chunks_per_second": throughput
+    }
+
+def get_document_chunk_ids(vector_store: Chroma, doc_name: str) -> List[str]:
+    """
+    Obtiene los IDs de chunk almacenados para un documento.
+    
+    Args:
+        vector_store: Base de datos vectorial
+        doc_name: Nombre del documento (metadato document_name)
+        
+    Returns:
+        Lista de IDs presentes en la colección
+    """
+    result = vector_store._collection.get(where={"document_name": doc_name}, include=[])
+    return result["ids"]
+
+def delete_chunks(vector_store: Chroma, chunk_ids: List[str], batch_size: int = 500) -> None:
+    """
+    Elimina chunks del índice léxico y de la colección por lotes.
+    
+    Primero el índice léxico: así nunca devuelve un chunk que ya no tiene vector.
+    """
+    lexical_index = get_lexical_index()
+    for i in range(0, len(chunk_ids), batch_size):
+        lexical_index.delete(chunk_ids[i:i + batch_size])
+        with telemetry.span("vector_delete"):
+            vector_store._collection.delete(ids=chunk_ids[i:i + batch_size])
+
+def remove_documents(vector_store: Chroma, processed_log: Dict[str, Any], keys: List[str]) -> int:
+    """
+    Elimina los chunks de documentos cuyo archivo ha desaparecido y los quita del manifiesto.
+    
+    Se borran los IDs registrados en el manifiesto y los que queden en la
+    colección con ese `document_name` (entradas migradas sin `chunk_ids`).
+    
+    Args:
+        vector_store: Base de datos vectorial
+        processed_log: Manifiesto actual (se guarda al terminar)
+        keys: Claves de los archivos desaparecidos (de `identify_removed_files`)
+        
+    Returns:
+        Número de chunks eliminados
+    """
+    files = processed_log.setdefault("files", {})
+    removed = 0
+    for key in keys:
+        chunk_ids = sorted(set(files.get(key, {}).get("chunk_ids", []))
+                           | set(get_document_chunk_ids(vector_store, key)))
+        if chunk_ids:
+            delete_chunks(vector_store, chunk_ids)
+        files.pop(key, None)
+        removed += len(chunk_ids)
+        print(f"🗑️  {key}: -{len(chunk_ids)} (archivo eliminado)")
+    
+    if removed:
+        bump_index_generation()
+    save_processing_log(processed_log)
+    return removed
+
+def sync_document_chunks(vector_store: Chroma, documents: Iterable[Document]) -> Dict[str, Any]:
+    """
+    Sincroniza los chunks de cada documento con los almacenados en la colección.
+    
+    Para cada document_name compara el conjunto de IDs nuevo con el existente:
+    inserta (y embebe) solo los chunks nuevos, deja intactos los que no han
+    cambiado y, al terminar, borra los que ya no existen. Los documentos se
+    consumen en streaming; solo se guardan en memoria los conjuntos de IDs.
+    
+    Args:
+        vector_store: Base de datos vectorial
+        documents: Chunks recién generados (lista o generador)
+        
+    Returns:
+        Diccionario con el número de chunks añadidos, eliminados y sin cambios,
+        y los IDs actuales de cada documento ("chunk_ids")
+    """
+    existing_ids: Dict[str, set] = {}
+    seen_ids: Dict[str, set] = {}
+    added: Counter = Counter()
+    
+    def new_chunks() -> Iterator[Document]:
+        for doc in documents:
+            doc_name = doc.metadata["document_name"]
+            if doc_name not in existing_ids:
+                existing_ids[doc_name] = set(get_document_chunk_ids(vector_store, doc_name))
+                seen_ids[doc_name] = set()
+            
+            chunk_id = doc.metadata["chunk_id"]
+            seen_ids[doc_name].add(chunk_id)
+            if chunk_id not in existing_ids[doc_name]:
+                added[doc_name] += 1
+                yield doc
+    
+    embed_and_store(vector_store, new_chunks(), on_batch=get_lexical_index().upsert)
+    
+    counts: Dict[str, Any] = {"added": 0, "removed": 0, "unchanged": 0, "chunk_ids": {}}
+    for doc_name, new_ids in seen_ids.items():
+        counts["chunk_ids"][doc_name] = sorted(new_ids)
+        stale_ids = sorted(existing_ids[doc_name] - new_ids)
+        if stale_ids:
+            delete_chunks(vector_store, stale_ids)
+        unchanged = len(new_ids & existing_ids[doc_name])
+        
+        print(f"🔁 {doc_name}: +{added[doc_name]} / -{len(stale_ids)} / ={unchanged}")
+        counts["added"] += added[doc_name]
+        counts["removed"] += len(stale_ids)
+        counts["unchanged"] += unchanged
+    
+    if counts["added"] or counts["removed"]:
+        bump_index_generation()
+    
+    return counts
+
+def ingest_files(vector_store: Chroma, file_paths: List[str]) -> Dict[str, Any]:
+    """
+    Ingesta en streaming: lectura ➜ páginas ➜ chunks ➜ embeddings ➜ escritura.
+    
+    Cada etapa consume de la anterior bajo demanda, por lo que la memoria
+    se mantiene acotada independientemente del tamaño del corpus.
+    
+    Args:
+        vector_store: Base de datos vectorial de destino
+        file_paths: Archivos Markdown a ingerir
+        
+    Returns:
+        Diccionario con el número de chunks añadidos, eliminados y sin cambios,
+        y los IDs actuales de cada documento ("chunk_ids")
+    """
+    print(f"🔄 Procesando {len(file_paths)} archivos Markdown...")
+    # Los contadores "última ejecución" de la caché de embeddings son los de esta ingestión
+    embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.cache.reset_last_run()
+    return sync_document_chunks(vector_store, iter_document_chunks(file_paths))
+
+def create_vector_database(documents: Iterable[Document]) -> Chroma:
     """
     Crea una nueva base de datos vectorial a partir de documentos.
     
     Args:
-        documents: Lista de documentos a indexar
+        documents: Documentos a indexar (lista o generador)
         
     Returns:
         Instancia de Chroma configurada
     """
     print(f"🗄️ Creando base de datos vectorial en: {DB_DIR}")
     
+    from langchain_chroma import Chroma
+    
     embeddings = get_embeddings()
-    vector_store = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        persist_directory=str(DB_DIR)
+    vector_store = Chroma(
+        persist_directory=str(DB_DIR),
+        embedding_function=embeddings
     )
+    result = embed_and_store(vector_store, documents)
     
-    print(f"✅ Base de datos creada con {len(documents)} documentos")
+    print(f"✅ Base de datos creada con {result['chunks']} documentos")
     return vector_store
 
 def load_existing_database() -> Chroma:
@@ -343,6 +1061,8 @@ def load_existing_database() -> Chroma:
     """
     print(f"📂 Cargando base de datos existente desde: {DB_DIR}")
     
+    from langchain_chroma import Chroma
+    
     embeddings = get_embeddings()
     vector_store = Chroma(
         persist_directory=str(DB_DIR),
@@ -351,6 +1071,227 @@ def load_existing_database() -> Chroma:
     
     return vector_store
 
+def get_lexical_index() -> LexicalIndex:
+    """
+    Obtiene el índice léxico BM25 (singleton pattern).
+    
+    Returns:
+        Instancia de LexicalIndex abierta sobre LEXICAL_INDEX_PATH
+    """
+    global _lexical_index
+    if _lexical_index is None:
+        _lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+    return _lexical_index
+
+def snapshot_lexical_index(keep: int = 2) -> LexicalIndex:
+    """
+    Crea una copia fija del índice léxico para un retriever nuevo.
+    
+    Se conservan las `keep` copias más recientes: la del retriever que se
+    publica y la del anterior, que puede seguir atendiendo consultas.
+    
+    Args:
+        keep: Copias a conservar (incluida la nueva)
+        
+    Returns:
+        LexicalIndex abierto sobre la copia
+    """
+    path = LEXICAL_SNAPSHOT_DIR / f"{time.time_ns()}-g{get_index_generation()}.sqlite"
+    snapshot = get_lexical_index().snapshot(path)
+    
+    # El nombre empieza por time_ns: el orden alfabético es el de creación
+    names = sorted({old.name.split(".sqlite")[0] for old in LEXICAL_SNAPSHOT_DIR.iterdir()})
+    for name in names[:-keep]:
+        for old in LEXICAL_SNAPSHOT_DIR.glob(f"{name}.sqlite*"):
+            try:
+                old.unlink()
+            except OSError:
+                pass
+    return snapshot
+
+def sync_lexical_index(vector_store: Chroma, batch_size: int = 1000) -> None:
+    """
+    Reconstruye el índice léxico desde Chroma si no coinciden los conteos.
+    
+    Cubre bases de datos creadas antes de existir el índice léxico o
+    ingestiones interrumpidas a medias.
+    
+    Args:
+        vector_store: Base de datos vectorial de referencia
+        batch_size: Chunks leídos de Chroma por lote
+    """
+    lexical_index = get_lexical_index()
+    total = vector_store._collection.count()
+    if lexical_index.count() == total:
+        return
+    
+    print(f"🔤 Reconstruyendo índice léxico ({total} chunks)...")
+    lexical_index.clear()
+    for offset in range(0, total, batch_size):
+        result = vector_store._collection.get(
+            include=["documents", "metadatas"], limit=batch_size, offset=offset
+        )
+        lexical_index.upsert(
+            Document(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id})
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        )
+
+def iter_chunk_metadatas(vector_store: Chroma, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Recorre los metadatos de todos los chunks de la colección (con su `chunk_id`) por lotes."""
+    total = vector_store._collection.count()
+    for offset in range(0, total, batch_size):
+        result = vector_store._collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        yield from ({**(metadata or {}), "chunk_id": chunk_id}
+                    for chunk_id, metadata in zip(result["ids"], result["metadatas"]))
+
+def build_router_vocabulary(vector_store: Chroma) -> Dict[str, Any]:
+    """
+    Construye y guarda el vocabulario de encabezados del enrutador de consultas.
+    
+    Args:
+        vector_store: Base de datos vectorial de referencia
+        
+    Returns:
+        Vocabulario guardado en ROUTER_VOCAB_PATH
+    """
+    with telemetry.span("router_vocabulary"):
+        vocabulary = query_router.build_vocabulary(iter_chunk_metadatas(vector_store))
+        query_router.save_vocabulary(vocabulary, ROUTER_VOCAB_PATH)
+    print(f"🧭 Vocabulario del router: {len(vocabulary['headings'])} encabezados "
+          f"en {len(vocabulary['documents'])} documentos")
+    return vocabulary
+
+def build_heading_index(vector_store: Chroma) -> Dict[str, Any]:
+    """
+    Construye y guarda el índice de encabezados de sección ➜ chunk IDs.
+    
+    Args:
+        vector_store: Base de datos vectorial de referencia
+        
+    Returns:
+        Índice guardado en HEADING_INDEX_PATH
+    """
+    with telemetry.span("heading_index_build"):
+        table = heading_index.build_heading_table(iter_chunk_metadatas(vector_store))
+        heading_index.save_heading_table(table, HEADING_INDEX_PATH)
+    print(f"🔖 Índice de encabezados: {len(table['headings'])} secciones")
+    return table
+
+def iter_document_pages(file_paths: List[str]) -> Iterator[Tuple[str, List[str]]]:
+    """Lee los ficheros de uno en uno y produce (document_name, páginas lógicas)."""
+    for file_path in file_paths:
+        doc_name = manifest_key(file_path)
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                yield doc_name, PAGE_RE.split(f.read())
+        except Exception as e:
+            print(f"❌ Error leyendo {doc_name}: {e}")
+
+def build_page_store() -> Dict[str, Any]:
+    """
+    Guarda el texto completo de cada página lógica en el almacén de páginas.
+    
+    Returns:
+        Resumen (páginas y bytes) del almacén en PAGE_STORE_PATH
+    """
+    pages = (
+        (doc_name, page_number, text)
+        for doc_name, doc_pages in iter_document_pages(list_indexed_files())
+        for page_number, text in enumerate(doc_pages, 1)
+    )
+    with telemetry.span("page_store_build"):
+        summary = page_store.build_page_store(pages, PAGE_STORE_PATH)
+    print(f"📚 Almacén de páginas: {summary['pages']} páginas ({summary['bytes'] / 1024 ** 2:.1f} MB)")
+    return summary
+
+def build_monster_index() -> Dict[str, Any]:
+    """
+    Extrae los bloques de estadísticas de los ficheros Markdown y guarda la tabla de monstruos.
+    
+    El Monster Manual se procesa primero: si un monstruo aparece también en
+    otro libro, prevalece su bloque.
+    
+    Returns:
+        Tabla guardada en MONSTER_INDEX_PATH
+    """
+    file_paths = sorted(
+        list_indexed_files(),
+        key=lambda path: query_router.book_name(manifest_key(path)) != query_router.MONSTER_MANUAL
+    )
+    monsters: List[monster_index.Monster] = []
+    with telemetry.span("monster_index_build"):
+        for doc_name, pages in iter_document_pages(file_paths):
+            monsters.extend(monster_index.parse_stat_blocks(pages, doc_name))
+        table = monster_index.build_monster_table(monsters)
+        monster_index.save_monster_table(table, MONSTER_INDEX_PATH)
+    print(f"🐲 Índice de monstruos: {len(table['monsters'])} bloques de estadísticas")
+    return table
+
+def iter_vector_records(vector_store: Chroma, batch_size: int = 1000) -> Iterator[mmap_index.Record]:
+    """Recorre todos los chunks de la colección con su texto, metadatos y embedding."""
+    total = vector_store._collection.count()
+    for offset in range(0, total, batch_size):
+        result = vector_store._collection.get(
+            include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset
+        )
+        for chunk_id, text, metadata, embedding in zip(
+            result["ids"], result["documents"], result["metadatas"], result["embeddings"]
+        ):
+            yield chunk_id, text, {**(metadata or {}), "chunk_id": chunk_id}, list(embedding)
+
+def build_vector_index(vector_store: Chroma) -> Dict[str, Any]:
+    """
+    Exporta la colección de Chroma al índice vectorial mmap.
+    
+    Args:
+        vector_store: Base de datos vectorial de referencia
+        
+    Returns:
+        Manifiesto de la versión creada en MMAP_INDEX_DIR
+    """
+    with telemetry.span("mmap_index_build"):
+        manifest = mmap_index.build_mmap_index(
+            iter_vector_records(vector_store),
+            MMAP_INDEX_DIR,
+            dtype=MMAP_INDEX_DTYPE,
+            generation=get_index_generation(),
+            embeddings_model=EMBEDDINGS_MODEL
+        )
+    print(f"🧮 Índice mmap ({manifest['dtype']}): {manifest['count']} vectores de {manifest['dim']} dimensiones")
+    return manifest
+
+def mmap_index_is_current() -> bool:
+    """Indica si el índice mmap refleja la generación y el modelo de embeddings actuales."""
+    manifest = mmap_index.read_manifest(MMAP_INDEX_DIR)
+    return (
+        bool(manifest)
+        and manifest.get("generation") == get_index_generation()
+        and manifest.get("dtype") == MMAP_INDEX_DTYPE
+        and manifest.get("embeddings_model") == EMBEDDINGS_MODEL
+    )
+
+def build_index_artifacts(vector_store: Chroma, force: bool = True) -> None:
+    """
+    Regenera los artefactos derivados del índice tras una ingestión.
+    
+    Args:
+        vector_store: Base de datos vectorial recién actualizada
+        force: Si es False, solo se generan los artefactos que faltan
+               (p. ej. en bases de datos creadas con una versión anterior)
+    """
+    if force or "stats" not in load_index_meta():
+        write_index_stats(vector_store)
+    if QUERY_ROUTING and (force or not ROUTER_VOCAB_PATH.exists()):
+        build_router_vocabulary(vector_store)
+    if HEADING_INDEX and (force or not HEADING_INDEX_PATH.exists()):
+        build_heading_index(vector_store)
+    if MONSTER_INDEX and (force or not MONSTER_INDEX_PATH.exists()):
+        build_monster_index()
+    if PARENT_MODE != page_store.MODE_OFF and (force or not PAGE_STORE_PATH.exists()):
+        build_page_store()
+    if VECTOR_BACKEND == "mmap" and (force or not mmap_index_is_current()):
+        build_vector_index(vector_store)
+
 # -------------------------------------------------------------------------#
 # 6. PIPELINE PRINCIPAL
 # -------------------------------------------------------------------------#
@@ -362,7 +1303,7 @@ def init_or_update() -> Chroma:
     Flujo:
     1. Verifica si existe el directorio de datos
     2. Lista todos los archivos Markdown
-    3. Identifica archivos nuevos/modificados
+    3. Identifica archivos nuevos/modificados y eliminados
     4. Crea o actualiza la base de datos según sea necesario
     
     Returns:
@@ -387,43 +1328,81 @@ def init_or_update() -> Chroma:
     # Cargar log de procesamiento
     processed_log = load_processing_log()
     new_files = identify_new_files(all_files, processed_log)
+    removed_files = identify_removed_files(processed_log)
     
     # Decidir si crear nueva BD o actualizar existente
     db_exists = DB_DIR.exists() and any(DB_DIR.iterdir())
+    changed = not db_exists or bool(new_files) or bool(removed_files)
     
     if not db_exists:
         print("🆕 Creando nueva base de datos...")
-        documents = process_markdown_files(all_files)
+        print(f"🗄️ Creando base de datos vectorial en: {DB_DIR}")
+        vector_store = load_existing_database()
+        before = {path: file_state(path) for path in all_files}
+        counts = ingest_files(vector_store, all_files)
         
-        if not documents:
+        if not counts["added"] and not counts["unchanged"]:
             raise ValueError("No se pudieron procesar documentos")
             
-        vector_store = create_vector_database(documents)
-        update_processing_log({}, all_files)
+        update_processing_log({}, all_files, counts["chunk_ids"], before)
+        print(f"✅ Base de datos creada con {counts['added'] + counts['unchanged']} documentos")
         
     else:
         print("🔄 Cargando base de datos existente...")
         vector_store = load_existing_database()
         
+        if removed_files:
+            print(f"🗑️  Archivos eliminados o renombrados: {len(removed_files)}")
+            remove_documents(vector_store, processed_log, removed_files)
+        
         if new_files:
             print(f"📥 Archivos nuevos/actualizados: {len(new_files)}")
-            new_documents = process_markdown_files(new_files)
+            before = {path: file_state(path) for path in new_files}
+            counts = ingest_files(vector_store, new_files)
             
-            if new_documents:
-                print("➕ Añadiendo documentos a la base de datos...")
-                vector_store.add_documents(new_documents)
-                update_processing_log(processed_log, new_files)
-                print("✅ Base de datos actualizada")
+            if counts["added"] or counts["unchanged"]:
+                update_processing_log(processed_log, new_files, counts["chunk_ids"], before)
+                print(f"✅ Base de datos actualizada: {counts['added']} añadidos, "
+                      f"{counts['removed']} eliminados, {counts['unchanged']} sin cambios")
             else:
                 print("⚠️  No se generaron documentos nuevos")
-        else:
+        elif not removed_files:
             print("✅ Base de datos actualizada - sin cambios")
     
+    if HYBRID_SEARCH:
+        sync_lexical_index(vector_store)
+    
+    # Estadísticas y vocabulario del router (también para BDs creadas antes de existir)
+    build_index_artifacts(vector_store, force=changed)
+    
     return vector_store
 
-def get_retriever(k: int = 4):
+def can_skip_update() -> bool:
     """
-    Obtiene un retriever configurado (singleton pattern).
+    Indica si el índice en disco está al día y se puede abrir sin Chroma.
+    
+    Requiere que no haya ficheros nuevos, modificados o eliminados y que los artefactos
+    derivados (índice mmap, vocabulario del router, encabezados, monstruos, páginas) reflejen
+    la generación actual.
+    """
+    if not DATA_DIR.exists() or not mmap_index_is_current():
+        return False
+    if QUERY_ROUTING and not ROUTER_VOCAB_PATH.exists():
+        return False
+    if HEADING_INDEX and not HEADING_INDEX_PATH.exists():
+        return False
+    if MONSTER_INDEX and not MONSTER_INDEX_PATH.exists():
+        return False
+    if PARENT_MODE != page_store.MODE_OFF and not PAGE_STORE_PATH.exists():
+        return False
+    all_files = list_markdown_files(str(DATA_DIR))
+    processed_log = load_processing_log()
+    return (bool(all_files) and not identify_new_files(all_files, processed_log)
+            and not identify_removed_files(processed_log))
+
+def _build_retriever(k: int):
+    """
+    Actualiza la base de datos si hace falta y construye un retriever nuevo.
     
     Args:
         k: Número de documentos a recuperar por consulta
@@ -431,22 +1410,175 @@ def get_retriever(k: int = 4):
     Returns:
         Retriever configurado y listo para usar
     """
-    global _retriever
+    from retrievers import VectorRetriever, HybridRetriever
     
-    if _retriever is None:
-        print(f"🔧 Inicializando retriever (k={k})...")
+    print(f"🔧 Inicializando retriever (k={k})...")
+    if VECTOR_BACKEND == "mmap" and can_skip_update():
+        # Índice al día: se abre el mmap sin cargar Chroma
+        print("⚡ Índice mmap al día - sin abrir Chroma")
+    else:
         vector_store = init_or_update()
-        
         if vector_store is None:
             raise RuntimeError("No se pudo inicializar la base de datos vectorial")
-            
-        _retriever = vector_store.as_retriever(
-            search_kwargs={"k": k}
+    
+    # Con el vigilante, cada retriever se queda con la versión del índice mmap, del
+    # índice léxico y del almacén de páginas con la que se construyó; el siguiente
+    # abrirá la nueva
+    auto_reload = not WATCH_DATA_DIR
+    if VECTOR_BACKEND == "mmap":
+        vector_store = mmap_index.MmapVectorIndex(
+            MMAP_INDEX_DIR, embeddings=get_embeddings(), rescore_factor=MMAP_RESCORE_FACTOR,
+            auto_reload=auto_reload
+        )
+        
+    query_cache = None
+    if QUERY_CACHE_ENABLED:
+        query_cache = QueryCache(
+            embedding_size=QUERY_EMBED_CACHE_SIZE,
+            results_size=QUERY_RESULTS_CACHE_SIZE,
+            generation_fn=get_index_generation
+        )
+    
+    mmr = {"mmr_lambda": MMR_LAMBDA, "mmr_fetch_k": max(k, MMR_FETCH_K)} if MMR_ENABLED else {}
+    
+    router = None
+    if QUERY_ROUTING:
+        router = query_router.QueryRouter(
+            ROUTER_VOCAB_PATH,
+            min_score=ROUTER_MIN_SCORE,
+            min_confidence=ROUTER_MIN_CONFIDENCE
+        )
+    
+    monsters = None
+    if MONSTER_INDEX:
+        monsters = monster_index.MonsterIndex(MONSTER_INDEX_PATH, list_max=MONSTER_LIST_MAX)
+    headings = heading_index.HeadingIndex(HEADING_INDEX_PATH) if HEADING_INDEX else None
+    
+    parents = {}
+    if PARENT_MODE != page_store.MODE_OFF:
+        parents = {
+            "page_store": page_store.PageStore(PAGE_STORE_PATH, auto_reload=auto_reload),
+            "parent_mode": PARENT_MODE,
+            "parent_max_chars": PARENT_MAX_CHARS,
+            "parent_window_chars": PARENT_WINDOW_CHARS
+        }
+    
+    if HYBRID_SEARCH:
+        retriever = HybridRetriever(
+            vector_store=vector_store,
+            lexical_index=get_lexical_index() if auto_reload else snapshot_lexical_index(),
+            k=k,
+            fetch_k=max(k, HYBRID_FETCH_K),
+            rrf_k=RRF_K,
+            query_cache=query_cache,
+            router=router,
+            route_overfetch=ROUTER_OVERFETCH,
+            monster_index=monsters,
+            heading_index=headings,
+            **parents,
+            **mmr
+        )
+    else:
+        retriever = VectorRetriever(
+            vector_store=vector_store,
+            k=k,
+            query_cache=query_cache,
+            router=router,
+            route_overfetch=ROUTER_OVERFETCH,
+            monster_index=monsters,
+            heading_index=headings,
+            **parents,
+            **mmr
         )
-        print("✅ Retriever inicializado")
+    print("✅ Retriever inicializado")
+    return retriever
+
+
+def get_retriever(k: int = 4):
+    """
+    Obtiene un retriever configurado (singleton pattern).
+    
+    Con WATCH_DATA_DIR, al crearlo se arranca el vigilante de DATA_DIR, que
+    lo sustituye por uno nuevo tras cada re-ingesta (ver `reload_retriever`).
+    
+    Args:
+        k: Número de documentos a recuperar por consulta
+        
+    Returns:
+        Retriever configurado y listo para usar
+    """
+    global _retriever
+    
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = _build_retriever(k)
+        if WATCH_DATA_DIR:
+            start_watcher()
     
     return _retriever
 
+def reload_retriever() -> bool:
+    """
+    Re-ingiere los ficheros nuevos o modificados, elimina los chunks de los
+    borrados o renombrados y sustituye el retriever en uso.
+    
+    El retriever nuevo se construye aparte y se publica con una sola
+    asignación; las consultas que empiecen después usan el nuevo, sin pausas.
+    Las que ya estaban en curso terminan con el anterior, que sigue leyendo
+    las versiones del índice mmap, del índice léxico (una copia fija) y del
+    almacén de páginas con las que se construyó. Con VECTOR_BACKEND=chroma la
+    búsqueda vectorial sí usa la colección que se está actualizando; los
+    candidatos que pierden su vector se descartan. Las tablas de búsqueda
+    JSON se recargan al cambiar sus ficheros.
+    
+    Returns:
+        True si hubo cambios y se cambió el retriever
+    """
+    global _retriever
+    
+    with _reload_lock:
+        # Sin retriever no hay nada que sustituir: lo creará `get_retriever`
+        if _retriever is None or not DATA_DIR.exists():
+            return False
+        all_files = list_markdown_files(str(DATA_DIR))
+        processed_log = load_processing_log()
+        if not identify_new_files(all_files, processed_log) and not identify_removed_files(processed_log):
+            return False
+        
+        print("🔄 Cambios en los ficheros de datos: actualizando el índice en segundo plano...")
+        start = time.perf_counter()
+        with telemetry.span("index_reload"):
+            retriever = _build_retriever(getattr(_retriever, "k", 4))
+        with _retriever_lock:
+            _retriever = retriever
+    
+    telemetry.count("index_reload")
+    print(f"✅ Retriever recargado en {time.perf_counter() - start:.1f}s (generación {get_index_generation()})")
+    return True
+
+def start_watcher():
+    """
+    Arranca (una sola vez por proceso) el vigilante de DATA_DIR.
+    
+    Returns:
+        DirectoryWatcher en ejecución
+    """
+    global _watcher
+    
+    with _watcher_lock:
+        if _watcher is None:
+            from file_watcher import DirectoryWatcher
+            
+            _watcher = DirectoryWatcher(
+                lambda: list_markdown_files(str(DATA_DIR)),
+                reload_retriever,
+                interval=WATCH_INTERVAL,
+                debounce=WATCH_DEBOUNCE
+            ).start()
+            print(f"👀 Vigilando {DATA_DIR} (cada {WATCH_INTERVAL:g}s, espera {WATCH_DEBOUNCE:g}s)")
+    return _watcher
+
 # -------------------------------------------------------------------------#
 # 7. FUNCIONES DE UTILIDAD PÚBLICA
 # -------------------------------------------------------------------------#
@@ -455,31 +1587,30 @@ def get_database_stats() -> Dict[str, Any]:
     """
     Obtiene estadísticas de la base de datos vectorial.
     
+    Lee las estadísticas guardadas al construir el índice (`write_index_stats`):
+    no abre Chroma ni crea el cliente de embeddings.
+    
     Returns:
         Diccionario con estadísticas de la base de datos
     """
+    cache_stats = get_embedding_cache_stats(EMBED_CACHE_PATH)
     if not DB_DIR.exists():
-        return {"status": "no_database", "document_count": 0}
-    
-    try:
-        vector_store = load_existing_database()
-        # Intentar obtener el conteo (esto puede variar según la versión de Chroma)
-        collection = vector_store._collection
-        count = collection.count()
-        
-        processed_log = load_processing_log()
-        
         return {
-            "status": "active",
-            "document_count": count,
-            "processed_files": len(processed_log),
-            "last_update": max(
-                [info.get("processed", "") for info in processed_log.values()],
-                default="never"
-            )
+            "status": "no_database",
+            "document_count": 0,
+            "embedding_cache": cache_stats
         }
-    except Exception as e:
-        return {"status": "error", "error": str(e)}
+    
+    meta = load_index_meta()
+    if not meta.get("stats"):
+        return {"status": "no_stats", "embedding_cache": cache_stats}
+    
+    return {
+        "status": "active",
+        **meta["stats"],
+        "generation": meta.get("generation", 0),
+        "embedding_cache": cache_stats
+    }
 
 def reset_database() -> bool:
     """
@@ -488,14 +1619,24 @@ def reset_database() -> bool:
     Returns:
         True si se reseteo correctamente, False en caso contrario
     """
+    global _retriever, _lexical_index
     try:
+        # Cerrar el índice léxico antes de borrar sus ficheros
+        if _lexical_index is not None:
+            _lexical_index.close()
+            _lexical_index = None
+        
         if DB_DIR.exists():
             import shutil
             shutil.rmtree(DB_DIR)
             print("🗑️  Base de datos eliminada")
+            # Invalidar cachés de consulta de otros procesos
+            bump_index_generation()
+            meta = load_index_meta()
+            meta.pop("stats", None)
+            save_index_meta(meta)
         
         # Resetear singleton
-        global _retriever
         _retriever = None
         
         return True